@@ -4,10 +4,18 @@
 # Streamlit code for the pytock project.
 #
 
+import datetime
 import streamlit as st
 import exceptions
 import validators
+import pytock_clock
+import pytock_data
+import pytock_search
 import restaurant
+import status_view
+
+PREVIEW_TABLES = 12                                         # free tables named in the preview
+MAX_GUESTS = 100                                            # largest party at joined tables
 
 
 #
@@ -38,8 +46,7 @@ def clearErrors():
 #
 tables = restaurant.Tables()
 bookings = restaurant.Bookings()
-status = bookings.tableStatus()
-if len(status) > 0:
+if bookings.byId:
     st.session_state["advertised"] = True                   # clear advertisement on first remote booking
 
 # advertise our real-time updating until first user input or remote booking seen
@@ -64,7 +71,74 @@ with col_right:
     defperiod = restaurant.Booking.defBookingPeriod()
     book_period = st.time_input("Period", key="book_period", value=defperiod, step=900, on_change=clearErrors)
 
-book_tablename = st.selectbox("Select table", tables.namelist(), key="book_tablename", on_change=clearErrors)
+# a party too large for one table is given joined tables, chosen on Submit
+
+col_join, col_guests = st.columns(2)
+with col_join:
+    book_join = st.checkbox("Large party at joined tables", key="book_join", on_change=clearErrors)
+with col_guests:
+    book_guests = st.number_input("Guests", min_value=2, max_value=MAX_GUESTS, value=restaurant.Table.MAX_SEATS + 1,
+                                  key="book_guests", disabled=not book_join, on_change=clearErrors)
+
+book_tablename = st.selectbox("Select table", tables.namelist(), key="book_tablename", disabled=book_join,
+                              on_change=clearErrors)
+
+# a standing booking is stored as one weekly rule starting today
+
+col_repeat, col_until = st.columns(2)
+with col_repeat:
+    book_repeat = st.checkbox("Repeat weekly", key="book_repeat", on_change=clearErrors)
+with col_until:
+    book_until = st.date_input("Until", key="book_until", value=None, min_value=pytock_clock.today(),
+                               disabled=not book_repeat, on_change=clearErrors)
+
+#
+# availability preview
+#
+# Shown as the inputs change, from free-table and customer sets that are built
+# once per data version (see restaurant.Availability), so that each rerun is a
+# lookup rather than a scan of the bookings. Submit still checks exactly, and
+# also against later weeks for a recurring booking.
+#
+# Once a name or phone is entered the chosen table and time are held for this
+# session (see restaurant.Holds), renewed on each rerun, so that another host
+# cannot book them before Submit. Tables held by others are not shown as free.
+#
+
+if book_from and book_period and len(tables.tables) > 0:
+    availability = bookings.availability()
+    holds = restaurant.Holds.venueHolds()
+    session = pytock_data.session()
+    held = holds.heldTables(book_from, book_period, session)
+    free = [tablename for tablename in availability.freeTables(book_from, book_period) if tablename not in held]
+    until = (datetime.datetime.combine(pytock_clock.today(), book_from)
+             + datetime.timedelta(hours=book_period.hour, minutes=book_period.minute)).strftime("%H:%M")
+    if free:
+        shown = ", ".join(free[:PREVIEW_TABLES]) + (f" and {len(free) - PREVIEW_TABLES} more" if len(free) > PREVIEW_TABLES else "")
+        st.caption(f"Free {book_from.strftime('%H:%M')} - {until}: {shown}")
+    else:
+        st.caption(f"No tables free {book_from.strftime('%H:%M')} - {until}")
+    if book_join:
+        joined = availability.combination(book_guests, book_from, book_period, held)
+        if joined:
+            seats = sum(tables.findTable(tablename).seats for tablename in joined)
+            st.caption(f"Tables for {book_guests}: {' + '.join(joined)} ({seats} seats)")
+        else:
+            st.warning(f"No joinable tables free for {book_guests} guests", icon=":material/event_busy:")
+    elif book_tablename in held:
+        st.warning(f"{book_tablename} is being booked by another host", icon=":material/lock_clock:")
+    elif book_tablename and book_tablename not in free:
+        st.warning(f"{book_tablename} is taken during that time", icon=":material/event_busy:")
+    if not book_join and book_tablename in free and (book_name.strip() or book_phone.strip()):
+        if not holds.take(session, book_tablename, book_name, book_phone, book_from, book_period):
+            st.warning(f"{book_tablename} has just been taken for booking by another host", icon=":material/lock_clock:")
+    else:
+        holds.release(session)
+    name_error, preview_name = validators.validate_name(book_name)
+    phone_error, preview_phone = validators.validate_phone(book_phone)
+    if not name_error and not phone_error \
+            and availability.customerBusy(preview_name, preview_phone, book_from, book_period):
+        st.warning("Customer is already booked during that time", icon=":material/person_alert:")
 
 #
 # validate and make booking
@@ -124,19 +198,52 @@ if submitted:
         book_tablename = text
 
     if len(errors) == 0:                                    # we proceed on no errors
-        booking = restaurant.Booking(book_tablename, book_name, book_phone, book_from, book_period)
         try:
-            bookings.add(booking)
+            if book_join and book_repeat:
+                errors.append("Joined tables cannot repeat weekly")
+            elif book_join:
+                bookings.addJoined(book_name, book_phone, book_from, book_period, book_guests)
+            elif book_repeat:
+                bookings.addRule(restaurant.RecurringRule(book_tablename, book_name, book_phone, book_from,
+                                                          book_period, until=book_until))
+            else:
+                bookings.add(restaurant.Booking(book_tablename, book_name, book_phone, book_from, book_period))
         except exceptions.TableBusyError:
             errors.append("Table not available during that time")
         except exceptions.DuplicateBookingError:
             errors.append("Customer is already booked during that time")
+        except exceptions.InvalidInputError:
+            errors.append("That time has already passed today")
 
     # save and report any errors in UI
     st.session_state["booking_errors"] = errors
     for error in errors:
         st.error(error)
 
+#
+# Find booking
+#
+# Looks the customer up in the venue's search index (see pytock_search.py), so
+# a misspelt name or a phone in any format still finds the booking without a
+# scan of the bookings.
+#
+
+book_find = st.text_input("Find booking", key="book_find", placeholder="name and/or phone, e.g. jon smth 4567")
+if book_find.strip():
+    found = pytock_search.index().search(book_find)
+    if not found:
+        st.caption("No matching bookings")
+    for score, item in found:
+        col_table, col_found = st.columns([0.3, 0.7])
+        with col_table:
+            when = "weekly" if isinstance(item, restaurant.RecurringRule) else item.start.date().isoformat()
+            st.markdown(f"{item.tablename}  \n*{when}*")
+        with col_found:
+            if isinstance(item, restaurant.RecurringRule):
+                st.markdown(restaurant.RecurringBooking(item, item.first).description())
+            else:
+                st.markdown(item.description())
+
 #
 # Table status
 #
@@ -144,26 +251,37 @@ if submitted:
 # for each table. In a real system one might prefer to show strictly in time
 # order, however the assignment examples had table first so we use that here.
 #
+# Large floors are filtered and paged, so only the visible tables are rendered,
+# and those only when they changed (see restaurant.Fragments).
+#
 
 if len(tables.tables) == 0:
     st.markdown(f"No tables defined. Please add some on **Table Management** page.")
 else:
-    for table in tables.tables:
+    statusFilter = status_view.filter_controls("book")
+    page, pageSize = status_view.page_controls("book")
+    rows, total = bookings.statusPage(tables, statusFilter, page, pageSize)
+    for table, tableText, tableBookings in rows:
         col_table, col_state = st.columns([0.3, 0.7])
         with col_table:
-            st.markdown(table.description())                # e.g. "Table 1 - 4 seats"
+            st.markdown(tableText)                          # e.g. "Table 1 - 4 seats"
         with col_state:
             col_time, col_delete = st.columns([0.8, 0.2])
-            if not table.name in status:
+            if not tableBookings:
                 with col_time:
                     st.markdown("*Free*")                   # "Free" in italics
             else:
-                for booking in status[table.name]:
+                for booking, bookingText in tableBookings:
                     with col_time:
-                        st.markdown(booking.description())  # time / period and name / phone
+                        st.markdown(bookingText)            # time / period and name / phone
                     with col_delete:
-                        # The following delete button uses a custom keyString
-                        # because streamlit requires that all buttons have a
-                        # unique identifier in the session state.
-                        if st.button("Delete", key=booking.keyString()):
+                        # The following delete button is keyed by the booking
+                        # id because streamlit requires that all buttons have
+                        # a unique identifier in the session state. Deleting
+                        # a recurring booking cancels only today's occurrence.
+                        if st.button("Delete", key=f"delete_{booking.id}"):
                             bookings.delete(booking)
+                        if isinstance(booking, restaurant.RecurringBooking):
+                            if st.button("End series", key=f"endrule_{booking.ruleId}"):
+                                bookings.deleteRule(booking.ruleId)
+    status_view.page_navigation("book", total)
@@ -93,6 +93,21 @@ with col4:
         toast("The Table is Deleted")
         tables.deleteTable(st.session_state["man_tablename"])
 
+# tables that can be put together with the selected one for a large party,
+# unless it was just deleted
+
+selected = tables.findTable(st.session_state["man_tablename"]) if tables.tables else None
+if selected is not None:
+    others = [tablename for tablename in tables.namelist() if tablename != selected.name]
+    joins_key = f"joins_{selected.name}"                    # reset when another table is selected
+
+    def setJoinable(tablename: str = selected.name, key: str = joins_key):
+        clearErrors()
+        tables.setJoinable(tablename, st.session_state[key])
+
+    st.multiselect("Can be joined with", others, default=sorted(tables.joins(selected.name)),
+                   key=joins_key, on_change=setJoinable)
+
 #
 # input fields for adding tables
 #
@@ -137,3 +152,66 @@ if added:
     st.session_state["tables_errors"] = errors
     for error in errors:
         st.error(error)
+
+#
+# Waitlist
+#
+# A walk-in party that finds no free table joins the waitlist. It is seated at
+# once if a table that fits is free, and otherwise as soon as one comes free
+# (see restaurant.Waitlist), which shows here and on the status page.
+#
+
+st.markdown("-----")
+st.markdown("#### Waitlist")
+
+col_party, col_size, col_priority = st.columns([0.5, 0.25, 0.25])
+with col_party:
+    party_name = st.text_input("Party name", key="wait_name", on_change=clearErrors)
+with col_size:
+    party_size = st.number_input("Guests", min_value=1, max_value=restaurant.Table.MAX_SEATS, value=2,
+                                 key="wait_size", on_change=clearErrors)
+with col_priority:
+    party_priority = st.checkbox("Priority", key="wait_priority", on_change=clearErrors)
+
+if st.button("Seat or add to waitlist"):
+    errors = []
+
+    # name check
+    error, text = validators.validate_name(party_name)
+    if error:
+        errors.append(error)
+    else:
+        party_name = text
+
+    # size check
+    error, size = validators.validate_seats(party_size)
+    if error:
+        errors.append(error)
+    else:
+        party_size = size
+
+    if len(errors) == 0:                                    # we proceed on no errors
+        try:
+            seated = bookings.joinWaitlist(restaurant.Party(party_name, party_size, 1 if party_priority else 0))
+            toast(f"Seated at {seated.tablename}" if seated else "Added to the waitlist")
+        except exceptions.InvalidInputError:
+            errors.append(f"No table seats a party of {party_size}")
+
+    # save and report any errors
+    st.session_state["tables_errors"] = errors
+    for error in errors:
+        st.error(error)
+
+waiting = bookings.waiting
+if not waiting:
+    st.markdown("*No parties waiting*")
+for party in waiting:
+    col_waiting, col_remove = st.columns([0.8, 0.2])
+    with col_waiting:
+        st.markdown(party.description())
+    with col_remove:
+        # keyed by party id, as streamlit buttons need unique identifiers
+        if st.button("Remove", key=f"leave_{party.id}"):
+            bookings.leaveWaitlist(party.id)
+for party in bookings.seatedParties:
+    st.caption(party.description())
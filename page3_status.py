@@ -4,8 +4,11 @@
 # Streamlit code for the pytock project.
 #
 
+import altair as alt
+import pandas as pd
 import streamlit as st
 import restaurant
+import status_view
 
 
 #
@@ -31,6 +34,23 @@ st.markdown("""
             -----
             """.format(totalTables-usedTables, totalTables, totalSeats-usedSeats, totalSeats))
 
+#
+# Waitlist
+#
+# Parties waiting for a table, managed on the Table Management page, and those
+# recently seated from the waitlist when a table came free.
+#
+
+waiting = bookings.waiting
+seated = bookings.seatedParties
+if waiting or seated:
+    st.markdown(f"Waitlist: **{len(waiting)}** parties waiting")
+    for party in waiting:
+        st.markdown(f"- {party.description()}")
+    for party in seated[:3]:
+        st.caption(party.description())
+    st.markdown("-----")
+
 #
 # Table status
 #
@@ -38,16 +58,57 @@ st.markdown("""
 # for each table. In a real system one might prefer to show strictly in time
 # order, however the assignment examples had table first so we use that here.
 #
+# Large floors are filtered and paged, so only the visible tables are rendered,
+# and those only when they changed (see restaurant.Fragments).
+#
 
 if len(tables.tables) != 0:
-    status = bookings.tableStatus()
-    for table in tables.tables:
+    statusFilter = status_view.filter_controls("status")
+    page, pageSize = status_view.page_controls("status")
+    rows, total = bookings.statusPage(tables, statusFilter, page, pageSize)
+    for table, tableText, tableBookings in rows:
         col_table, col_state = st.columns(2)
         with col_table:
-            st.markdown(table.description())
+            st.markdown(tableText)
         with col_state:
-            if not table.name in status:
+            if not tableBookings:
                 st.markdown("*Free*")
             else:
-                for booking in status[table.name]:
-                    st.markdown(booking.description())
+                for booking, bookingText in tableBookings:
+                    st.markdown(bookingText)
+    status_view.page_navigation("status", total)
+
+#
+# Occupancy through the day
+#
+# The occupancy is computed once per data version for all sessions, see
+# restaurant.Occupancy. The heatmap shows the tables on the page listed above.
+#
+
+occupancy = bookings.occupancy()
+if occupancy.hours and len(tables.tables) != 0:
+    st.markdown("-----")
+    peakTables, peakSeats = occupancy.peak()
+    st.markdown(f"#### Occupancy  \nPeak: **{peakTables}** tables, **{peakSeats}** seats")
+
+    first = occupancy.hours[0].date()
+    labels = [hour.strftime("%H:00") + ("" if hour.date() == first else " +1d") for hour in occupancy.hours]
+
+    heatmap = occupancy.heatmap([table.name for table, tableText, tableBookings in rows])
+    cells = pd.DataFrame([(tablename, label, fraction)
+                          for tablename, fractions in heatmap.items()
+                          for label, fraction in zip(labels, fractions)],
+                         columns=["table", "hour", "occupied"])
+    st.altair_chart(alt.Chart(cells).mark_rect().encode(
+        x=alt.X("hour:O", sort=labels, title=None),
+        y=alt.Y("table:N", sort=list(heatmap), title=None),
+        color=alt.Color("occupied:Q", scale=alt.Scale(domain=[0, 1]), legend=alt.Legend(format="%")),
+        tooltip=["table", "hour", alt.Tooltip("occupied:Q", format=".0%")],
+    ))
+
+    curve = pd.DataFrame(occupancy.curve, columns=["time", "tables", "seats"])
+    st.altair_chart(alt.Chart(curve).mark_line(interpolate="step-after").encode(
+        x=alt.X("time:T", title=None, axis=alt.Axis(format="%H:%M")),
+        y=alt.Y("seats:Q", title="Covers"),
+        tooltip=[alt.Tooltip("time:T", format="%H:%M"), "tables", "seats"],
+    ))
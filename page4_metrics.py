@@ -0,0 +1,175 @@
+#
+# page4_metrics.py
+#
+# Streamlit code for the pytock project.
+#
+
+import streamlit as st
+import pytock_data
+import pytock_metrics
+import pytock_outbox
+import pytock_profile
+import pytock_workers
+
+
+#
+# Performance metrics
+#
+
+st.markdown("### Metrics")
+
+# snapshot
+#
+# Please see pytock_metrics.py for the instrumented operations. The registry is
+# shared by all sessions, so this page shows the whole server's activity. Fan-out
+# and stored data are shown for the venue of this session. It is rerun like the
+# other pages whenever the shared data changes.
+#
+values = pytock_metrics.snapshot()
+venue = pytock_data.current_venue()
+
+def ms(seconds) -> str:
+    if seconds is None:
+        return "-"
+    if seconds == float("inf"):
+        return "> {0:g}".format(pytock_metrics.LATENCY_BUCKETS[-1] * 1000)
+    return "{0:g}".format(seconds * 1000)
+
+#
+# Operation latency
+#
+# Quantiles are estimated from the histogram buckets, so they show the bucket
+# upper bound in milliseconds.
+#
+
+operations = []
+for (family, labels), histogram in sorted(values.items()):
+    if family == "operation_seconds":
+        operations.append({
+            "operation": dict(labels)["op"],
+            "calls": histogram.count,
+            "mean ms": round(histogram.sum / histogram.count * 1000, 3),
+            "p50 ms": ms(histogram.quantile(0.50)),
+            "p95 ms": ms(histogram.quantile(0.95)),
+            "p99 ms": ms(histogram.quantile(0.99)),
+        })
+
+st.markdown("#### Operations")
+if operations:
+    st.dataframe(operations, hide_index=True)
+else:
+    st.markdown("*No operations recorded yet*")
+
+#
+# Rerun fan-out and stored data sizes
+#
+
+col_fanout, col_sizes = st.columns(2)
+with col_fanout:
+    st.markdown("#### Rerun fan-out")
+    fanout = values.get(("rerun_fanout_sessions", (("venue", venue),)))
+    if fanout and fanout.count:
+        st.markdown("""
+                    Changes: **{0}**  
+                    Sessions per change: **{1:.1f}** mean, **{2:g}** p95
+                    """.format(fanout.count, fanout.sum / fanout.count, fanout.quantile(0.95)))
+    else:
+        st.markdown("*No changes yet*")
+
+with col_sizes:
+    st.markdown("#### Stored data")
+    sizes = [{"key": dict(labels)["key"], "items": value, "changes": values.get(("changes_total", labels), 0)}
+             for (family, labels), value in sorted(values.items())
+             if family == "stored_items" and dict(labels).get("venue") == venue]
+    if sizes:
+        st.dataframe(sizes, hide_index=True)
+    else:
+        st.markdown("*Nothing stored yet*")
+
+#
+# Background jobs
+#
+# Please see pytock_workers.py. Jobs waiting to start can be cancelled, but only
+# by a session that has given the admin password, as for the profiler switch.
+#
+
+workers = pytock_workers.instance()
+if workers:
+    status = workers.status()
+    st.markdown("#### Background jobs")
+    st.dataframe(status["schedules"], hide_index=True)
+    if status["active"]:
+        st.dataframe(status["active"], hide_index=True)
+        pending = [job["id"] for job in status["active"] if job["state"] == "pending"]
+        if pending and st.session_state.get("pytock_admin", False):
+            col_job, col_cancel = st.columns([0.7, 0.3])
+            with col_job:
+                job_id = st.selectbox("Pending job", pending, label_visibility="collapsed")
+            with col_cancel:
+                if st.button("Cancel job"):
+                    workers.cancel(job_id)
+    with st.expander("Recent jobs"):
+        st.dataframe(status["history"], hide_index=True)
+
+#
+# Reminders
+#
+# Please see pytock_outbox.py. Shown when reminders are enabled on the server.
+#
+
+outbox = pytock_outbox.instance()
+if outbox:
+    reminders = outbox.status()
+    st.markdown("#### Reminders")
+    st.markdown("  ".join(f"{state.capitalize()}: **{count}**" for state, count in reminders["counts"].items()))
+    if reminders["reminders"]:
+        with st.expander("Pending and failed reminders"):
+            st.dataframe(reminders["reminders"], hide_index=True)
+
+#
+# Profiling
+#
+# Please see pytock_profile.py. Anyone may profile their own session with
+# ?profile=1. The switch profiles the reruns of every session on the server, so
+# it and the newest summaries are shown only to a session that has given the
+# admin password.
+#
+
+st.markdown("#### Profiling")
+if not st.session_state.get("pytock_admin", False) and pytock_profile.ADMIN_PASSWORD:
+    password = st.text_input("Admin password", type="password", key="admin_password")
+    if password and pytock_profile.admin(password):
+        st.session_state["pytock_admin"] = True
+        st.rerun()                                      # so the job controls above show too
+    elif password:
+        st.error("Wrong admin password")
+if not st.session_state.get("pytock_admin", False):
+    st.markdown("Open any page with **?profile=1** to profile your own session's reruns.")
+else:
+    profile_all = st.toggle("Profile every session's reruns", value=pytock_profile.switched())
+    if profile_all != pytock_profile.switched():
+        pytock_profile.switch(profile_all)
+profiles = pytock_profile.profiles() if st.session_state.get("pytock_admin", False) else [ ]
+if profiles:
+    with st.expander(f"Recent profiles in {pytock_profile.PROFILE_DIR}"):
+        base = st.selectbox("Profile", profiles, format_func=lambda path: path.rsplit("/", 1)[-1])
+        try:
+            with open(f"{base}.txt", encoding="utf-8") as file:
+                st.code(file.read(), language="text")
+            with open(f"{base}.prof", "rb") as file:
+                st.download_button("Download profile", file.read(), file_name=f"{base.rsplit('/', 1)[-1]}.prof")
+        except FileNotFoundError:
+            st.markdown("This profile has been rotated out.")
+
+#
+# Prometheus export
+#
+
+st.markdown("#### Prometheus export")
+if pytock_metrics.METRICS_PORT:
+    st.markdown(f"Served at http://127.0.0.1:{pytock_metrics.METRICS_PORT}/metrics")
+if st.button("Write metrics file"):
+    path = pytock_metrics.write_textfile()
+    st.toast(f"Metrics written to {path}", icon=":material/info:")
+with st.expander("Prometheus text"):
+    st.code(pytock_metrics.prometheus_text(), language="text")
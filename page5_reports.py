@@ -0,0 +1,70 @@
+#
+# page5_reports.py
+#
+# Streamlit code for the pytock project.
+#
+
+import streamlit as st
+import pytock_analytics
+import pytock_clock
+import pytock_data
+import pytock_workers
+
+
+#
+# Booking reports
+#
+
+st.markdown("### Reports")
+
+# date range
+#
+# Reports cover archived and live bookings starting within the range. Please
+# see pytock_analytics.py for how each report is computed.
+#
+today = pytock_clock.today()
+col_from, col_to = st.columns(2)
+with col_from:
+    report_from = st.date_input("From", key="report_from", value=today.replace(day=1))
+with col_to:
+    report_to = st.date_input("To", key="report_to", value=today)
+
+# reports
+#
+# The reports are computed in the background, and this session is rerun when
+# they are ready. Until then the previous reports for the range, if any, are
+# shown.
+#
+venue = pytock_data.current_venue()
+published = pytock_analytics.request_reports(report_from, report_to, venue)
+if published is None:
+    st.markdown("*Computing reports...*")
+elif published.table.num_rows == 0:
+    st.markdown("*No bookings in this range*")
+else:
+    table = published.table
+    reports = published.reports
+    st.caption(f"Computed at {published.computed.strftime('%H:%M:%S')}")
+
+    st.markdown("#### Covers per hour")
+    st.bar_chart(reports["covers_per_hour"])
+
+    st.markdown("#### Table turnover")
+    st.dataframe(reports["table_turnover"])
+
+    col_duration, col_utilization = st.columns(2)
+    with col_duration:
+        st.markdown("#### Party duration")
+        st.dataframe(reports["party_duration"].round(1))
+    with col_utilization:
+        st.markdown("#### Seat utilization")
+        st.dataframe(reports["seat_utilization"].map("{:.0%}".format))
+
+    if st.button("Export to Parquet"):
+        workers = pytock_workers.instance()
+        if workers:
+            workers.submit("export_parquet", pytock_analytics.write_parquet, table, venue=venue)
+        else:
+            pytock_analytics.write_parquet(table, venue=venue)
+        st.toast(f"{table.num_rows} bookings being written to {pytock_analytics.PARQUET_DIR}/{venue}/",
+                 icon=":material/info:")
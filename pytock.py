@@ -14,6 +14,13 @@
 #
 
 import streamlit as st
+import pytock_board
+import pytock_data
+import pytock_maintenance
+import pytock_metrics
+import pytock_outbox
+import pytock_profile
+import pytock_workers
 
 #
 # Logo with size override in HTML to make larger
@@ -33,6 +40,53 @@ st.html("""
     </style>
         """)
 
+#
+# Metrics endpoint
+#
+# Serve Prometheus metrics when PYTOCK_METRICS_PORT is set. The server is shared
+# by all sessions, so it is started once as a cached resource.
+#
+
+@st.cache_resource
+def metrics_endpoint():
+    return pytock_metrics.serve() if pytock_metrics.METRICS_PORT else None
+
+metrics_endpoint()
+
+#
+# Status board endpoint
+#
+# Serve the static status boards (see pytock_board.py) when PYTOCK_BOARD_PORT is
+# set, so that lobby screens need no session of their own.
+#
+
+@st.cache_resource
+def board_endpoint():
+    return pytock_board.serve() if pytock_board.BOARD_PORT else None
+
+board_endpoint()
+
+#
+# Background workers
+#
+# One pool of workers per server runs the housekeeping jobs, such as booking
+# expiry and archive compaction, sends reminders, and computes reports. It is a cached resource
+# so that all sessions share it; should it have been shut down, the cache
+# validation fails and a new one is started.
+#
+
+@st.cache_resource(validate=lambda workers: workers.running)
+def background_workers():
+    workers = pytock_workers.start()
+    pytock_maintenance.start(workers)
+    if pytock_board.ENABLED:
+        pytock_board.start(workers)
+    if pytock_outbox.ENABLED:
+        pytock_outbox.start(workers)
+    return workers
+
+background_workers()
+
 #
 # Create page content
 #
@@ -40,10 +94,49 @@ st.html("""
 page1_booking = st.Page("page1_booking.py", title="Booking")
 page2_tables = st.Page("page2_tables.py", title = "Table Management")
 page3_status = st.Page("page3_status.py", title = "Table Status")
+page4_metrics = st.Page("page4_metrics.py", title = "Metrics")
+page5_reports = st.Page("page5_reports.py", title = "Reports")
 
 #
 # Sidebar navigation
 #
 
-pg = st.navigation([page1_booking, page2_tables, page3_status], position="sidebar")
-pg.run()
+pg = st.navigation([page1_booking, page2_tables, page3_status, page4_metrics, page5_reports], position="sidebar")
+
+#
+# Venue selection
+#
+# The server hosts the venues listed in PYTOCK_VENUES. The venue shown is taken
+# from the ?venue= query parameter, so that a venue can be bookmarked, and can be
+# switched in the sidebar when there is more than one.
+#
+
+venue = st.query_params.get("venue", pytock_data.DEFAULT_VENUE)
+if venue not in pytock_data.VENUES:
+    venue = pytock_data.DEFAULT_VENUE
+if len(pytock_data.VENUES) > 1:
+    venue = st.sidebar.selectbox("Venue", pytock_data.VENUES, index=pytock_data.VENUES.index(venue))
+    st.query_params["venue"] = venue
+
+#
+# Profiling
+#
+# ?profile=1 profiles this session's reruns until ?profile=0, and an admin can
+# switch profiling on for every session on the Metrics page. See
+# pytock_profile.py.
+#
+
+profile = pytock_profile.requested(st.query_params.get("profile"))
+if profile is not None:
+    st.session_state["pytock_profile"] = profile
+profile = pytock_profile.switched() or st.session_state.get("pytock_profile", False)
+
+#
+# Run the page on one consistent snapshot of the venue's shared data
+#
+
+pytock_data.begin_run(venue)
+try:
+    pytock_profile.run(pg.run, pg.title, profile)
+finally:
+    pytock_data.end_run()
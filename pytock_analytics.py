@@ -0,0 +1,369 @@
+#
+# pytock_analytics.py
+#
+# Booking analytics for the pytock application. Bookings from the daily archive
+# files and the live store are loaded into an Arrow table column by column, so
+# no Python object is made per row when reading the archive, and written to a
+# Parquet dataset per venue, partitioned by date:
+#
+#   <PARQUET_DIR>/<venue>/date=YYYY-MM-DD/*.parquet
+#
+# Reports are computed with vectorized pandas/NumPy operations over the table.
+# For the Reports page they are computed in the background, the table loaded on
+# a worker thread and the reports on the process pool (see pytock_workers.py),
+# and kept as a venue resource of pytock_data for the page to show when ready.
+# Walk-ins have no real timing (see restaurant.WalkinBooking), so they count as
+# parties for turnover but are left out of the time-based reports. The parts of
+# a joined booking record the id of the first part as their party, so the party
+# counts once, by that part. Seats are
+# those of the booked table, since bookings do not record party size: as
+# archived, or for live bookings and older archives those of the current floor.
+#
+# Usage: python pytock_analytics.py [--venue ID] [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--export]
+#                                   [--tables N] [--seats N]
+#
+#   --tables, --seats  the floor to report turnover and utilization against, by
+#                      default the tables of a fresh store
+#
+
+import argparse
+import datetime
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset
+import pyarrow.json
+import pyarrow.parquet as pq
+
+import pytock_archive
+import pytock_clock
+import pytock_data
+import pytock_workers
+import restaurant
+
+PARQUET_DIR = os.environ.get("PYTOCK_PARQUET_DIR", "analytics")
+
+# hours of service per day, the denominator of seat utilization
+OPEN_HOURS = float(os.environ.get("PYTOCK_OPEN_HOURS", "12"))
+
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("table", pa.string()),
+    ("seats", pa.int64()),
+    ("name", pa.string()),
+    ("phone", pa.string()),
+    ("start", pa.timestamp("s")),
+    ("end", pa.timestamp("s")),
+    ("walkin", pa.bool_()),
+    ("party", pa.int64()),
+])
+
+# archive_table
+#
+# Read the archive files for the inclusive date range straight into Arrow.
+#
+def archive_table(fromDate: datetime.date = None, toDate: datetime.date = None, directory: str = None) -> pa.Table:
+    parts = []
+    options = pyarrow.json.ParseOptions(explicit_schema=SCHEMA, unexpected_field_behavior="ignore")
+    for day in pytock_archive.days(fromDate, toDate, directory):
+        stream = pa.input_stream(pytock_archive.path(day, directory), compression="gzip")
+        parts.append(pyarrow.json.read_json(stream, parse_options=options))
+    return pa.concat_tables(parts) if parts else SCHEMA.empty_table()
+
+# live_table
+#
+# Convert live Booking objects to Arrow, one column at a time.
+#
+def live_table(bookings: list) -> pa.Table:
+    return pa.Table.from_arrays([
+        pa.array([bk.id for bk in bookings], pa.int64()),
+        pa.array([bk.tablename for bk in bookings], pa.string()),
+        pa.nulls(len(bookings), pa.int64()),
+        pa.array([bk.name for bk in bookings], pa.string()),
+        pa.array([bk.phone for bk in bookings], pa.string()),
+        pa.array([bk.start for bk in bookings], pa.timestamp("s")),
+        pa.array([bk.end for bk in bookings], pa.timestamp("s")),
+        pa.array([isinstance(bk, restaurant.WalkinBooking) for bk in bookings], pa.bool_()),
+        pa.array([bk.parts[0] if isinstance(bk, restaurant.JoinedBooking) else bk.id for bk in bookings],
+                 pa.int64()),
+    ], schema=SCHEMA)
+
+# with_seats
+#
+# Fill in the seats of the bookings that do not record them from the current
+# tables, and add the date partition column. Such bookings of tables that no
+# longer exist keep null seats.
+#
+def with_seats(table: pa.Table, tables: list) -> pa.Table:
+    names = pa.array([each.name for each in tables], pa.string())
+    seats = pa.array([each.seats for each in tables], pa.int64())
+    current = pc.take(seats, pc.index_in(table["table"], value_set=names))
+    table = table.set_column(table.schema.get_field_index("seats"), "seats", pc.coalesce(table["seats"], current))
+    return table.append_column("date", pc.strftime(table["start"], format="%Y-%m-%d"))
+
+# bookings_table
+#
+# All archived and live bookings of a venue starting within the inclusive date
+# range. Live bookings include the occurrences of recurring rules that have not
+# expired, up to the end of the range or else today.
+#
+def bookings_table(fromDate: datetime.date = None, toDate: datetime.date = None, venue: str = None) -> pa.Table:
+    venue = pytock_data.current_venue(venue)
+    tables = restaurant.Tables(venue).tables
+    bookings = restaurant.Bookings(venue)
+    live = live_table(bookings.bookings + list(bookings.occurrences(fromDate or datetime.date.min,
+                                                                    toDate or pytock_clock.today())))
+    if fromDate:
+        live = live.filter(pc.greater_equal(live["start"], pa.scalar(datetime.datetime.combine(fromDate, datetime.time()), pa.timestamp("s"))))
+    if toDate:
+        live = live.filter(pc.less(live["start"], pa.scalar(datetime.datetime.combine(toDate + datetime.timedelta(days=1), datetime.time()), pa.timestamp("s"))))
+    archived = archive_table(fromDate, toDate, pytock_archive.directory_for(venue))
+    return with_seats(pa.concat_tables([archived, live]), tables)
+
+# write_parquet
+#
+# Write a venue's bookings table to its Parquet dataset, replacing the
+# partitions of the dates it contains.
+#
+def write_parquet(table: pa.Table, root: str = PARQUET_DIR, venue: str = None) -> None:
+    pq.write_to_dataset(table, os.path.join(root, pytock_data.current_venue(venue)),
+                        partition_cols=["date"], existing_data_behavior="delete_matching")
+
+# read_parquet
+#
+# Read a venue's Parquet dataset for an inclusive date range, reading only the
+# partitions within it.
+#
+def read_parquet(fromDate: datetime.date = None, toDate: datetime.date = None, root: str = PARQUET_DIR,
+                 venue: str = None) -> pa.Table:
+    filters = []
+    if fromDate:
+        filters.append(("date", ">=", fromDate.isoformat()))
+    if toDate:
+        filters.append(("date", "<=", toDate.isoformat()))
+    partitioning = pa.dataset.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+    return pq.read_table(os.path.join(root, pytock_data.current_venue(venue)), filters=filters or None,
+                         partitioning=partitioning)
+
+# timed_frame
+#
+# The bookings with real timing as a DataFrame, with durations in hours.
+#
+def timed_frame(table: pa.Table) -> pd.DataFrame:
+    frame = table.filter(pc.invert(table["walkin"])).to_pandas()
+    frame["hours"] = (frame["end"] - frame["start"]) / pd.Timedelta(hours=1)
+    return frame
+
+# covers_per_hour
+#
+# Seat-hours occupied in each clock hour: every booking is spread over the
+# hourly bins it overlaps, using NumPy repeat rather than a loop.
+#
+def covers_per_hour(table: pa.Table) -> pd.Series:
+    frame = timed_frame(table)
+    if frame.empty:
+        return pd.Series(dtype=float, name="covers")
+    start = frame["start"].to_numpy("datetime64[s]")
+    end = frame["end"].to_numpy("datetime64[s]")
+    seats = frame["seats"].fillna(0).to_numpy(float)
+    hour = np.timedelta64(1, "h")
+    first = start.astype("datetime64[h]").astype("datetime64[s]")
+    bins = np.maximum(np.ceil((end - first) / hour).astype(np.int64), 1)
+    row = np.repeat(np.arange(len(frame)), bins)
+    offset = np.arange(bins.sum()) - np.repeat(np.cumsum(bins) - bins, bins)
+    binStart = first[row] + offset * hour
+    overlap = (np.minimum(end[row], binStart + hour) - np.maximum(start[row], binStart)) / hour
+    covers = pd.Series(seats[row] * np.clip(overlap, 0, 1), index=pd.DatetimeIndex(binStart, name="hour"))
+    return covers.groupby(level=0).sum().rename("covers")
+
+# table_turnover
+#
+# Parties seated per day, tables used, and turns per table of the floor. Each
+# row is a party but the later parts of a joined booking, whose party is another
+# row's id; older archives record no party, so each of their rows counts. Ids
+# are compared only within a row, since they start again in every process and a
+# day's archive may hold bookings of several.
+#
+def table_turnover(table: pa.Table, tableCount: int) -> pd.DataFrame:
+    frame = table.select(["date", "table"]).to_pandas()
+    frame["party"] = pc.fill_null(pc.equal(table["party"], table["id"]), True).to_pandas()
+    grouped = frame.groupby("date")
+    output = pd.DataFrame({"parties": grouped["party"].sum(), "tables_used": grouped["table"].nunique()})
+    output["turns_per_table"] = output["parties"] / max(tableCount, 1)
+    return output
+
+# party_duration
+#
+# Average and longest booking duration per day, in minutes.
+#
+def party_duration(table: pa.Table) -> pd.DataFrame:
+    frame = timed_frame(table)
+    minutes = frame.groupby("date")["hours"].agg(["mean", "max"]) * 60
+    return minutes.rename(columns={"mean": "average_minutes", "max": "longest_minutes"})
+
+# seat_utilization
+#
+# Booked seat-hours per day as a fraction of the floor's seats over OPEN_HOURS.
+#
+def seat_utilization(table: pa.Table, seatCount: int) -> pd.Series:
+    frame = timed_frame(table)
+    seatHours = (frame["seats"].fillna(0) * frame["hours"]).groupby(frame["date"]).sum()
+    return (seatHours / max(seatCount * OPEN_HOURS, 1)).rename("seat_utilization")
+
+# compute_reports
+#
+# All reports for a bookings table and floor capacity, as a dictionary of
+# pandas objects. This needs no shared data, so it can run in another process.
+#
+def compute_reports(table: pa.Table, tableCount: int, seatCount: int) -> dict:
+    return {
+        "covers_per_hour": covers_per_hour(table),
+        "table_turnover": table_turnover(table, tableCount),
+        "party_duration": party_duration(table),
+        "seat_utilization": seat_utilization(table, seatCount),
+    }
+
+# reports
+#
+# All reports for a venue's bookings table, as a dictionary of pandas objects.
+#
+def reports(table: pa.Table, venue: str = None) -> dict:
+    return compute_reports(table, *restaurant.Tables(venue).capacity())
+
+
+#
+# Reports class
+#
+# The reports for one venue and date range, with the data versions they were
+# computed from.
+#
+
+class Reports:
+    """
+    A Reports object holds computed reports and the bookings table behind them.
+    """
+
+    def __init__(self, fromDate: datetime.date, toDate: datetime.date, versions: tuple, table: pa.Table,
+                 reports: dict):
+        self.fromDate = fromDate
+        self.toDate = toDate
+        self.versions = versions
+        self.table = table
+        self.reports = reports
+        self.computed = pytock_clock.now()
+
+
+#
+# Published class
+#
+# A venue's computed reports, kept as a pytock_data resource rather than under
+# a key, since storing them must not rerun every session of the venue. Only
+# the sessions waiting for a date range are rerun when its reports are ready.
+#
+
+class Published:
+    """
+    A Published object holds a venue's reports and the sessions waiting for
+    them.
+    """
+
+    def __init__(self):
+        self.reports = { }                              # (from, to) -> Reports, oldest first
+        self.waiting = { }                              # (from, to) -> set of session ids
+
+# data the reports are computed from, besides the archive
+SOURCES = ("restaurant_bookings", "restaurant_rules", "restaurant_tables")
+
+# date ranges whose reports are kept, most recent first out
+REPORTS_KEPT = 8
+
+# published
+#
+# Return the venue's shared Published object. Callers hold the venue lock.
+#
+def published(venue: str = None) -> Published:
+    return pytock_data.resource("analytics_reports", Published, venue)
+
+_pending = { }                                          # (venue, from, to) -> pytock_workers.Job
+_pendingLock = threading.Lock()
+
+# refresh_reports
+#
+# Background job: load the bookings table, have the process pool compute the
+# reports, keep them by date range and rerun the sessions waiting for them.
+#
+def refresh_reports(fromDate: datetime.date, toDate: datetime.date, venue: str) -> Reports:
+    versions = tuple(pytock_data.version(key, venue) for key in SOURCES)
+    table = bookings_table(fromDate, toDate, venue)
+    capacity = restaurant.Tables(venue).capacity()
+    workers = pytock_workers.instance()
+    if workers and workers.processes > 0 and table.num_rows:
+        computed = workers.submit("compute_reports", compute_reports, table, *capacity, process=True).result()
+    else:
+        computed = compute_reports(table, *capacity)
+    result = Reports(fromDate, toDate, versions, table, computed)
+    with pytock_data.lock(venue):
+        kept = published(venue)
+        kept.reports.pop((fromDate, toDate), None)
+        kept.reports[(fromDate, toDate)] = result
+        for stale in list(kept.reports)[:-REPORTS_KEPT]:
+            del kept.reports[stale]
+        waiting = kept.waiting.pop((fromDate, toDate), set())
+    pytock_data.rerun(waiting)
+    return result
+
+# request_reports
+#
+# Return the reports kept for the range, which may be out of date, or None if
+# there are none yet. A refresh is started in the background unless they are
+# current or one is under way, and the calling session is rerun when it is
+# done; without workers they are computed here.
+#
+def request_reports(fromDate: datetime.date, toDate: datetime.date, venue: str = None) -> Reports:
+    venue = pytock_data.current_venue(venue)
+    versions = tuple(pytock_data.version(key, venue) for key in SOURCES)
+    workers = pytock_workers.instance()
+    with pytock_data.lock(venue):
+        kept = published(venue)
+        current = kept.reports.get((fromDate, toDate))
+        if current and current.versions == versions:
+            return current
+        session = pytock_data.session()
+        if session and workers and workers.running:
+            kept.waiting.setdefault((fromDate, toDate), set()).add(session)
+    if workers is None or not workers.running:
+        return refresh_reports(fromDate, toDate, venue)
+    with _pendingLock:
+        job = _pending.get((venue, fromDate, toDate))
+        if job is None or job.state not in ("pending", "running"):
+            _pending[(venue, fromDate, toDate)] = workers.submit("refresh_reports", refresh_reports,
+                                                                 fromDate, toDate, venue)
+    return current
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export pytock bookings and print reports.")
+    parser.add_argument("--venue", default=pytock_data.DEFAULT_VENUE, help="venue id")
+    parser.add_argument("--from", dest="fromDate", type=datetime.date.fromisoformat, help="first date")
+    parser.add_argument("--to", dest="toDate", type=datetime.date.fromisoformat, help="last date")
+    parser.add_argument("--export", action="store_true", help=f"write the bookings to {PARQUET_DIR}/<venue>/")
+    parser.add_argument("--tables", type=int, help="tables on the floor, for turnover")
+    parser.add_argument("--seats", type=int, help="seats on the floor, for utilization")
+    options = parser.parse_args(argv)
+
+    table = bookings_table(options.fromDate, options.toDate, options.venue)
+    if options.export:
+        write_parquet(table, venue=options.venue)
+    tableCount, seatCount = restaurant.Tables(options.venue).capacity()     # this process's floor by default
+    computed = compute_reports(table, options.tables or tableCount, options.seats or seatCount)
+    for name, report in computed.items():
+        print(f"\n{name}\n{report.to_string()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
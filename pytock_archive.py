@@ -0,0 +1,208 @@
+#
+# pytock_archive.py
+#
+# Cold storage for finished bookings. Bookings and occurrences of recurring
+# rules removed from the live store by the expiry sweeper are appended to one compressed file per venue and day,
+#
+#   <ARCHIVE_DIR>/<venue>/bookings-YYYY-MM-DD.jsonl.gz
+#
+# holding one JSON object per line. Each append adds a gzip member, which gzip
+# readers treat as one continuous stream, so files are never rewritten except by
+# compact(), which merges the members of a past day into one for better
+# compression. Compaction runs as a scheduled background job (see
+# pytock_maintenance.py), never on the sweep that archives. A compacted file
+# gets a marker beside it holding its size, so that it is not compacted again,
+# even after a restart, until an append changes the size. Queries stream
+# records from disk a line at a time.
+#
+
+import datetime
+import gzip
+import json
+import os
+import threading
+
+import pytock_data
+import restaurant
+
+ARCHIVE_DIR = os.environ.get("PYTOCK_ARCHIVE_DIR", "archive")
+
+_lock = threading.Lock()                                # appends vs. compaction
+
+# directory_for
+#
+# Return the archive directory of a venue.
+#
+def directory_for(venue: str) -> str:
+    return os.path.join(ARCHIVE_DIR, venue)
+
+# migrate
+#
+# Move day files left in the archive root from before venues had directories
+# into the default venue's, appending to a file it has for the same day, since
+# gzip members concatenate. Returns the number of files moved.
+#
+def migrate() -> int:
+    if not os.path.isdir(ARCHIVE_DIR):
+        return 0
+    target = directory_for(pytock_data.DEFAULT_VENUE)
+    moved = 0
+    with _lock:
+        for name in sorted(os.listdir(ARCHIVE_DIR)):
+            source = os.path.join(ARCHIVE_DIR, name)
+            if not (name.startswith("bookings-") and name.endswith(".jsonl.gz")) or not os.path.isfile(source):
+                continue
+            os.makedirs(target, exist_ok=True)
+            destination = os.path.join(target, name)
+            if os.path.exists(destination):
+                with open(source, "rb") as reader, open(destination, "ab") as writer:
+                    while chunk := reader.read(1 << 20):
+                        writer.write(chunk)
+                os.remove(source)
+            else:
+                os.replace(source, destination)
+            if os.path.exists(f"{source}.compacted"):
+                os.remove(f"{source}.compacted")
+            moved += 1
+    return moved
+
+# path
+#
+# Return the archive file path for a date.
+#
+def path(day: datetime.date, directory: str = None) -> str:
+    return os.path.join(directory or ARCHIVE_DIR, f"bookings-{day.isoformat()}.jsonl.gz")
+
+# record
+#
+# Convert a booking to its archived form, with the seats of its table, given
+# as a dictionary from table name, or None if unknown. The party is the id of
+# the first part of a joined booking, otherwise the booking's own.
+#
+def record(booking, seats: dict = None) -> dict:
+    return {
+        "id": booking.id,
+        "table": booking.tablename,
+        "seats": (seats or { }).get(booking.tablename),
+        "name": booking.name,
+        "phone": booking.phone,
+        "start": booking.start.isoformat(),
+        "end": booking.end.isoformat(),
+        "walkin": type(booking).__name__ == "WalkinBooking",
+        "party": booking.parts[0] if type(booking).__name__ == "JoinedBooking" else booking.id,
+    }
+
+# archive
+#
+# Append bookings to the files for their start dates, recording the seats of
+# their tables from the dictionary by table name, if given.
+#
+def archive(bookings, directory: str = None, seats: dict = None) -> int:
+    byDay = { }
+    for booking in bookings:
+        byDay.setdefault(booking.start.date(), []).append(record(booking, seats))
+    if not byDay:
+        return 0
+    os.makedirs(directory or ARCHIVE_DIR, exist_ok=True)
+    with _lock:
+        for day, records in byDay.items():
+            lines = "".join(json.dumps(rec, separators=(",", ":")) + "\n" for rec in records)
+            with gzip.open(path(day, directory), "at", encoding="utf-8") as file:
+                file.write(lines)
+    return sum(len(records) for records in byDay.values())
+
+# days
+#
+# Return the sorted dates that have archive files, optionally limited to a range.
+#
+def days(fromDate: datetime.date = None, toDate: datetime.date = None, directory: str = None) -> list[datetime.date]:
+    directory = directory or ARCHIVE_DIR
+    if not os.path.isdir(directory):
+        return []
+    output = []
+    for name in os.listdir(directory):
+        if name.startswith("bookings-") and name.endswith(".jsonl.gz"):
+            try:
+                day = datetime.date.fromisoformat(name[len("bookings-"):-len(".jsonl.gz")])
+            except ValueError:
+                continue
+            if (fromDate is None or day >= fromDate) and (toDate is None or day <= toDate):
+                output.append(day)
+    return sorted(output)
+
+# query
+#
+# Yield archived booking records whose start date is within the inclusive
+# range, in date order, reading the files a line at a time.
+#
+def query(fromDate: datetime.date = None, toDate: datetime.date = None, directory: str = None):
+    for day in days(fromDate, toDate, directory):
+        with gzip.open(path(day, directory), "rt", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+# compacted
+#
+# True iff the file is as it was when last compacted, according to its marker.
+#
+def compacted(source: str) -> bool:
+    try:
+        with open(f"{source}.compacted", encoding="utf-8") as marker:
+            return int(marker.read()) == os.path.getsize(source)
+    except (OSError, ValueError):
+        return False
+
+# compact
+#
+# Rewrite a day's file as a single gzip member. The new file is written aside
+# and swapped in, and appends wait meanwhile, so readers never see a partial
+# file.
+#
+def compact(day: datetime.date, directory: str = None) -> None:
+    source = path(day, directory)
+    if not os.path.exists(source):
+        return
+    with _lock:
+        if compacted(source):
+            return
+        temp = f"{source}.tmp"
+        with gzip.open(source, "rb") as reader, gzip.open(temp, "wb", compresslevel=9) as writer:
+            while chunk := reader.read(1 << 20):
+                writer.write(chunk)
+        os.replace(temp, source)
+        with open(f"{source}.compacted", "w", encoding="utf-8") as marker:
+            marker.write(str(os.path.getsize(source)))
+
+# compact_before
+#
+# Compact the files of all days before the given date, which receive no more
+# appends in the normal course of service.
+#
+def compact_before(day: datetime.date, directory: str = None) -> int:
+    past = days(toDate=day - datetime.timedelta(days=1), directory=directory)
+    for each in past:
+        compact(each, directory)
+    return len(past)
+
+# compact_venues
+#
+# Compact the past days of every venue's archive, which is cheap for the days
+# already compacted. Returns the number of days looked at.
+#
+def compact_venues(day: datetime.date) -> int:
+    if not os.path.isdir(ARCHIVE_DIR):
+        return 0
+    return sum(compact_before(day, os.path.join(ARCHIVE_DIR, venue)) for venue in sorted(os.listdir(ARCHIVE_DIR))
+               if os.path.isdir(os.path.join(ARCHIVE_DIR, venue)))
+
+# on_expired
+#
+# Expiry sweeper callback: archive the expired bookings in the venue's
+# directory. It runs before they are removed from the live store, so an error
+# here leaves them to the next sweep. The seats are recorded as the floor is
+# now, so that reports on the archive do not depend on later table changes.
+#
+def on_expired(bookings, venue: str) -> None:
+    seats = {table.name: table.seats for table in restaurant.Tables(venue, latest=True).tables}
+    archive(bookings, directory_for(venue), seats)
@@ -0,0 +1,300 @@
+#
+# pytock_board.py
+#
+# Static status boards for the pytock application. Lobby and kitchen screens
+# only need to show the table status, so instead of a Streamlit session each,
+# which reruns on every change, they read files written here once per change:
+#
+#   <BOARD_DIR>/<venue>/index.html      page that reloads itself
+#   <BOARD_DIR>/<venue>/status.json     the same status as data
+#
+# served by a small local endpoint when PYTOCK_BOARD_PORT is set, e.g.
+# http://127.0.0.1:8502/main/ for the default venue. Any number of displays then
+# cost one render per change. Boards are written when the port or the
+# PYTOCK_BOARD_DIR directory is set, the latter for serving them elsewhere.
+#
+# The boards follow the pytock_data change feed from a scheduled background job.
+# Each board keeps its own index of the stored bookings and rules by table, fed
+# from the events, so when events arrived only the tables they concern are
+# looked up and rendered again, and the files are assembled from the kept
+# per-table pieces; when none did, nothing is done. A new day, or a feed that
+# overflowed, rebuilds the index from the store and renders the board in full.
+# Boards are for public screens, so they show guest names but not phones.
+#
+
+import datetime
+import functools
+import html
+import http.server
+import json
+import os
+import threading
+
+import pytock_clock
+import pytock_data
+import restaurant
+
+BOARD_DIR = os.environ.get("PYTOCK_BOARD_DIR", "board")
+BOARD_PORT = int(os.environ.get("PYTOCK_BOARD_PORT", "0"))
+ENABLED = BOARD_PORT > 0 or "PYTOCK_BOARD_DIR" in os.environ
+BOARD_INTERVAL = datetime.timedelta(seconds=1)          # longest delay before a change shows
+PAGE_REFRESH = 10                                       # seconds between display reloads
+
+KEYS = ("restaurant_bookings", "restaurant_rules", "restaurant_tables")
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta http-equiv="refresh" content="{refresh}">
+<title>{venue} - table status</title>
+<style>
+body {{ font-family: sans-serif; margin: 1rem; }}
+main {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(14rem, 1fr)); gap: 0.75rem; }}
+section {{ border: 1px solid #ccc; border-radius: 0.5rem; padding: 0.5rem 0.75rem; }}
+section.free {{ background: #eef8ee; }}
+h2 {{ margin: 0; font-size: 1.2rem; }}
+ul {{ margin: 0.25rem 0 0; padding-left: 1rem; }}
+</style>
+</head>
+<body>
+<h1>{venue}</h1>
+<p>Updated {generated}</p>
+<main>
+{tables}
+</main>
+</body>
+</html>
+"""
+
+
+#
+# Board class
+#
+# The board of one venue: the rendered piece of each table, kept until an event
+# concerns that table, and the table's stored bookings and standing rules.
+#
+
+class Board:
+    """
+    A Board object writes the status files of one venue.
+    """
+
+    def __init__(self, venue: str, directory: str = None):
+        self.venue = venue
+        self.directory = os.path.join(directory or BOARD_DIR, venue)
+        self.renders = 0                                # tables rendered, for testing
+        self._day = None
+        self._versions = None
+        self._tables = { }                              # table name -> (html, dict)
+        self._bookings = { }                            # table name -> {booking id: Booking}
+        self._rules = { }                               # table name -> {rule id: RecurringRule}
+
+    def update(self, events: list = None) -> bool:
+        """
+        Apply change events to the index, render the tables they concern
+        and rewrite the files, unless there is nothing to render and the data
+        version is the one written.
+
+        Args:
+            events: pytock_data.Event objects in order, or None to rebuild
+            and render all.
+
+        Returns:
+            True iff the files were written.
+
+        Raises:
+            OSError if the files cannot be written.
+        """
+        today = pytock_clock.today()
+        if today != self._day:
+            self._day, events = today, None
+        versions = tuple(pytock_data.version(key, self.venue) for key in KEYS)
+        if versions == self._versions and events is not None and not events:
+            return False
+        if events is None:
+            changed = None
+            self.__rebuild()
+        else:
+            changed = {self.__apply(event) for event in events}
+        tables = pytock_data.latest("restaurant_tables", self.venue) or ()
+        names = {table.name for table in tables}
+        for name in list(self._tables):
+            if name not in names:
+                del self._tables[name]
+        for table in tables:
+            if changed is None or table.name in changed or table.name not in self._tables:
+                self._tables[table.name] = self.__render(table, self.__today(table.name, today))
+                self.renders += 1
+        self._versions = versions
+        self.__write(tables)
+        return True
+
+    def __rebuild(self) -> None:
+        """
+        Index the stored bookings and rules by table.
+        """
+        self._bookings, self._rules = { }, { }
+        for booking in (pytock_data.latest("restaurant_bookings", self.venue) or { }).values():
+            self._bookings.setdefault(booking.tablename, { })[booking.id] = booking
+        for rule in (pytock_data.latest("restaurant_rules", self.venue) or { }).values():
+            self._rules.setdefault(rule.tablename, { })[rule.id] = rule
+
+    def __apply(self, event) -> str:
+        """
+        Apply one event to the index, returning the name of its table.
+        """
+        item = event.item
+        if isinstance(item, restaurant.Table):
+            return item.name
+        if event.kind in ("booking_added", "walk_in"):
+            self._bookings.setdefault(item.tablename, { })[item.id] = item
+        elif event.kind in ("booking_deleted", "walk_out", "booking_expired"):
+            self._bookings.get(item.tablename, { }).pop(item.id, None)
+        elif event.kind == "rule_added":
+            self._rules.setdefault(item.tablename, { })[item.id] = item
+        elif event.kind == "rule_deleted":
+            self._rules.get(item.tablename, { }).pop(item.id, None)
+        elif event.kind in ("occurrence_skipped", "occurrence_expired"):   # the rule was replaced
+            rule = (pytock_data.latest("restaurant_rules", self.venue) or { }).get(item.ruleId)
+            if rule is not None:
+                self._rules.setdefault(rule.tablename, { })[rule.id] = rule
+        return item.tablename
+
+    def __today(self, tablename: str, today: datetime.date) -> list:
+        """
+        The table's stored bookings and today's occurrences of its rules.
+        """
+        output = list(self._bookings.get(tablename, { }).values())
+        for rule in self._rules.get(tablename, { }).values():
+            output.extend(rule.occurrences(today, today))
+        return output
+
+    @staticmethod
+    def __render(table, bookings: list) -> tuple[str, dict]:
+        """
+        Render one table as an HTML section and a JSON-ready dictionary.
+        """
+        rows = [ ]
+        for booking in sorted(bookings, key=restaurant.Booking.compareByStartKey):
+            walkin = isinstance(booking, restaurant.WalkinBooking)
+            rows.append({
+                "start": booking.start.strftime("%H:%M"),
+                "end": booking.end.strftime("%H:%M"),
+                "name": "Walk-in" if walkin else booking.name,
+                "walkin": walkin,
+            })
+        items = "".join("<li>Walk-in guest</li>" if row["walkin"] else
+                        f"<li>{row['start']} - {row['end']} {html.escape(row['name'])}</li>" for row in rows)
+        section = (f'<section class="{"busy" if rows else "free"}"><h2>{html.escape(table.name)}</h2>'
+                   f'{table.seats} seats<ul>{items or "<li><em>Free</em></li>"}</ul></section>')
+        return section, {"name": table.name, "seats": table.seats, "bookings": rows}
+
+    def __write(self, tables) -> None:
+        generated = pytock_clock.now()
+        status = {
+            "venue": self.venue,
+            "version": list(self._versions),
+            "generated": generated.isoformat(timespec="seconds"),
+            "tables": [self._tables[table.name][1] for table in tables],
+        }
+        page = PAGE.format(refresh=PAGE_REFRESH, venue=html.escape(self.venue),
+                           generated=generated.strftime("%H:%M:%S"),
+                           tables="\n".join(self._tables[table.name][0] for table in tables))
+        os.makedirs(self.directory, exist_ok=True)
+        for name, text in (("status.json", json.dumps(status, separators=(",", ":"))), ("index.html", page)):
+            path = os.path.join(self.directory, name)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+                file.write(text)
+            os.replace(f"{path}.tmp", path)             # displays never read a partial file
+
+
+#
+# Boards class
+#
+# The boards of all venues, fed from one subscription.
+#
+
+class Boards:
+    """
+    A Boards object keeps every venue's board up to date.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory
+        self._boards = { }                              # venue -> Board
+        self._lock = threading.Lock()
+        self._feed = pytock_data.subscribe(restaurant.Fragments.KINDS)
+
+    def refresh(self) -> int:
+        """
+        Apply the events since the last refresh. Venues without events cost
+        a look at their data versions and the date.
+
+        Args:
+            None.
+
+        Returns:
+            The number of boards written.
+
+        Raises:
+            OSError if a board cannot be written.
+        """
+        with self._lock:
+            dropped, self._feed.dropped = self._feed.dropped, 0
+            changed = { }                               # venue -> events
+            for event in self._feed.drain():
+                changed.setdefault(event.venue, [ ]).append(event)
+            written = 0
+            for venue in pytock_data.venues():
+                board = self._boards.get(venue)
+                if board is None:
+                    board = self._boards[venue] = Board(venue, self.directory)
+                written += board.update(None if dropped else changed.get(venue, [ ]))
+            return written
+
+    def close(self) -> None:
+        pytock_data.unsubscribe(self._feed)
+
+
+# start
+#
+# Schedule the board refresh on the workers, closing the boards of workers
+# started before so that their feed subscription goes too.
+#
+_boards = None
+
+def start(workers, directory: str = None) -> Boards:
+    global _boards
+    if _boards is not None:
+        _boards.close()
+    _boards = Boards(directory)
+    workers.schedule("status_board", _boards.refresh, BOARD_INTERVAL)
+    return _boards
+
+# serve
+#
+# Serve the board files at http://host:port/<venue>/ from a daemon thread. The
+# server is started at most once per process and is returned to callers.
+#
+_server = None
+_serverLock = threading.Lock()
+
+def serve(port: int = BOARD_PORT, host: str = "127.0.0.1", directory: str = None) -> http.server.HTTPServer:
+    global _server
+
+    class BoardHandler(http.server.SimpleHTTPRequestHandler):
+        def end_headers(self):
+            self.send_header("Cache-Control", "no-cache")
+            super().end_headers()
+
+        def log_message(self, format, *args):
+            pass                                            # keep display polling out of the console
+
+    with _serverLock:
+        if _server is None:
+            os.makedirs(directory or BOARD_DIR, exist_ok=True)
+            handler = functools.partial(BoardHandler, directory=os.path.abspath(directory or BOARD_DIR))
+            _server = http.server.ThreadingHTTPServer((host, port), handler)
+            threading.Thread(target=_server.serve_forever, name="pytock-board", daemon=True).start()
+    return _server
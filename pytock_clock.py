@@ -0,0 +1,58 @@
+#
+# pytock_clock.py
+#
+# Pluggable clock for the pytock application. Everything that needs the current
+# date or time asks this module rather than datetime directly, so that a trace
+# replay or a simulation can substitute its own notion of "now".
+#
+
+import datetime
+
+_clock = datetime.datetime.now
+
+# now
+#
+# Return the current datetime.datetime from the installed clock.
+#
+def now() -> datetime.datetime:
+    return _clock()
+
+# today
+#
+# Return the current datetime.date from the installed clock.
+#
+def today() -> datetime.date:
+    return _clock().date()
+
+# set_clock
+#
+# Install a clock, which is any callable returning a datetime.datetime. Passing
+# None restores the system clock.
+#
+def set_clock(clock) -> None:
+    global _clock
+    _clock = clock if clock else datetime.datetime.now
+
+
+#
+# FixedClock class
+#
+# A clock that only moves when told to, for replay and simulation.
+#
+
+class FixedClock:
+    """
+    A FixedClock object reports the time it was last set to.
+    """
+
+    def __init__(self, when: datetime.datetime = None):
+        self.when = when or datetime.datetime.now()
+
+    def __call__(self) -> datetime.datetime:
+        return self.when
+
+    def set(self, when: datetime.datetime) -> None:
+        self.when = when
+
+    def advance(self, delta: datetime.timedelta) -> None:
+        self.when += delta
@@ -5,30 +5,223 @@
 # to be cached and changes updated in all client browsers and tabs connected to
 # this streamlit application.
 #
+# Stored data is immutable: lists are stored as tuples and dictionaries as
+# read-only mappings, so readers share it without copying and writers build a
+# new container. Every change of a key bumps its version. Each script run reads
+# from one snapshot of all keys taken by begin_run(), so every section of a page
+# sees the same version, and derive() caches data computed from a key for as
+# long as its version stands.
+#
+# One server can host several venues (restaurants). Each venue has its own
+# namespace of keys, versions, derived data, resources and lock, and a change
+# reruns only the sessions showing that venue. Functions act on the venue of
+# the script run on this thread unless given one, and otherwise DEFAULT_VENUE.
+#
+# Besides rerunning sessions, changes are described by a feed of events, such
+# as "booking_added" with the booking, which in-process consumers subscribe to
+# instead of comparing whole versions of the data. Each subscriber has its own
+# bounded queue, so a slow consumer loses its oldest events, and learns how
+# many, rather than holding up the writer.
+#
 
+import collections
+import os
+import threading
+import types
 import streamlit as st
+import pytock_clock
+import pytock_metrics
 from streamlit.runtime import Runtime
 from streamlit.runtime.app_session import AppSession
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# events held per subscriber of the change feed
+FEED_QUEUE = int(os.environ.get("PYTOCK_FEED_QUEUE", "1000"))
+
+# venue ids offered by the server, and the one used when none is chosen
+VENUES = [each.strip() for each in os.environ.get("PYTOCK_VENUES", "").split(",") if each.strip()]
+DEFAULT_VENUE = os.environ.get("PYTOCK_VENUE") or (VENUES[0] if VENUES else "main")
+if DEFAULT_VENUE not in VENUES:
+    VENUES.insert(0, DEFAULT_VENUE)
+
+
+#
+# Venue class
+#
+# The shared state of one venue.
+#
+
+class Venue:
+    """
+    A Venue object holds one venue's data, versions, derived data and helper
+    resources, with the lock that guards changes to them.
+    """
+
+    def __init__(self, venueId: str):
+        self.id = venueId
+        self.data = { }                                     # key -> immutable data
+        self.versions = { }                                 # key -> change counter
+        self.derived = { }                                  # (key, name) -> (version, result)
+        self.resources = { }                                # key -> shared mutable helper
+        self.lock = threading.RLock()
+
+
+#
+# Event class
+#
+# One change, published after the data has been stored, so its version is that
+# of the key including the change. The item is the immutable object concerned,
+# e.g. the Booking added or the Table deleted.
+#
+
+class Event:
+    """
+    An Event object describes one change to a venue's shared data.
+    """
+
+    def __init__(self, kind: str, venueId: str, key: str, version: int, item):
+        self.kind = kind
+        self.venue = venueId
+        self.key = key
+        self.version = version
+        self.item = item
+        self.time = pytock_clock.now()
+
+    def __repr__(self) -> str:
+        return f"Event({self.kind!r}, {self.venue!r}, {self.key!r}, {self.version}, {self.item!r})"
+
+
+#
+# Subscription class
+#
+# A bounded queue of events for one consumer, optionally limited to some event
+# kinds and one venue. When the queue is full the oldest event is dropped and
+# counted, so the consumer can tell that it must reread the data.
+#
+
+class Subscription:
+    """
+    A Subscription object queues the events a consumer asked for.
+    """
+
+    def __init__(self, kinds=None, venueId: str = None, maxsize: int = FEED_QUEUE):
+        self.kinds = frozenset(kinds) if kinds else None
+        self.venue = venueId
+        self.dropped = 0
+        self._queue = collections.deque(maxlen=maxsize)
+        self._ready = threading.Condition()
+        self._closed = False
+
+    def wants(self, event: Event) -> bool:
+        return (self.kinds is None or event.kind in self.kinds) and (self.venue is None or event.venue == self.venue)
+
+    def put(self, event: Event) -> None:
+        with self._ready:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(event)
+            self._ready.notify()
+
+    def get(self, timeout: float = None) -> Event:
+        """
+        Return the next event, waiting up to timeout seconds (forever if None)
+        for one to arrive, or None if none did or the subscription is closed.
+        """
+        with self._ready:
+            self._ready.wait_for(lambda: self._queue or self._closed, timeout)
+            return self._queue.popleft() if self._queue else None
+
+    def drain(self) -> list[Event]:
+        """
+        Return all queued events without waiting.
+        """
+        with self._ready:
+            events = list(self._queue)
+            self._queue.clear()
+            return events
+
+    def close(self) -> None:
+        with self._ready:
+            self._closed = True
+            self._ready.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+
+# pytockData
+#
+# Our shared data state, by venue id.
+#
+pytockData = { }
+
+# _venuesLock
+#
+# Guards creating venues in pytockData, and _sessionVenues.
+#
+_venuesLock = threading.Lock()
+
+# _sessionVenues
+#
+# The venue each browser session last ran a script for, by session id. Entries
+# of sessions that have gone are dropped by rerun_sessions().
+#
+_sessionVenues = { }
+
+# _subscriptions
+#
+# The change feed's subscribers, guarded by _feedLock.
+#
+_subscriptions = [ ]
+_feedLock = threading.Lock()
+
+# _run
+#
+# The venue of the script run executing on this thread, if any, and its
+# snapshot as a tuple (venue id, data, versions).
+#
+_run = threading.local()
 
 # rerun_sessions
 #
-# Change notification to other tabs/browsers.  These functions identify the 
+# Change notification to other tabs/browsers.  These functions identify the
 # browser sessions connected to our unified backend and cause them to rerun
-# and thus update.
+# and thus update. Only the sessions showing the changed venue are rerun, and
+# their number is recorded as the fan-out.
 #
-def rerun_sessions() -> None:
+@pytock_metrics.timed("rerun_sessions")
+def rerun_sessions(venueId: str = None) -> None:
     def get_streamlit_sessions() -> list[AppSession]:
+        if not Runtime.exists():
+            return []                                       # headless, e.g. trace replay
         runtime: Runtime = Runtime.instance()
         return [s.session for s in runtime._session_mgr.list_sessions()]
 
-    for session in get_streamlit_sessions():
+    venueId = current_venue(venueId)
+    connected = get_streamlit_sessions()
+    with _venuesLock:
+        if Runtime.exists() and len(_sessionVenues) > len(connected):
+            live = {session.id for session in connected}
+            for sessionId in [each for each in _sessionVenues if each not in live]:
+                del _sessionVenues[sessionId]
+        sessions = [session for session in connected
+                    if _sessionVenues.get(session.id, DEFAULT_VENUE) == venueId]
+    pytock_metrics.observe("rerun_fanout_sessions", len(sessions), venue=venueId)
+    for session in sessions:
        session._handle_rerun_script_request(session._client_state)
 
-# pytockData
+# rerun
 #
-# Our shared data state.
+# Rerun just the given browser sessions, e.g. those waiting for a result that
+# was computed in the background, rather than every session of a venue.
 #
-pytockData = { }
+def rerun(sessionIds) -> None:
+    if not sessionIds or not Runtime.exists():
+        return
+    for managed in Runtime.instance()._session_mgr.list_sessions():
+        if managed.session.id in sessionIds:
+            managed.session._handle_rerun_script_request(managed.session._client_state)
 
 # getinit
 #
@@ -40,35 +233,239 @@ def getinit():
     global pytockData
     return pytockData
 
-# get
+# current_venue
 #
-# Get the specified shared data by key, or None if unset. This copies the data
-# in order to detect changes.
+# Resolve a venue id: the one given, else that of this thread's script run,
+# else DEFAULT_VENUE.
 #
-def get(key):
+def current_venue(venueId: str = None) -> str:
+    return venueId or getattr(_run, "venue", None) or DEFAULT_VENUE
+
+# session
+#
+# Return the id of the browser session whose script runs on this thread, or
+# None for background and headless work.
+#
+def session() -> str:
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+# venue
+#
+# Get the shared state of a venue, creating it on first use.
+#
+def venue(venueId: str = None) -> Venue:
     global pytockData
     getinit()
-    if key in pytockData:
-        data = pytockData[key]
-        if isinstance(data, (list,dict)):
-            data = data.copy()
-        return data
+    venueId = current_venue(venueId)
+    state = pytockData.get(venueId)
+    if state is None:
+        with _venuesLock:
+            state = pytockData.setdefault(venueId, Venue(venueId))
+    return state
+
+# venues
+#
+# List the ids of the venues that have shared state.
+#
+def venues() -> list[str]:
+    getinit()
+    with _venuesLock:
+        return list(pytockData)
+
+# lock
+#
+# Return the venue's lock, held around read-modify-write sequences on its
+# shared data, so that sessions and background tasks changing the same key do
+# not overwrite each other. It is reentrant so that an operation may call
+# others that also take it.
+#
+def lock(venueId: str = None) -> threading.RLock:
+    return venue(venueId).lock
+
+# begin_run
+#
+# Start a script run for a venue on this thread: record which venue the session
+# shows and take the run's snapshot. Only the top-level dictionaries are
+# copied; the stored data itself is shared.
+#
+def begin_run(venueId: str = None) -> None:
+    venueId = venueId or DEFAULT_VENUE
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx:
+        with _venuesLock:
+            _sessionVenues[ctx.session_id] = venueId
+    state = venue(venueId)
+    with state.lock:
+        _run.venue = venueId
+        _run.snapshot = (venueId, dict(state.data), dict(state.versions))
+
+# end_run
+#
+# Drop the snapshot when the script run ends, so that callbacks and background
+# work on this thread read the latest data.
+#
+def end_run() -> None:
+    _run.snapshot = None
+    _run.venue = None
+
+def _snapshot(venueId: str):
+    snapshot = getattr(_run, "snapshot", None)
+    if snapshot and snapshot[0] == venueId:
+        return snapshot
     return None
 
+# get
+#
+# Get the specified shared data by key, or None if unset. Within a script run
+# this is the run's snapshot, otherwise the latest data. The data is immutable
+# and shared, so it is not copied.
+#
+def get(key, venueId: str = None):
+    venueId = current_venue(venueId)
+    snapshot = _snapshot(venueId)
+    if snapshot:
+        return snapshot[1].get(key)
+    return latest(key, venueId)
+
+# latest
+#
+# Get the latest shared data by key regardless of any run snapshot. Writers
+# use this under the lock to change the current data.
+#
+def latest(key, venueId: str = None):
+    return venue(venueId).data.get(key)
+
+# version
+#
+# Get the version of the shared data by key as seen by get(), or 0 if unset.
+#
+def version(key, venueId: str = None) -> int:
+    venueId = current_venue(venueId)
+    snapshot = _snapshot(venueId)
+    if snapshot:
+        return snapshot[2].get(key, 0)
+    return venue(venueId).versions.get(key, 0)
+
 # set
 #
-# Set the specified shared data by key and notify of changes. This copies the
-# data in order to detect changes. This makes the assumption that the changes we
-# want to detect are in the top-level container being stored, so it only does a
-# shallow copy. This way the streamlit cache resource here has its own container
-# and can detect changes such as added or deleted bookings and tables. Were we
-# to allow mutating table and booking objects then this would need a deep copy.
+# Set the specified shared data by key and notify of changes. Lists are frozen
+# into a tuple. A dictionary is not copied but published as a read-only view,
+# so the caller hands it over: writers build a fresh dictionary under the lock
+# and must not change it once set, which keeps a change to a large dictionary
+# from costing a second copy.
+# The change is also applied to this thread's run snapshot, if any, so that a
+# page sees its own changes. Were we to allow mutating table and booking objects
+# then this would need a deep copy.
+#
+@pytock_metrics.timed("data_set")
+def set(key, data, venueId: str = None):
+    state = venue(venueId)
+    if isinstance(data, list):
+        data = tuple(data)
+    elif isinstance(data, dict):
+        data = types.MappingProxyType(data)
+    with state.lock:
+        if key in state.data and state.data[key] == data:
+            return
+        state.data[key] = data
+        state.versions[key] = state.versions.get(key, 0) + 1
+        snapshot = _snapshot(state.id)
+        if snapshot:
+            snapshot[1][key] = data
+            snapshot[2][key] = state.versions[key]
+    if isinstance(data, (tuple, types.MappingProxyType)):
+        pytock_metrics.gauge("stored_items", len(data), key=key, venue=state.id)
+    pytock_metrics.inc("changes_total", key=key, venue=state.id)
+    rerun_sessions(state.id)
+
+# derive
+#
+# Return builder(get(key)), computed once per version of the key and shared by
+# all sessions. The key may also be a tuple of keys, in which case the builder
+# is passed each key's data and the result is kept until any of them changes.
+# The result must be treated as read-only.
+#
+def derive(key, name, builder, venueId: str = None):
+    state = venue(venueId)
+    keys = key if isinstance(key, tuple) else (key,)
+    current = tuple(version(each, state.id) for each in keys)
+    cached = state.derived.get((key, name))
+    if cached and cached[0] == current:
+        return cached[1]
+    result = builder(*[get(each, state.id) for each in keys])
+    with state.lock:
+        cached = state.derived.get((key, name))
+        if not cached or cached[0] < current:
+            state.derived[(key, name)] = (current, result)
+    return result
+
+# reset
+#
+# Forget all shared data of every venue, giving a fresh store. This is for
+# headless use such as trace replay; a running server has no reason to call it.
+# Subscriptions limited to a venue belong to that venue's resources, such as
+# the rendered fragments, and are closed with them; those to all venues belong
+# to background consumers and carry on.
 #
-def set(key, data):
+def reset() -> None:
     global pytockData
     getinit()
-    if key not in pytockData or pytockData[key] != data:
-        if isinstance(data, (list,dict)):
-            data = data.copy()
-        pytockData[key] = data
-        rerun_sessions()
+    with _venuesLock:
+        pytockData.clear()
+    with _feedLock:
+        closing = [subscription for subscription in _subscriptions if subscription.venue is not None]
+        _subscriptions[:] = [subscription for subscription in _subscriptions if subscription.venue is None]
+    for subscription in closing:
+        subscription.close()
+
+# resource
+#
+# Get the shared helper object for the key, creating it with factory() if it
+# does not exist yet. Callers hold the lock while changing it.
+#
+def resource(key, factory, venueId: str = None):
+    state = venue(venueId)
+    with state.lock:
+        if key not in state.resources:
+            state.resources[key] = factory()
+        return state.resources[key]
+
+# subscribe
+#
+# Start receiving change events, optionally only of the given kinds and only for
+# one venue, returning the Subscription to read them from.
+#
+def subscribe(kinds=None, venueId: str = None, maxsize: int = FEED_QUEUE) -> Subscription:
+    subscription = Subscription(kinds, venueId, maxsize)
+    with _feedLock:
+        _subscriptions.append(subscription)
+    return subscription
+
+# unsubscribe
+#
+# Stop a subscription, waking any consumer waiting on it.
+#
+def unsubscribe(subscription: Subscription) -> None:
+    with _feedLock:
+        if subscription in _subscriptions:
+            _subscriptions.remove(subscription)
+    subscription.close()
+
+# publish
+#
+# Send a change event to the subscribers that want it. Writers call this under
+# the venue lock right after storing the change, so that each venue's events
+# arrive in the order of its versions. Only the count is kept when no one
+# listens.
+#
+def publish(kind: str, key: str, item, venueId: str = None) -> None:
+    state = venue(venueId)
+    pytock_metrics.inc("events_total", kind=kind, venue=state.id)
+    if not _subscriptions:
+        return
+    event = Event(kind, state.id, key, state.versions.get(key, 0), item)
+    with _feedLock:
+        subscribers = [subscription for subscription in _subscriptions if subscription.wants(event)]
+    for subscription in subscribers:
+        subscription.put(event)
@@ -0,0 +1,351 @@
+#
+# pytock_loadtest.py
+#
+# Multi-session load test for the pytock application. Every change makes
+# rerun_sessions() rerun each session showing the venue, so the cost of a change
+# grows with the number of open tabs. This opens N headless sessions of
+# pytock.py with Streamlit's AppTest, spread over the Booking, Table Status and
+# Table Management pages, and has some of them make bookings and walk-ins
+# through the page widgets. After each change that is stored every session,
+# the writer's too, is rerun, as the server would, and the rerun latencies,
+# the time until the last session is up to date, CPU time and memory are
+# measured for each N:
+#
+# Usage: python pytock_loadtest.py [--sessions 1,10,50,100,200] [--changes C] [--writers F]
+#                                  [--tables T] [--json report.json] [--compare base.json]
+#
+#   --json     write the report, e.g. one per build
+#   --compare  print the changes from an earlier report, N by N
+#
+# AppTest runs one script at a time per process, so the reruns of a change are
+# made one after another. A server runs them on a thread per session but they
+# share one interpreter, so the fan-out time measured here is close to the
+# time the last tab waits. The store, the clock and the rerun hook are those of
+# this process, and pytock_data.rerun_sessions() is replaced by a counter since
+# the sessions are rerun here.
+#
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pytock_clock
+import pytock_data
+import restaurant
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytock.py")
+PAGES = ["page1_booking.py", "page3_status.py", "page2_tables.py"]
+TIMEOUT = 60                                            # seconds one script run may take
+FIRST_HOUR, LAST_HOUR = 8, 22                           # booking times used by the writers
+
+
+# rss_mb
+#
+# Current resident memory of this process in MB, or the peak where the
+# current figure is not available.
+#
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def quantile(samples: list[float], q: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * q))] if samples else 0.0
+
+
+#
+# Session class
+#
+# One simulated browser tab: an AppTest showing one page. Writers on the Booking
+# page book tables in turn through the booking form; writers on the Table
+# Management page take and release tables for walk-ins.
+#
+
+class Session:
+    """
+    A Session object drives one headless session of the app.
+    """
+
+    def __init__(self, number: int, page: str):
+        from streamlit.testing.v1 import AppTest
+
+        self.number = number
+        self.page = page
+        self.writes = 0
+        self.errors = 0
+        self.app = AppTest.from_file(APP, default_timeout=TIMEOUT)
+        self.run()
+        self.app.switch_page(page)
+        self.run()
+        if self.app.exception:
+            raise RuntimeError(f"session {number} cannot open {page}: {self.app.exception[0].message}")
+
+    def run(self) -> float:
+        """
+        Rerun the session's script, returning the seconds it took.
+        """
+        started = time.perf_counter()
+        self.app.run()
+        elapsed = time.perf_counter() - started
+        if self.app.exception:
+            self.errors += 1
+        return elapsed
+
+    def write(self, tablenames: list[str]) -> float:
+        """
+        Make one change through the page and run the script that makes it,
+        returning the seconds that run took, or None if the page offered no
+        change to make.
+        """
+        step = self.writes * 7 + self.number                # spread the writers over tables and times
+        tablename = tablenames[step % len(tablenames)]
+        self.writes += 1
+        if self.page == "page1_booking.py":
+            slot = (step // len(tablenames)) % ((LAST_HOUR - FIRST_HOUR) // 2 + 1)
+            self.app.text_input(key="book_name").set_value(f"Load Guest {self.number}-{self.writes}")
+            self.app.text_input(key="book_phone").set_value(f"+7 900 {self.number:03d} {self.writes:04d}")
+            self.app.selectbox(key="book_tablename").set_value(tablename)
+            self.app.time_input(key="book_from").set_value(datetime.time(FIRST_HOUR + 2 * slot))
+            label = "Submit"
+        else:
+            self.app.selectbox(key="man_tablename").set_value(tablename)
+            self.run()
+            label = next((button.label for button in self.app.button
+                          if button.label in ("Take the table", "Release the table") and not button.disabled), None)
+            if label is None:
+                return None
+        next(button for button in self.app.button if button.label == label).click()
+        return self.run()
+
+
+#
+# LoadTest class
+#
+# Runs the levels of sessions and collects one report row per level.
+#
+
+class LoadTest:
+    """
+    A LoadTest object measures rerun cost against the number of sessions.
+    """
+
+    def __init__(self, changes: int = 20, writers: float = 0.1, tables: int = 30):
+        self.changes = changes
+        self.writers = writers
+        self.tables = tables
+        self.fanouts = 0
+        self.clock = pytock_clock.FixedClock(datetime.datetime.combine(datetime.date.today(), datetime.time(6)))
+
+    def __fanout(self, venueId: str = None) -> None:
+        self.fanouts += 1
+
+    def level(self, count: int) -> dict:
+        """
+        Measure one number of sessions on a fresh store.
+
+        Args:
+            count: number of sessions.
+
+        Returns:
+            dictionary of the measurements, times in ms and memory in MB.
+
+        Raises:
+            RuntimeError if a session cannot be opened.
+        """
+        pytock_data.reset()
+        pytock_clock.set_clock(self.clock)
+        pytock_data.rerun_sessions = self.__fanout
+        tables = restaurant.Tables()
+        for number in range(len(tables.tables) + 1, self.tables + 1):
+            tables.createTable(f"Table {number}", restaurant.Tables.DEF_SEATS)
+        tablenames = restaurant.Tables().namelist()
+
+        gc.collect()
+        tracemalloc.start()                             # heap held by the sessions, as RSS is seldom returned
+        began = time.perf_counter()
+        sessions = [Session(number, PAGES[number % len(PAGES)]) for number in range(count)]
+        opened = time.perf_counter() - began
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        active = [session for session in sessions if session.page != "page3_status.py"]
+        active = active[:max(1, round(count * self.writers))]
+
+        writes, reruns, fanouts = [ ], [ ], [ ]
+        stored = 0
+        self.fanouts = 0
+        cpu = cpu_seconds()
+        began = time.perf_counter()
+        for change in range(self.changes):
+            writer = active[change % len(active)]
+            before = self.fanouts
+            took = writer.write(tablenames)
+            if took is None:
+                continue                                    # nothing to change on the page
+            writes.append(took)
+            if self.fanouts == before:
+                continue                                    # refused, so no session is rerun
+            stored += 1
+            started = time.perf_counter()
+            for session in sessions:                        # the writer's session is rerun too
+                reruns.append(session.run())
+            fanouts.append(time.perf_counter() - started)
+        elapsed = time.perf_counter() - began
+        cpu = cpu_seconds() - cpu
+
+        writes.sort()
+        reruns.sort()
+        fanouts.sort()
+        row = {
+            "sessions": count,
+            "writers": len(active),
+            "changes": self.changes,
+            "stored": stored,                                   # changes that were not refused
+            "rerun_calls": self.fanouts,                        # rerun_sessions() calls they made
+            "reruns": len(reruns),
+            "errors": sum(session.errors for session in sessions),
+            "open_s": opened,
+            "write_ms_p50": quantile(writes, 0.5) * 1000,
+            "rerun_ms_mean": statistics.fmean(reruns) * 1000 if reruns else 0.0,
+            "rerun_ms_p50": quantile(reruns, 0.5) * 1000,
+            "rerun_ms_p95": quantile(reruns, 0.95) * 1000,
+            "rerun_ms_p99": quantile(reruns, 0.99) * 1000,
+            "rerun_ms_max": reruns[-1] * 1000 if reruns else 0.0,
+            "fanout_ms_mean": statistics.fmean(fanouts) * 1000 if fanouts else 0.0,
+            "fanout_ms_p95": quantile(fanouts, 0.95) * 1000,
+            "cpu_ms_per_rerun": cpu * 1000 / max(len(reruns) + len(writes), 1),
+            "cpu_utilization": cpu / elapsed if elapsed else 0.0,
+            "rss_mb": rss_mb(),
+            "mb_per_session": memory / 2**20 / count,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        del sessions, active
+        gc.collect()
+        return row
+
+    def run(self, counts: list[int]) -> dict:
+        """
+        Measure each number of sessions in turn.
+
+        Args:
+            counts: list of session counts.
+
+        Returns:
+            The report: "build", "settings" and one row per count in "levels".
+
+        Raises:
+            RuntimeError if a session cannot be opened.
+        """
+        rerun = pytock_data.rerun_sessions
+        try:
+            levels = [ ]
+            for count in counts:
+                levels.append(self.level(count))
+                print_row(levels[-1], file=sys.stderr)      # progress, as levels take a while
+        finally:
+            pytock_data.rerun_sessions = rerun
+            pytock_clock.set_clock(None)
+        return {
+            "build": build(),
+            "settings": {"changes": self.changes, "writers": self.writers, "tables": self.tables},
+            "levels": levels,
+        }
+
+
+# build
+#
+# Identify the build measured, so that reports can be told apart.
+#
+def build() -> dict:
+    import streamlit
+    try:
+        commit = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                                cwd=os.path.dirname(APP), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "streamlit": streamlit.__version__,
+            "machine": platform.machine(), "when": datetime.datetime.now().isoformat(timespec="seconds")}
+
+
+# print_row / print_report / print_comparison
+#
+# Print reports as text tables.
+#
+COLUMNS = [("sessions", "N", "{:>5}"), ("rerun_ms_p50", "p50 ms", "{:>9.1f}"), ("rerun_ms_p95", "p95 ms", "{:>9.1f}"),
+           ("fanout_ms_mean", "fanout ms", "{:>11.1f}"), ("cpu_ms_per_rerun", "cpu ms", "{:>9.1f}"),
+           ("rss_mb", "rss MB", "{:>9.1f}"), ("mb_per_session", "MB/sess", "{:>9.2f}"), ("errors", "errors", "{:>8}")]
+
+def print_header(file=None) -> None:
+    print("".join(title.rjust(len(spec.format(0))) for key, title, spec in COLUMNS), file=file)
+
+def print_row(row: dict, file=None) -> None:
+    print("".join(spec.format(row[key]) for key, title, spec in COLUMNS), file=file)
+
+def print_report(report: dict) -> None:
+    print(f"build {report['build']['commit']}, {report['settings']['changes']} changes per level")
+    print_header()
+    for row in report["levels"]:
+        print_row(row)
+
+def print_comparison(report: dict, base: dict) -> None:
+    print(f"build {report['build']['commit']} against {base['build']['commit']} (ratio new/old)")
+    print_header()
+    before = {row["sessions"]: row for row in base["levels"]}
+    for row in report["levels"]:
+        old = before.get(row["sessions"])
+        if old is None:
+            continue
+        print("".join("{:>5}".format(row[key]) if key == "sessions" else
+                      "{:>{}}".format(f"{row[key] / old[key]:.2f}x" if old[key] else "-", len(spec.format(0)))
+                      for key, title, spec in COLUMNS))
+
+
+# main
+#
+# Run the load test from the command line.
+#
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the pytock pages with many headless sessions.")
+    parser.add_argument("--sessions", default="1,10,50,100,200", help="session counts, comma separated")
+    parser.add_argument("--changes", type=int, default=20, help="changes made at each count")
+    parser.add_argument("--writers", type=float, default=0.1, help="fraction of sessions that make changes")
+    parser.add_argument("--tables", type=int, default=30, help="tables on the floor")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="earlier report to compare with")
+    options = parser.parse_args(argv)
+
+    from streamlit import logger
+    logger.set_log_level("error")                       # AppTest warns of every thread it did not start
+    os.chdir(os.path.dirname(APP))                      # the pages' paths are relative, as for streamlit run
+    counts = [int(each) for each in options.sessions.split(",") if each.strip()]
+    report = LoadTest(options.changes, options.writers, options.tables).run(counts)
+    if options.json:
+        with open(options.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    print_report(report)
+    if options.compare:
+        with open(options.compare, encoding="utf-8") as file:
+            print_comparison(report, json.load(file))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#
+# pytock_maintenance.py
+#
+# Housekeeping jobs for the pytock application, scheduled on the server's
+# workers (see pytock_workers.py) so that none of it runs on a session's
+# script thread:
+#
+#   expiry_sweep        expire bookings when due and archive them
+#   archive_compaction  compact the archive files of past days
+#   table_gc            remove the bookings of deleted tables
+#   customer_gc         forget the customers with nothing left stored
+#
+# Table deletions are learned from the pytock_data change feed, so the garbage
+# collection job only does work for the venues that had a table deleted.
+#
+
+import datetime
+
+import pytock_archive
+import pytock_clock
+import pytock_data
+import pytock_sweeper
+import restaurant
+
+COMPACTION_INTERVAL = datetime.timedelta(hours=1)
+GC_INTERVAL = datetime.timedelta(seconds=5)
+CUSTOMER_GC_INTERVAL = datetime.timedelta(hours=1)
+
+_collector = None
+
+
+#
+# TableCollector class
+#
+# Follows table deletions on the change feed and collects the bookings of the
+# deleted tables, venue by venue.
+#
+
+class TableCollector:
+    """
+    A TableCollector object removes bookings of deleted tables in the background.
+    """
+
+    def __init__(self):
+        self.collected = 0
+        self._feed = pytock_data.subscribe({"table_deleted"})
+
+    def collect(self) -> int:
+        """
+        Collect for the venues that deleted tables since the last run. If
+        events were dropped every venue is collected.
+
+        Args:
+            None.
+
+        Returns:
+            The number of bookings and rules removed.
+
+        Raises:
+            None.
+        """
+        dropped, self._feed.dropped = self._feed.dropped, 0
+        venues = {event.venue for event in self._feed.drain()}
+        if dropped:
+            venues.update(pytock_data.venues())
+        removed = sum(restaurant.Bookings(venue).collectGarbage() for venue in sorted(venues))
+        self.collected += removed
+        return removed
+
+    def close(self) -> None:
+        pytock_data.unsubscribe(self._feed)
+
+
+# forget_customers
+#
+# Forget the customer records that no venue's bookings or rules refer to any
+# more, and return how many.
+#
+def forget_customers() -> int:
+    return sum(restaurant.Bookings(venue).forgetCustomers() for venue in pytock_data.venues())
+
+# start
+#
+# Schedule the housekeeping jobs on the workers, once any archive files from
+# before venues are moved to the default venue's directory. The collector of
+# workers started before is closed, so that its feed subscription goes too.
+#
+def start(workers) -> None:
+    global _collector
+    pytock_archive.migrate()
+    pytock_sweeper.start(workers, onExpired=pytock_archive.on_expired)
+    workers.schedule("archive_compaction", lambda: pytock_archive.compact_venues(pytock_clock.today()),
+                     COMPACTION_INTERVAL)
+    if _collector is not None:
+        _collector.close()
+    _collector = TableCollector()
+    workers.schedule("table_gc", _collector.collect, GC_INTERVAL)
+    workers.schedule("customer_gc", forget_customers, CUSTOMER_GC_INTERVAL)
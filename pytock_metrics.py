@@ -0,0 +1,260 @@
+#
+# pytock_metrics.py
+#
+# Operation metrics for the pytock application. Counters, gauges and latency
+# histograms are kept in a process-wide registry, which like the pytock_data
+# shared state is common to every session/browser connected to this server.
+# The registry can be shown on the Metrics page, written to a file in the
+# Prometheus text exposition format, or served from a small local endpoint.
+#
+# Usage:
+#
+#   @pytock_metrics.timed("bookings_add")           # latency histogram
+#   def add(...): ...
+#
+#   with pytock_metrics.timer("data_set"): ...      # same, for a block
+#   pytock_metrics.observe("rerun_fanout_sessions", len(sessions))
+#   pytock_metrics.gauge("stored_items", len(data), key="restaurant_bookings")
+#
+
+import bisect
+import functools
+import http.server
+import os
+import threading
+import time
+
+# bucket upper bounds, in seconds for latencies and in items for sizes
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+# metric families: name -> (type, help text, buckets)
+FAMILIES = {
+    "operation_seconds": ("histogram", "Latency of instrumented pytock operations.", LATENCY_BUCKETS),
+    "rerun_fanout_sessions": ("histogram", "Sessions asked to rerun for each change.", COUNT_BUCKETS),
+    "changes_total": ("counter", "Changes stored in the shared data, by key.", None),
+    "stored_items": ("gauge", "Items held by each shared data key.", None),
+    "events_total": ("counter", "Change events published to the feed, by kind.", None),
+    "reminders_total": ("counter", "Reminders queued, retried and finished, by state.", None),
+    "profiles_total": ("counter", "Script reruns profiled, by page.", None),
+}
+
+# default Prometheus file and endpoint, overridable from the environment
+METRICS_FILE = os.environ.get("PYTOCK_METRICS_FILE", "pytock_metrics.prom")
+METRICS_PORT = int(os.environ.get("PYTOCK_METRICS_PORT", "0"))
+
+
+#
+# Histogram class
+#
+# Cumulative-bucket histogram as Prometheus defines it, plus the sum and count.
+#
+
+class Histogram:
+    """
+    A Histogram object accumulates observations into fixed buckets.
+    """
+
+    def __init__(self, buckets: list[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)              # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket containing it.
+
+        Args:
+            q: quantile from 0.0 through 1.0.
+
+        Returns:
+            float, or None if nothing was observed.
+
+        Raises:
+            None.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+# registry
+#
+# Metric values keyed by (family, labels) where labels is a sorted tuple of
+# (name, value) pairs. A single lock keeps updates from sessions consistent.
+#
+_lock = threading.Lock()
+_values = { }
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+# inc
+#
+# Add to a counter.
+#
+def inc(name: str, amount: float = 1, **labels) -> None:
+    key = (name, _labels(labels))
+    with _lock:
+        _values[key] = _values.get(key, 0) + amount
+
+# gauge
+#
+# Set a gauge to the current value.
+#
+def gauge(name: str, value: float, **labels) -> None:
+    with _lock:
+        _values[(name, _labels(labels))] = value
+
+# observe
+#
+# Record one observation in a histogram.
+#
+def observe(name: str, value: float, **labels) -> None:
+    key = (name, _labels(labels))
+    with _lock:
+        histogram = _values.get(key)
+        if histogram is None:
+            histogram = _values[key] = Histogram(FAMILIES[name][2])
+        histogram.observe(value)
+
+# timer
+#
+# Context manager recording the elapsed time of a block as an operation latency.
+#
+class timer:
+    def __init__(self, op: str):
+        self.op = op
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe("operation_seconds", time.perf_counter() - self.started, op=self.op)
+        return False
+
+# timed
+#
+# Decorator recording the latency of every call of a function.
+#
+def timed(op: str):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(op):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# snapshot
+#
+# Return a copy of the registry for display, as {(family, labels): value} with
+# histograms copied so that the caller may read them without the lock.
+#
+def snapshot() -> dict:
+    with _lock:
+        output = { }
+        for key, value in _values.items():
+            if isinstance(value, Histogram):
+                copy = Histogram(value.buckets)
+                copy.counts, copy.sum, copy.count = value.counts.copy(), value.sum, value.count
+                value = copy
+            output[key] = value
+        return output
+
+# reset
+#
+# Forget all recorded values.
+#
+def reset() -> None:
+    with _lock:
+        _values.clear()
+
+# prometheus_text
+#
+# Render the registry in the Prometheus text exposition format.
+#
+def prometheus_text() -> str:
+    def labelText(labels: tuple, extra: tuple = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    values = snapshot()
+    lines = []
+    for family, (kind, text, buckets) in FAMILIES.items():
+        series = sorted((labels, value) for (name, labels), value in values.items() if name == family)
+        if not series:
+            continue
+        lines.append(f"# HELP pytock_{family} {text}")
+        lines.append(f"# TYPE pytock_{family} {kind}")
+        for labels, value in series:
+            if kind != "histogram":
+                lines.append(f"pytock_{family}{labelText(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + [float("inf")], value.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"pytock_{family}_bucket{labelText(labels, (('le', le),))} {cumulative}")
+            lines.append(f"pytock_{family}_sum{labelText(labels)} {value.sum}")
+            lines.append(f"pytock_{family}_count{labelText(labels)} {value.count}")
+    return "\n".join(lines) + "\n"
+
+# write_textfile
+#
+# Write the Prometheus text to a file, replacing it atomically so that a
+# collector such as the node_exporter textfile collector never sees a partial
+# file.
+#
+def write_textfile(path: str = METRICS_FILE) -> str:
+    temp = f"{path}.tmp"
+    with open(temp, "w") as file:
+        file.write(prometheus_text())
+    os.replace(temp, path)
+    return path
+
+# serve
+#
+# Serve the Prometheus text at http://host:port/metrics from a daemon thread.
+# The server is started at most once per process and is returned to callers.
+#
+_server = None
+
+def serve(port: int = METRICS_PORT, host: str = "127.0.0.1") -> http.server.HTTPServer:
+    global _server
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass                                            # keep scrapes out of the console
+
+    with _lock:
+        if _server is None:
+            _server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="pytock-metrics", daemon=True).start()
+    return _server
@@ -0,0 +1,503 @@
+#
+# pytock_outbox.py
+#
+# Reminder notifications for the pytock application. A guest is reminded of
+# their reservation REMINDER_LEAD before it starts. Sending is slow and can
+# fail, so it never happens on the path that makes a booking: the outbox
+# follows the pytock_data change feed and keeps a reminder for each booking and
+# each recurring occurrence of today or tomorrow, and a scheduled background
+# job dispatches the ones that are due:
+#
+#   PYTOCK_REMINDERS=stub streamlit run pytock.py
+#
+# The outbox is durable. Every change of a reminder is appended to a journal,
+#
+#   <OUTBOX_DIR>/reminders.jsonl
+#
+# one JSON object per line, the last line for a key being its state, so sent
+# reminders are not sent again after a restart. Bookings are kept only as long
+# as the process, so a restart cancels the pending reminders that no booking
+# is left for. The journal is rewritten without the finished reminders of past
+# bookings once it has grown to several times the reminders it holds.
+#
+# Each reminder has a key, e.g. "main:booking:5f0c2a9e:42" for booking 42 or
+# "main:rule:5f0c2a9e:7:2026-10-19" for an occurrence of rule 7, which
+# deduplicates it: queuing a key again, as a rescan of the store after lost
+# feed events does, changes nothing. Booking and rule ids start again with
+# each process, so keys carry the process's EPOCH to stay unique in the
+# journal. The key is also handed to the transport as an idempotency key. Due reminders are sent in batches of
+# BATCH_SIZE, CONCURRENCY batches at a time; a failed reminder is tried again
+# after an exponential backoff with jitter, up to MAX_ATTEMPTS times. Deleted
+# bookings and skipped occurrences cancel their reminders, and reminders that
+# would arrive after the booking started are dropped.
+#
+# Transports are pluggable (see Transport and register()); "stub" records the
+# messages it is given and can be told to be slow or to fail, for testing.
+# Bookings have only phones, so reminders are text messages for now.
+#
+
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+import pytock_clock
+import pytock_data
+import pytock_metrics
+import restaurant
+
+OUTBOX_DIR = os.environ.get("PYTOCK_OUTBOX_DIR", "outbox")
+TRANSPORT = os.environ.get("PYTOCK_REMINDERS", "")              # transport name, empty to disable
+ENABLED = bool(TRANSPORT)
+REMINDER_LEAD = datetime.timedelta(minutes=int(os.environ.get("PYTOCK_REMINDER_LEAD", "120")))
+BATCH_SIZE = int(os.environ.get("PYTOCK_OUTBOX_BATCH", "50"))
+CONCURRENCY = int(os.environ.get("PYTOCK_OUTBOX_CONCURRENCY", "4"))
+MAX_ATTEMPTS = 5
+BACKOFF = datetime.timedelta(seconds=10)                        # first retry delay, doubled each time
+MAX_BACKOFF = datetime.timedelta(minutes=10)
+SEND_TIMEOUT = 30.0                                             # seconds a dispatch waits for its batches
+DISPATCH_INTERVAL = datetime.timedelta(seconds=5)               # longest wait between dispatches
+KEPT = datetime.timedelta(days=1)                               # finished reminders kept after their booking
+COMPACT_RATIO = 4                                               # journal lines per reminder before rewriting
+EPOCH = uuid.uuid4().hex[:8]                                    # this process, in reminder keys
+
+KINDS = {"booking_added", "booking_deleted", "booking_expired", "rule_added", "rule_deleted",
+         "occurrence_skipped", "occurrence_expired"}
+STATES = ["pending", "sent", "cancelled", "failed"]
+
+_outbox = None
+
+
+#
+# Reminder class
+#
+# One reminder and its progress through the states
+#
+#   pending -> sent | failed
+#   pending -> cancelled
+#
+# Reminders are changed in place, by the dispatcher only.
+#
+
+class Reminder:
+    """
+    A Reminder object is one notification to a guest about a booking.
+    """
+
+    def __init__(self, key: str, venue: str, tablename: str, name: str, phone: str, start: datetime.datetime,
+                 due: datetime.datetime, state: str = "pending", attempts: int = 0,
+                 retryAt: datetime.datetime = None, error: str = None):
+        self.key = key
+        self.venue = venue
+        self.tablename = tablename
+        self.name = name
+        self.phone = phone
+        self.start = start
+        self.due = due
+        self.state = state
+        self.attempts = attempts
+        self.retryAt = retryAt or due
+        self.error = error
+
+    @classmethod
+    def forBooking(cls, key: str, venue: str, booking: restaurant.Booking) -> 'Reminder':
+        return cls(key, venue, booking.tablename, booking.name, booking.phone, booking.start,
+                   booking.start - REMINDER_LEAD)
+
+    @property
+    def text(self) -> str:
+        """The message sent to the guest."""
+        return (f"Reminder: {self.name}, your table {self.tablename} is booked for "
+                f"{self.start.strftime('%H:%M')} on {self.start.strftime('%d %b')}.")
+
+    def record(self) -> dict:
+        return {
+            "key": self.key, "venue": self.venue, "table": self.tablename, "name": self.name,
+            "phone": self.phone, "start": self.start.isoformat(), "due": self.due.isoformat(),
+            "state": self.state, "attempts": self.attempts, "retry": self.retryAt.isoformat(),
+            "error": self.error,
+        }
+
+    @classmethod
+    def fromRecord(cls, rec: dict) -> 'Reminder':
+        return cls(rec["key"], rec["venue"], rec["table"], rec["name"], rec["phone"],
+                   datetime.datetime.fromisoformat(rec["start"]), datetime.datetime.fromisoformat(rec["due"]),
+                   rec["state"], rec["attempts"], datetime.datetime.fromisoformat(rec["retry"]), rec["error"])
+
+
+#
+# Transport class
+#
+# How reminders leave the server. A transport is given a batch of reminders
+# and reports, by key, the ones it could not send; an exception fails the whole
+# batch. Batches may be sent from several threads at once.
+#
+
+class Transport:
+    """
+    A Transport object sends batches of reminders.
+    """
+
+    def send(self, reminders: list[Reminder]) -> dict:
+        """
+        Send a batch of reminders.
+
+        Args:
+            reminders: list of Reminder objects, with distinct keys.
+
+        Returns:
+            dictionary of key -> error text for the reminders not sent.
+
+        Raises:
+            Any exception, which fails the whole batch.
+        """
+        raise NotImplementedError
+
+
+class StubTransport(Transport):
+    """
+    A StubTransport object pretends to send reminders, keeping what it was
+    given. It waits `latency` seconds per batch and fails each reminder with
+    probability `failure`, for testing the dispatcher.
+    """
+
+    def __init__(self, latency: float = None, failure: float = None):
+        self.latency = float(os.environ.get("PYTOCK_STUB_LATENCY", "0")) if latency is None else latency
+        self.failure = float(os.environ.get("PYTOCK_STUB_FAILURE", "0")) if failure is None else failure
+        self.batches = 0
+        self.sent = [ ]                                 # (key, phone, text), in order sent
+        self._lock = threading.Lock()
+
+    def send(self, reminders: list[Reminder]) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        errors = {reminder.key: "stub failure" for reminder in reminders if random.random() < self.failure}
+        with self._lock:
+            self.batches += 1
+            self.sent.extend((reminder.key, reminder.phone, reminder.text)
+                             for reminder in reminders if reminder.key not in errors)
+        return errors
+
+
+TRANSPORTS = {"stub": StubTransport}
+
+# register
+#
+# Make a transport available by name, for PYTOCK_REMINDERS.
+#
+def register(name: str, factory) -> None:
+    TRANSPORTS[name] = factory
+
+
+#
+# Outbox class
+#
+# The reminders of all venues, the journal that keeps them and the dispatcher
+# that sends them. Reminders are fed from one subscription.
+#
+
+class Outbox:
+    """
+    An Outbox object queues reminders from booking changes and sends them
+    when due.
+    """
+
+    def __init__(self, transport: Transport, directory: str = None, concurrency: int = CONCURRENCY):
+        self.transport = transport
+        self.path = os.path.join(directory or OUTBOX_DIR, "reminders.jsonl")
+        self._lock = threading.Lock()
+        self._reminders = { }                           # key -> Reminder
+        self._changed = { }                             # key -> Reminder, not yet journaled
+        self._lines = 0                                 # lines in the journal
+        self._days = { }                                # venue -> date occurrences were queued for
+        self._pool = concurrent.futures.ThreadPoolExecutor(concurrency, thread_name_prefix="pytock-outbox")
+        self.__load()
+        self._feed = pytock_data.subscribe(KINDS)
+        venues = pytock_data.venues()
+        self.__rescan(venues)                                   # bookings made before we subscribed
+        for reminder in self._reminders.values():               # and of venues gone with a past process
+            if reminder.state == "pending" and reminder.venue not in venues:
+                self.__finish(reminder, "cancelled")
+
+    def __load(self) -> None:
+        """
+        Read the journal, the last line of each key winning.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    reminder = Reminder.fromRecord(json.loads(line))
+                except (ValueError, KeyError):
+                    continue                            # a line cut short by a crash
+                self._reminders[reminder.key] = reminder
+                self._lines += 1
+
+    #
+    # filling from the feed
+    #
+
+    def __queue(self, reminder: Reminder) -> None:
+        if reminder.key in self._reminders:
+            return                                      # deduplicated
+        if reminder.start <= pytock_clock.now():
+            return
+        self._reminders[reminder.key] = self._changed[reminder.key] = reminder
+        pytock_metrics.inc("reminders_total", state="queued")
+
+    def __finish(self, reminder: Reminder, state: str, error: str = None) -> None:
+        reminder.state = state
+        reminder.error = error
+        self._changed[reminder.key] = reminder
+        pytock_metrics.inc("reminders_total", state=state)
+
+    def __cancel(self, key: str) -> None:
+        reminder = self._reminders.get(key)
+        if reminder is not None and reminder.state == "pending":
+            self.__finish(reminder, "cancelled")
+
+    @staticmethod
+    def bookingKey(venue: str, booking: restaurant.Booking) -> str:
+        """
+        The reminder key of a booking in this process. A party at joined
+        tables gets one reminder, keyed by its first part.
+        """
+        if isinstance(booking, restaurant.RecurringBooking):
+            return f"{venue}:rule:{EPOCH}:{booking.ruleId}:{booking.start.date().isoformat()}"
+        if isinstance(booking, restaurant.JoinedBooking):
+            return f"{venue}:booking:{EPOCH}:{booking.parts[0]}"
+        return f"{venue}:booking:{EPOCH}:{booking.id}"
+
+    def __queueOccurrences(self, venue: str, rules) -> None:
+        today = pytock_clock.today()
+        for rule in rules:
+            for occurrence in rule.occurrences(today, today + datetime.timedelta(days=1)):
+                self.__queue(Reminder.forBooking(self.bookingKey(venue, occurrence), venue, occurrence))
+
+    def __rescan(self, venues) -> None:
+        """
+        Queue the reminders of every stored booking and near occurrence of
+        the venues and cancel the pending ones whose booking has gone.
+        """
+        for venue in venues:
+            byId = pytock_data.latest("restaurant_bookings", venue) or { }
+            rules = (pytock_data.latest("restaurant_rules", venue) or { }).values()
+            live = set()
+            for booking in byId.values():
+                if not isinstance(booking, restaurant.WalkinBooking):
+                    key = self.bookingKey(venue, booking)
+                    live.add(key)
+                    self.__queue(Reminder.forBooking(key, venue, booking))
+            self.__queueOccurrences(venue, rules)
+            today = pytock_clock.today()
+            self._days[venue] = today
+            live.update(self.bookingKey(venue, occurrence) for rule in rules
+                        for occurrence in rule.occurrences(today, today + datetime.timedelta(days=1)))
+            for reminder in list(self._reminders.values()):
+                if reminder.venue == venue and reminder.state == "pending" and reminder.key not in live:
+                    self.__finish(reminder, "cancelled")
+
+    def __fill(self) -> None:
+        """
+        Apply the feed events since the last dispatch. Called with our lock
+        held.
+        """
+        dropped, self._feed.dropped = self._feed.dropped, 0
+        events = self._feed.drain()
+        if dropped:
+            self.__rescan(pytock_data.venues())
+            return
+        for event in events:
+            item = event.item
+            if event.kind == "booking_added":
+                self.__queue(Reminder.forBooking(self.bookingKey(event.venue, item), event.venue, item))
+            elif event.kind in ("booking_deleted", "booking_expired", "occurrence_skipped", "occurrence_expired"):
+                self.__cancel(self.bookingKey(event.venue, item))
+            elif event.kind == "rule_added":
+                self.__queueOccurrences(event.venue, [item])
+            elif event.kind == "rule_deleted":
+                prefix = f"{event.venue}:rule:{EPOCH}:{item.id}:"
+                for key in [key for key in self._reminders if key.startswith(prefix)]:
+                    self.__cancel(key)
+        today = pytock_clock.today()
+        for venue in pytock_data.venues():
+            if self._days.get(venue) != today:          # a new day brings tomorrow's occurrences
+                self.__queueOccurrences(venue, (pytock_data.latest("restaurant_rules", venue) or { }).values())
+                self._days[venue] = today
+
+    #
+    # dispatching
+    #
+
+    def dispatch(self) -> int:
+        """
+        Queue the reminders of recent changes and send the ones that are due,
+        as a scheduled background job.
+
+        Args:
+            None.
+
+        Returns:
+            The number of reminders sent.
+
+        Raises:
+            OSError if the journal cannot be written.
+        """
+        with self._lock:
+            self.__fill()
+            now = pytock_clock.now()
+            due = [ ]
+            for reminder in self._reminders.values():
+                if reminder.state != "pending" or reminder.retryAt > now:
+                    continue
+                if reminder.start <= now:
+                    self.__finish(reminder, "cancelled", "booking started before it was sent")
+                else:
+                    due.append(reminder)
+            self.__journal()
+        # send without our lock, so the status never waits for a transport
+        due.sort(key=lambda reminder: reminder.due)
+        batches = [due[index:index + BATCH_SIZE] for index in range(0, len(due), BATCH_SIZE)]
+        futures = {self._pool.submit(self.__send, batch): batch for batch in batches}
+        done, late = concurrent.futures.wait(futures, SEND_TIMEOUT)
+        sent = 0
+        with self._lock:
+            for future, batch in futures.items():
+                if future in late:
+                    errors = {reminder.key: "timed out" for reminder in batch}
+                elif future.exception() is not None:
+                    errors = {reminder.key: repr(future.exception()) for reminder in batch}
+                else:
+                    errors = future.result() or { }
+                for reminder in batch:
+                    if reminder.key in errors:
+                        self.__retry(reminder, errors[reminder.key], now)
+                    else:
+                        self.__finish(reminder, "sent")
+                        sent += 1
+            self.__journal()
+        return sent
+
+    def __send(self, batch: list[Reminder]) -> dict:
+        with pytock_metrics.timer("reminder_batch"):
+            return self.transport.send(batch)
+
+    def __retry(self, reminder: Reminder, error: str, now: datetime.datetime) -> None:
+        reminder.attempts += 1
+        if reminder.attempts >= MAX_ATTEMPTS:
+            self.__finish(reminder, "failed", error)
+            logging.getLogger(__name__).warning("reminder %s failed: %s", reminder.key, error)
+            return
+        backoff = min(BACKOFF * 2 ** (reminder.attempts - 1), MAX_BACKOFF)
+        reminder.retryAt = now + backoff * random.uniform(0.5, 1.0)     # jitter spreads the retries
+        reminder.error = error
+        self._changed[reminder.key] = reminder
+        pytock_metrics.inc("reminders_total", state="retried")
+
+    def __journal(self) -> None:
+        """
+        Append the changed reminders to the journal, or rewrite it when it
+        has grown too long. Called with our lock held.
+        """
+        if not self._changed:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self._lines + len(self._changed) > COMPACT_RATIO * max(len(self._reminders), 100):
+            self.__compact()
+        else:
+            lines = "".join(json.dumps(reminder.record(), separators=(",", ":")) + "\n"
+                            for reminder in self._changed.values())
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(lines)
+                file.flush()
+                os.fsync(file.fileno())
+            self._lines += len(self._changed)
+        self._changed.clear()
+
+    def __compact(self) -> None:
+        oldest = pytock_clock.now() - KEPT
+        for key, reminder in list(self._reminders.items()):
+            if reminder.state != "pending" and reminder.start < oldest:
+                del self._reminders[key]
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as file:
+            file.writelines(json.dumps(reminder.record(), separators=(",", ":")) + "\n"
+                            for reminder in self._reminders.values())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{self.path}.tmp", self.path)
+        self._lines = len(self._reminders)
+
+    def wait(self) -> float:
+        """
+        Report the seconds until the next reminder or retry is due, at most
+        DISPATCH_INTERVAL, so that new bookings are queued promptly.
+        """
+        with self._lock:
+            due = min((reminder.retryAt for reminder in self._reminders.values() if reminder.state == "pending"),
+                      default=None)
+        wait = DISPATCH_INTERVAL
+        if due is not None:
+            wait = min(wait, max(due - pytock_clock.now(), datetime.timedelta(0)))
+        return wait.total_seconds()
+
+    def status(self) -> dict:
+        """
+        Count the reminders by state and list the pending and failed ones.
+
+        Args:
+            None.
+
+        Returns:
+            dictionary of "counts" by state and "reminders" rows, due first.
+
+        Raises:
+            None.
+        """
+        with self._lock:
+            counts = dict.fromkeys(STATES, 0)
+            rows = [ ]
+            for reminder in self._reminders.values():
+                counts[reminder.state] += 1
+                if reminder.state in ("pending", "failed"):
+                    rows.append({"venue": reminder.venue, "table": reminder.tablename, "name": reminder.name,
+                                 "start": reminder.start.strftime("%d %b %H:%M"), "due": reminder.due,
+                                 "state": reminder.state, "attempts": reminder.attempts, "error": reminder.error})
+            rows.sort(key=lambda row: row["due"])
+            for row in rows:
+                row["due"] = row["due"].strftime("%d %b %H:%M")
+            return {"counts": counts, "reminders": rows}
+
+    def close(self) -> None:
+        pytock_data.unsubscribe(self._feed)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# start
+#
+# Create the server's outbox with the configured transport and schedule its
+# dispatcher on the workers.
+#
+def start(workers, transport: Transport = None, directory: str = None) -> Outbox:
+    global _outbox
+    if transport is None:
+        if TRANSPORT not in TRANSPORTS:
+            raise ValueError(f"unknown reminder transport '{TRANSPORT}'")
+        transport = TRANSPORTS[TRANSPORT]()
+    if _outbox is not None:
+        _outbox.close()
+    _outbox = Outbox(transport, directory)
+    workers.schedule("reminders", _outbox.dispatch, DISPATCH_INTERVAL, delay=_outbox.wait)
+    return _outbox
+
+# instance
+#
+# The server's outbox, or None before start().
+#
+def instance() -> Outbox:
+    return _outbox
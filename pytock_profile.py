@@ -0,0 +1,163 @@
+#
+# pytock_profile.py
+#
+# On-demand profiling of script reruns for the pytock application. When a page
+# is slow in production, profile its reruns, including the restaurant and
+# pytock_data calls they make, by opening it with ?profile=1 (?profile=0 to
+# stop) or by switching profiling on for every session on the Metrics page.
+# Profiling every session slows the whole server, so that switch and the
+# profiles are offered only to admins, who give the PYTOCK_ADMIN password on
+# the Metrics page; without it set there are no admins. Each profiled rerun
+# leaves two files in a rotating directory,
+#
+#   <PROFILE_DIR>/<time>-<n>-<page>.prof    cProfile data, e.g. for snakeviz
+#   <PROFILE_DIR>/<time>-<n>-<page>.txt     summary of the top hot spots
+#
+# of which the newest PROFILE_KEEP pairs are kept. The time is that of
+# pytock_clock, as in the summary, and n counts the profiles written, so that
+# names stay unique and in order under a fixed or replayed clock. When profiling is off a
+# rerun costs one flag test. The files are written by a background job, so a
+# profiled rerun pays only for the profiler itself.
+#
+# cProfile can profile one thing at a time per process, so a rerun that starts
+# while another is being profiled is not profiled. Work done meanwhile by other
+# threads may show in a profile.
+#
+
+import cProfile
+import datetime
+import hmac
+import io
+import itertools
+import os
+import pstats
+import re
+import threading
+import time
+
+import pytock_clock
+import pytock_metrics
+import pytock_workers
+
+PROFILE_DIR = os.environ.get("PYTOCK_PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.environ.get("PYTOCK_PROFILE_KEEP", "50"))
+TOP = 25                                                # functions listed in each summary
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+ADMIN_PASSWORD = os.environ.get("PYTOCK_ADMIN", "")    # empty for no admins
+
+_switch = False                                         # profile every session's reruns
+_busy = threading.Lock()                                # held while a rerun is profiled
+_written = itertools.count()                            # profiles written, for their names
+
+
+# switched / switch
+#
+# Whether profiling is on for all sessions, and turning it on or off.
+#
+def switched() -> bool:
+    return _switch
+
+def switch(on: bool) -> None:
+    global _switch
+    _switch = bool(on)
+
+# admin
+#
+# Whether a password given on the Metrics page is the admin password.
+#
+def admin(password: str) -> bool:
+    return bool(ADMIN_PASSWORD) and hmac.compare_digest(password.encode(), ADMIN_PASSWORD.encode())
+
+# requested
+#
+# Interpret the ?profile= query parameter: None if absent, else whether it
+# asks for profiling.
+#
+def requested(value: str) -> bool:
+    if value is None:
+        return None
+    return value.strip().casefold() not in ("", "0", "off", "false", "no")
+
+# run
+#
+# Call func, profiling it if asked to and no other rerun is being profiled,
+# and return its result. The profile is written by a background job.
+#
+def run(func, name: str, enabled: bool, directory: str = None):
+    if not enabled or not _busy.acquire(blocking=False):
+        return func()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        profiler.enable()
+        try:
+            return func()
+        finally:
+            profiler.disable()
+    finally:
+        _busy.release()
+        elapsed = time.perf_counter() - started
+        pytock_metrics.inc("profiles_total", page=name)
+        workers = pytock_workers.instance()
+        if workers and workers.running:
+            workers.submit("profile_write", write, profiler, name, elapsed, directory)
+        else:
+            write(profiler, name, elapsed, directory)
+
+# write
+#
+# Write a profile and its summary, then drop the oldest beyond PROFILE_KEEP.
+#
+def write(profiler: cProfile.Profile, name: str, elapsed: float, directory: str = None) -> str:
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    when = pytock_clock.now()
+    page = re.sub(r"\W+", "_", name).strip("_") or "page"
+    base = os.path.join(directory, f"{when.strftime('%Y%m%d-%H%M%S-%f')}-{next(_written):06d}-{page}")
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(f"{base}.prof")
+    with open(f"{base}.txt", "w", encoding="utf-8") as file:
+        file.write(summary(stats, name, elapsed, when))
+    prune(directory)
+    return f"{base}.txt"
+
+# summary
+#
+# The hot spots of a profile as text: the project's functions by cumulative
+# time, then all functions by their own time.
+#
+def summary(stats: pstats.Stats, name: str, elapsed: float, when: datetime.datetime) -> str:
+    text = io.StringIO()
+    text.write(f"{name} rerun at {when.strftime('%Y-%m-%d %H:%M:%S')}: {elapsed * 1000:.1f} ms, "
+               f"{stats.total_calls} calls\n\n")
+    stats.stream = text
+    text.write("Project functions by cumulative time\n")
+    stats.sort_stats("cumulative").print_stats(re.escape(APP_DIR), TOP)
+    text.write("All functions by own time\n")
+    stats.sort_stats("tottime").print_stats(TOP)
+    return text.getvalue()
+
+# prune
+#
+# Remove the oldest profiles beyond PROFILE_KEEP.
+#
+def prune(directory: str = None) -> None:
+    names = profiles(directory)
+    for base in names[PROFILE_KEEP:]:
+        for suffix in (".prof", ".txt"):
+            try:
+                os.remove(f"{base}{suffix}")
+            except FileNotFoundError:
+                pass
+
+# profiles
+#
+# The profiles in the directory, newest first, as paths without suffix.
+#
+def profiles(directory: str = None) -> list[str]:
+    directory = directory or PROFILE_DIR
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name[:-4]) for name in sorted(names, reverse=True) if name.endswith(".txt")]
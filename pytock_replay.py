@@ -0,0 +1,281 @@
+#
+# pytock_replay.py
+#
+# Replay a trace recorded by pytock_trace against a fresh, headless store and
+# report throughput and per-operation latency. The pytock clock is driven from
+# the trace so that bookings land on the dates they were recorded with.
+#
+# Usage: python pytock_replay.py <trace> [--speed max|original|<factor>] [--json]
+#
+#   --speed max       run operations back to back (default)
+#   --speed original  keep the recorded gaps between operations
+#   --speed 4         keep the recorded gaps, four times faster
+#
+
+import argparse
+import datetime
+import json
+import statistics
+import sys
+import time
+
+import pytock_clock
+import pytock_data
+import pytock_trace
+import restaurant
+
+
+# decode
+#
+# Convert an encoded trace argument back into the object it stood for. Booking
+# ids differ between the recording and the replay, so ids maps recorded ids to
+# those of the replayed bookings.
+#
+def decode(value, ids: dict):
+    if not isinstance(value, dict):
+        return value
+    if "booking" in value:
+        tablename, name, phone, start, period = value["booking"]
+        booking = restaurant.Booking(tablename, name, phone, datetime.time.fromisoformat(start),
+                                     datetime.time.fromisoformat(period), ids.get(value["id"]))
+        ids.setdefault(value["id"], booking.id)
+        return booking
+    if "joined" in value:
+        tablename, name, phone, start, period, parts, tablenames, size = value["joined"]
+        booking = restaurant.JoinedBooking(tablename, name, phone, datetime.time.fromisoformat(start),
+                                           datetime.time.fromisoformat(period),
+                                           [ids.get(partId, partId) for partId in parts], tablenames, size,
+                                           ids.get(value["id"]))
+        ids.setdefault(value["id"], booking.id)
+        return booking
+    if "rule" in value:
+        tablename, name, phone, start, period, first, until, interval = value["rule"]
+        rule = restaurant.RecurringRule(tablename, name, phone, datetime.time.fromisoformat(start),
+                                        datetime.time.fromisoformat(period), datetime.date.fromisoformat(first),
+                                        until and datetime.date.fromisoformat(until), interval, ids.get(value["id"]))
+        ids.setdefault(value["id"], rule.id)
+        return rule
+    if "occurrence" in value:
+        return restaurant.RecurringBooking(decode(value["occurrence"], ids), datetime.date.fromisoformat(value["day"]))
+    if "walkin" in value:
+        booking = restaurant.WalkinBooking(value["walkin"], ids.get(value["id"]))
+        ids.setdefault(value["id"], booking.id)
+        return booking
+    if "party" in value:
+        name, size, priority, arrived = value["party"]
+        party = restaurant.Party(name, size, priority, datetime.datetime.fromisoformat(arrived), ids.get(value["id"]))
+        ids.setdefault(value["id"], party.id)
+        return party
+    if "filter" in value:
+        tablename, start, end, state, customer = value["filter"]
+        return restaurant.StatusFilter(tablename, start and datetime.time.fromisoformat(start),
+                                       end and datetime.time.fromisoformat(end), state, customer)
+    if "tables" in value:
+        return restaurant.Tables(value["tables"])
+    for kind in ("time", "datetime", "date"):
+        if kind in value:
+            return getattr(datetime, kind).fromisoformat(value[kind])
+    return value
+
+# operations whose first argument is a booking or rule id
+ID_OPERATIONS = {"Bookings.deleteId", "Bookings.find", "Bookings.deleteRule", "Bookings.skipOccurrence",
+                 "Bookings.leaveWaitlist"}
+
+# operations whose first argument is a booking made earlier
+REFERENCE_OPERATIONS = {"Bookings.delete"}
+
+# the ids of the bookings an operation created itself, as recorded with it
+RESULT_IDS = {
+    "Bookings.addJoined": lambda booking: list(booking.parts),
+    "Bookings.walkIn": lambda booking: [booking.id],
+}
+
+# referenced
+#
+# The recorded id of the booking or rule an encoded argument refers to.
+#
+def referenced(value):
+    if isinstance(value, dict):
+        return referenced(value["occurrence"]) if "occurrence" in value else value.get("id")
+    return value
+
+
+#
+# Replayer class
+#
+# Runs trace records in order. Like the pages, it keeps the most recently
+# loaded Tables and Bookings objects of each venue and applies operations to
+# them, so that a "load" in the trace costs what it cost when recorded. Traces
+# recorded before venues existed replay against the default venue.
+#
+# A booking or rule referred to by a recorded id must have been made earlier in
+# the trace. One that cannot be mapped to a replayed booking is counted as a
+# mismatch, and the operation is skipped rather than run on the wrong booking.
+#
+
+class Replayer:
+    """
+    A Replayer object runs trace records against the shared store and collects
+    per-operation latencies.
+    """
+
+    def __init__(self, speed: float = None):
+        self.speed = speed                                  # None for as fast as possible
+        self.clock = pytock_clock.FixedClock()
+        self.latencies = { }
+        self.ids = { }
+        self.mismatches = 0
+        self.unmapped = 0
+        self.count = 0
+        self.elapsed = 0.0
+        self.collections = { }                              # (kind, venue) -> collection
+
+    def run(self, records) -> None:
+        """
+        Replay an iterable of trace records from a fresh store.
+
+        Args:
+            records: iterable of records as yielded by pytock_trace.read().
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        pytock_data.reset()
+        pytock_clock.set_clock(self.clock)
+        try:
+            began = time.perf_counter()
+            firstStamp = None
+            for stamp, when, op, args, outcome, *rest in records:
+                if firstStamp is None:
+                    firstStamp = stamp
+                if self.speed:
+                    delay = (stamp - firstStamp) / self.speed - (time.perf_counter() - began)
+                    if delay > 0:
+                        time.sleep(delay)
+                self.clock.set(datetime.datetime.fromisoformat(when))
+                if (op in ID_OPERATIONS or op in REFERENCE_OPERATIONS) and args \
+                        and referenced(args[0]) not in self.ids:
+                    self.unmapped += 1
+                    self.mismatches += 1
+                    continue
+                args = [decode(arg, self.ids) for arg in args]
+                if op in ID_OPERATIONS and args:
+                    args[0] = self.ids[args[0]]
+                value = self.__runOne(op, args, outcome, rest[0] if rest else None)
+                if len(rest) > 1 and op in RESULT_IDS:
+                    self.__mapIds(rest[1], value, op)
+            self.elapsed = time.perf_counter() - began
+        finally:
+            pytock_clock.set_clock(None)
+
+    def __runOne(self, op: str, args: list, outcome: str, venue: str):
+        """
+        Run one operation, returning what it returned, or None if it raised.
+        """
+        kind, method = op.split(".")
+        venue = pytock_data.current_venue(venue)
+        started = time.perf_counter()
+        result = value = None
+        try:
+            if method == "load" or (kind, venue) not in self.collections:
+                self.collections[(kind, venue)] = getattr(restaurant, kind)(venue)
+            if method != "load":
+                value = getattr(self.collections[(kind, venue)], method)(*args)
+        except Exception as error:
+            result = type(error).__name__
+        self.latencies.setdefault(op, []).append(time.perf_counter() - started)
+        self.count += 1
+        if result != outcome:
+            self.mismatches += 1
+        return value
+
+    def __mapIds(self, recorded: list, value, op: str) -> None:
+        """
+        Map the recorded ids of the bookings an operation created onto those
+        it created in the replay. A replay that created other bookings than
+        recorded is a mismatch, unless it failed, which is counted already.
+        """
+        if value is None:
+            return
+        replayed = RESULT_IDS[op](value)
+        if len(replayed) != len(recorded):
+            self.mismatches += 1
+            return
+        self.ids.update(zip(recorded, replayed))
+
+    def report(self) -> dict:
+        """
+        Summarize the replay.
+
+        Args:
+            None.
+
+        Returns:
+            dictionary with overall throughput and per-operation latency in ms.
+
+        Raises:
+            None.
+        """
+        operations = { }
+        for op, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            operations[op] = {
+                "count": len(samples),
+                "mean_ms": statistics.fmean(samples) * 1000,
+                "p50_ms": samples[len(samples) // 2] * 1000,
+                "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+                "max_ms": samples[-1] * 1000,
+            }
+        return {
+            "operations": self.count,
+            "elapsed_s": self.elapsed,
+            "throughput_ops": self.count / self.elapsed if self.elapsed else 0.0,
+            "mismatches": self.mismatches,
+            "unmapped": self.unmapped,
+            "by_operation": operations,
+        }
+
+
+# print_report
+#
+# Print a replay report as a text table.
+#
+def print_report(report: dict) -> None:
+    print(f"{report['operations']} operations in {report['elapsed_s']:.3f}s "
+          f"= {report['throughput_ops']:.0f} ops/s, {report['mismatches']} outcome mismatches, "
+          f"{report['unmapped']} of them unmapped ids")
+    print(f"{'operation':<28}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for op, row in report["by_operation"].items():
+        print(f"{op:<28}{row['count']:>8}{row['mean_ms']:>10.3f}{row['p50_ms']:>10.3f}"
+              f"{row['p95_ms']:>10.3f}{row['max_ms']:>10.3f}")
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay a pytock operation trace.")
+    parser.add_argument("trace", help="trace log written by pytock_trace")
+    parser.add_argument("--speed", default="max", help="max, original, or a speed-up factor")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    options = parser.parse_args(argv)
+
+    if options.speed == "max":
+        speed = None
+    elif options.speed == "original":
+        speed = 1.0
+    else:
+        speed = float(options.speed)
+
+    replayer = Replayer(speed)
+    replayer.run(pytock_trace.read(options.trace))
+    report = replayer.report()
+    if options.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+#
+# pytock_search.py
+#
+# Customer search for the pytock application. Each venue has one shared index
+# of its bookings and recurring rules by customer name and phone digits, so a
+# guest can be found by a fragment of either, with typos, instead of a pass
+# over all bookings:
+#
+#   results = pytock_search.index(venue).search("jon smth")
+#
+# Names are case-folded with punctuation removed and phones reduced to digits,
+# so "+7 (999) 123-45-67" and "79991234567" are the same. Both are split into
+# trigrams, i.e. overlapping three-character pieces, and each trigram maps to
+# the ids of the entries containing it. A query is scored against the entries
+# sharing any of its trigrams by the fraction of the query's trigrams they
+# contain, so a fragment matches in full and a wrong, missing or extra
+# character costs only a few trigrams. Ties go to the closer overall match by
+# the Dice coefficient, which also counts the entry's trigrams.
+#
+# The index follows the pytock_data change feed rather than being rebuilt: it
+# subscribes to the booking and rule events and applies the queued ones before
+# each search. Should the queue have overflowed it rebuilds from the store.
+#
+
+import collections
+import heapq
+import re
+import threading
+
+import pytock_data
+import pytock_metrics
+
+# feed events that change the index
+ADDED = {"booking_added", "rule_added"}
+REMOVED = {"booking_deleted", "booking_expired", "rule_deleted"}
+
+MIN_SCORE = 0.4                                         # fraction of query trigrams to be a match
+CLOSE_SCORE = 0.7                                       # only these are shown if there are any
+RESULTS = 20
+
+
+# normalize_name
+#
+# Case-fold a name and reduce punctuation, digits and runs of spaces to single
+# spaces.
+#
+def normalize_name(text: str) -> str:
+    return " ".join(re.sub(r"[\W\d_]+", " ", text.casefold()).split())
+
+# normalize_phone
+#
+# Reduce a phone number to its digits.
+#
+def normalize_phone(text: str) -> str:
+    return re.sub(r"\D", "", text)
+
+# trigrams
+#
+# The set of trigrams of a text. Names are padded with spaces so that their
+# first and last letters form trigrams of their own and words match at their
+# starts; phones are not, since a fragment may come from the middle.
+#
+def trigrams(text: str, pad: bool = True) -> set[str]:
+    if pad:
+        text = f"  {text} "
+    return {text[index:index + 3] for index in range(len(text) - 2)}
+
+
+#
+# CustomerIndex class
+#
+# The trigram index of one venue. Entries are keyed by booking or rule id; ids
+# are unique across both. Walk-ins have no customer and are not indexed, and a
+# joined party is indexed once, by the first of its parts, which are stored and
+# removed together.
+#
+
+class CustomerIndex:
+    """
+    A CustomerIndex object finds bookings and rules by customer name or phone.
+    """
+
+    def __init__(self, venue: str):
+        self.venue = venue
+        self._lock = threading.Lock()
+        self._entries = { }                             # id -> (item, name grams, phone digits, phone grams)
+        self._names = collections.defaultdict(set)      # trigram -> ids
+        self._phones = collections.defaultdict(set)     # trigram -> ids
+        with pytock_data.lock(venue):                   # no change between the build and the subscription
+            self._feed = pytock_data.subscribe(ADDED | REMOVED, venue)
+            self.__rebuild()
+
+    def __rebuild(self) -> None:
+        """
+        Index the latest stored bookings and rules from scratch.
+        """
+        self._entries.clear()
+        self._names.clear()
+        self._phones.clear()
+        for key in ("restaurant_bookings", "restaurant_rules"):
+            for item in (pytock_data.latest(key, self.venue) or { }).values():
+                self.__add(item)
+
+    def __add(self, item) -> None:
+        if type(item).__name__ == "WalkinBooking" or item.id in self._entries:
+            return
+        if type(item).__name__ == "JoinedBooking" and item.parts[0] != item.id:
+            return
+        names = trigrams(normalize_name(item.name))
+        digits = normalize_phone(item.phone)
+        phones = trigrams(digits, pad=False)
+        self._entries[item.id] = (item, names, digits, phones)
+        for gram in names:
+            self._names[gram].add(item.id)
+        for gram in phones:
+            self._phones[gram].add(item.id)
+
+    def __remove(self, item) -> None:
+        entry = self._entries.pop(item.id, None)
+        if entry is None:
+            return
+        for grams, postings in ((entry[1], self._names), (entry[3], self._phones)):
+            for gram in grams:
+                ids = postings.get(gram)
+                if ids is not None:
+                    ids.discard(item.id)
+                    if not ids:
+                        del postings[gram]
+
+    def __update(self) -> None:
+        """
+        Apply the changes queued on the feed. Called with our lock held.
+        """
+        if self._feed.dropped:
+            self._feed.dropped = 0
+            self._feed.drain()
+            with pytock_data.lock(self.venue):
+                self.__rebuild()
+                self._feed.drain()                      # already in the rebuilt index
+            return
+        for event in self._feed.drain():
+            if event.kind in ADDED:
+                self.__add(event.item)
+            else:
+                self.__remove(event.item)
+
+    @staticmethod
+    def __candidates(grams: set, postings: dict, fraction: float) -> set:
+        """
+        Return the ids of the entries that may contain at least the fraction
+        of the trigrams. Any such entry contains one of the rarest trigrams
+        that cannot all be missed, so only their postings are read.
+        """
+        needed = max(1, int(fraction * len(grams) + 0.999999))
+        sizes = sorted(grams, key=lambda gram: len(postings.get(gram, ())))
+        rarest = [postings[gram] for gram in sizes[:len(grams) - needed + 1] if gram in postings]
+        return set().union(*rarest)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @pytock_metrics.timed("search")
+    def search(self, query: str, limit: int = RESULTS) -> list:
+        """
+        Find the bookings and rules whose customer best matches the query.
+        Letters in the query are matched against names and digits against
+        phones, and a phone that contains the query digits outright counts
+        as a full match. The score is the fraction of the query's trigrams
+        found, averaged over the name and phone parts of the query. Loose
+        matches are returned only when there are no close ones. A query with
+        neither letters nor three digits has no trigrams and finds nothing.
+
+        Args:
+            query: name and/or phone fragment, in any format.
+            limit: most results to return.
+
+        Returns:
+            List of (score, Booking or RecurringRule) tuples, best first.
+
+        Raises:
+            None.
+        """
+        name = normalize_name(query)
+        digits = normalize_phone(query)
+        nameGrams = trigrams(name) if name else set()
+        phoneGrams = trigrams(digits, pad=False) if len(digits) >= 3 else set()
+        with self._lock:
+            self.__update()
+            parts = [(grams, postings, field) for grams, postings, field
+                     in ((nameGrams, self._names, 1), (phoneGrams, self._phones, 3)) if grams]
+            if not parts:
+                return [ ]
+            # close matches need only the postings of the rarer trigrams;
+            # the loose ones are looked for when there are none
+            for threshold in (CLOSE_SCORE, MIN_SCORE):
+                scores = self.__score(parts, digits, threshold)
+                best = heapq.nlargest(limit, ((score, entryId) for entryId, score in scores.items()
+                                              if score[0] >= threshold))
+                if best:
+                    break
+            return [(score[0], self._entries[entryId][0]) for score, entryId in best]
+
+    def __score(self, parts: list, digits: str, threshold: float) -> dict:
+        """
+        Score the entries that may reach the threshold, as id -> [coverage,
+        dice] averaged over the parts of the query.
+        """
+        scores = collections.defaultdict(lambda: [0.0, 0.0])
+        # the other parts could score in full, so each part needs only the
+        # rest; when that is above nothing every part must match
+        fraction = threshold * len(parts) - len(parts) + 1
+        candidates = [self.__candidates(grams, postings, fraction) for grams, postings, field in parts]
+        if fraction > 0:
+            candidates = [set.intersection(*candidates)] * len(parts)
+        for (grams, postings, field), ids in zip(parts, candidates):
+            for entryId in ids:
+                entry = self._entries[entryId]
+                if field == 3 and digits in entry[2]:
+                    coverage = dice = 1.0
+                else:
+                    count = len(grams & entry[field])
+                    coverage = count / len(grams)
+                    dice = 2 * count / (len(grams) + len(entry[field]))
+                score = scores[entryId]
+                score[0] += coverage / len(parts)
+                score[1] += dice / len(parts)
+        return scores
+
+# index
+#
+# The venue's shared customer index, created on first use.
+#
+def index(venue: str = None) -> CustomerIndex:
+    venue = pytock_data.current_venue(venue)
+    return pytock_data.resource("customer_index", lambda: CustomerIndex(venue), venue)
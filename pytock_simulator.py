@@ -0,0 +1,222 @@
+#
+# pytock_simulator.py
+#
+# Monte Carlo capacity simulation for the pytock application. Before changing
+# the floor or the booking policy, simulate many nights of reservations and
+# walk-ins on a floor and see the seat utilization, the parties turned away and
+# how long walk-ins wait:
+#
+#   report = pytock_simulator.simulate([4, 4, 6, 8], nights=10000)
+#
+# All nights are simulated at once with NumPy: each step places the k-th
+# arrival of every night together, so the Python loop runs once per arrival
+# and wait step rather than once per party. Times are on the Availability.SLOT
+# grid and each table's occupancy on a night is a bitmask of grid points, in
+# as many 64-bit words as the night needs. A party occupies the points from its
+# start to its end inclusive, so, as in Bookings, two parties at a table
+# conflict even if one starts the moment the other ends.
+#
+# Reservations are made before the night, in random order, for a start time
+# drawn around the dinner peak; each gets the smallest free table that seats
+# it for its whole period, or is turned away. Walk-ins then arrive in time
+# order and are seated at the smallest table that can take them as soon as
+# there is one, waiting up to MAX_WAIT, after which they leave. Periods follow
+# the policy: the default booking period, at most Booking.maxBookingTime().
+#
+# As in Bookings, walk-ins are a layer of their own over the reservations: a
+# table has at most one walk-in at a time, and a walk-in never stops a table
+# being reserved. By default walk-ins are seated as from the waitlist, at a
+# table with no reservation during Party.SEATING_PERIOD from now. With
+# override they are seated as by a host's walkIn, over any reservation, so a
+# table may then hold a reservation and a walk-in at once.
+#
+# Usage: python pytock_simulator.py [--seats 4,4,6] [--nights N] [--reservations R] [--walkins W]
+#                                   [--period MINUTES] [--override] [--seed S]
+#
+
+import argparse
+import datetime
+
+import numpy as np
+
+import restaurant
+
+OPEN_HOURS = 12                                         # hours during which parties arrive
+PEAK = 0.7                                              # busiest time, as a fraction of the open hours
+MAX_WAIT = datetime.timedelta(hours=1)                  # longest a walk-in waits for a table
+PARTY_SIZES = {1: 0.05, 2: 0.45, 3: 0.12, 4: 0.2, 5: 0.06, 6: 0.07, 7: 0.02, 8: 0.03}
+SLOT_MINUTES = restaurant.Availability.SLOT // datetime.timedelta(minutes=1)
+
+
+# minutes
+#
+# Convert a datetime.time duration, e.g. Booking.maxBookingTime(), to minutes.
+#
+def minutes(period: datetime.time) -> int:
+    return period.hour * 60 + period.minute
+
+# Booking.defBookingPeriod() is a period as a time of day today
+_defPeriod = restaurant.Booking.defBookingPeriod()
+DEFAULT_PERIOD = _defPeriod - _defPeriod.replace(hour=0, minute=0, second=0, microsecond=0)
+SEATING_PERIOD = datetime.timedelta(minutes=minutes(restaurant.Party.SEATING_PERIOD))
+
+# interval_masks
+#
+# The bitmasks of the grid points from first to last inclusive, one row per
+# night and one column per 64-bit word.
+#
+def interval_masks(first: np.ndarray, last: np.ndarray, words: int) -> np.ndarray:
+    masks = np.zeros((len(first), words), np.uint64)
+    for word in range(words):
+        low = np.clip(first - 64 * word, 0, 64).astype(np.uint64)
+        high = np.clip(last + 1 - 64 * word, 0, 64).astype(np.uint64)
+        masks[:, word] = _ones(high) & ~_ones(low)
+    return masks
+
+def _ones(count: np.ndarray) -> np.ndarray:
+    """The lowest `count` bits set, for counts from 0 through 64."""
+    full = count >= 64
+    shifted = np.left_shift(np.uint64(1), np.where(full, 0, count).astype(np.uint64)) - np.uint64(1)
+    return np.where(full, np.uint64(0xFFFFFFFFFFFFFFFF), shifted)
+
+# arrivals
+#
+# Random arrivals for every night, padded to the busiest night: start grid
+# points, party sizes and a mask of the real arrivals.
+#
+def arrivals(rng: np.random.Generator, nights: int, mean: float, slots: int) -> tuple:
+    counts = rng.poisson(mean, nights)
+    width = max(int(counts.max(initial=0)), 1)
+    starts = np.rint(rng.triangular(0, PEAK * slots, slots, (nights, width))).astype(np.int64)
+    sizes = rng.choice(list(PARTY_SIZES), (nights, width), p=list(PARTY_SIZES.values()))
+    real = np.arange(width) < counts[:, None]
+    return starts, sizes, real
+
+# place
+#
+# Seat the parties of one step, one per night, at the smallest free table that
+# seats them for [first, last] and is not blocked, marking it busy. Returns
+# the table index per night, or -1 where no table is free.
+#
+def place(busy: np.ndarray, seats: np.ndarray, first: np.ndarray, last: np.ndarray, sizes: np.ndarray,
+          wanted: np.ndarray, blocked: np.ndarray = None) -> np.ndarray:
+    masks = interval_masks(first, last, busy.shape[2])
+    free = ~(busy & masks[:, None, :]).any(axis=2)
+    if blocked is not None:
+        free &= ~blocked
+    usable = free & (seats[None, :] >= sizes[:, None]) & wanted[:, None]
+    choice = np.where(usable, seats[None, :], np.iinfo(np.int64).max).argmin(axis=1)
+    placed = usable[np.arange(len(choice)), choice]
+    rows = np.flatnonzero(placed)
+    busy[rows, choice[rows]] |= masks[rows]
+    return np.where(placed, choice, -1)
+
+# overlapping
+#
+# Which tables are busy at some point of [first, last], per night.
+#
+def overlapping(busy: np.ndarray, first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    masks = interval_masks(first, last, busy.shape[2])
+    return (busy & masks[:, None, :]).any(axis=2)
+
+# simulate
+#
+# Simulate nights of reservations and walk-ins on a floor and report the
+# averages per night, and the spread across nights, as a dictionary.
+#
+def simulate(seats: list[int], nights: int = 1000, reservations: float = 40, walkins: float = 20,
+             period: datetime.timedelta = DEFAULT_PERIOD, override: bool = False, seed: int = None) -> dict:
+    longest = datetime.timedelta(minutes=minutes(restaurant.Booking.maxBookingTime()))
+    if not seats or period <= datetime.timedelta(0) or period > longest:
+        raise ValueError(f"need tables and a period of up to {longest}")
+    rng = np.random.default_rng(seed)
+    seats = np.asarray(seats, np.int64)
+    length = -(-period // restaurant.Availability.SLOT)             # grid slots, rounded up
+    slots = OPEN_HOURS * 60 // SLOT_MINUTES
+    seating = -(-SEATING_PERIOD // restaurant.Availability.SLOT)
+    wait = MAX_WAIT // restaurant.Availability.SLOT
+    words = -(-(slots + wait + max(length, seating) + 1) // 64)
+    busy = np.zeros((nights, len(seats), words), np.uint64)         # reservations
+    walkedIn = np.zeros_like(busy)                                   # walk-ins
+
+    # reservations, in the order they are made
+    starts, sizes, real = arrivals(rng, nights, reservations, slots)
+    booked = np.zeros_like(real)
+    for step in range(starts.shape[1]):
+        booked[:, step] = place(busy, seats, starts[:, step], starts[:, step] + length, sizes[:, step],
+                                real[:, step]) >= 0
+
+    # walk-ins, in the order they arrive, each waiting until seated or gone,
+    # away from reservations unless they override them
+    arrived, walkSizes, walkReal = arrivals(rng, nights, walkins, slots)
+    order = np.argsort(np.where(walkReal, arrived, np.iinfo(np.int64).max), axis=1, kind="stable")
+    arrived = np.take_along_axis(arrived, order, axis=1)
+    walkSizes = np.take_along_axis(walkSizes, order, axis=1)
+    walkReal = np.take_along_axis(walkReal, order, axis=1)
+    waited = np.full(walkReal.shape, -1, np.int64)                 # slots waited, -1 if not seated
+    for step in range(arrived.shape[1]):
+        waiting = walkReal[:, step].copy()
+        for delay in range(wait + 1):
+            if not waiting.any():
+                break
+            start = arrived[:, step] + delay
+            blocked = None if override else overlapping(busy, start, start + seating)
+            seated = place(walkedIn, seats, start, start + length, walkSizes[:, step], waiting, blocked) >= 0
+            waited[seated, step] = delay
+            waiting &= ~seated
+
+    # reports
+    guests = (sizes * booked).sum(axis=1) + (walkSizes * (waited >= 0)).sum(axis=1)
+    utilization = guests * length / (seats.sum() * slots)
+    refused = (real & ~booked).sum(axis=1)
+    turnedAway = (walkReal & (waited < 0)).sum(axis=1)
+    waits = waited[waited >= 0] * SLOT_MINUTES
+    def spread(values: np.ndarray) -> dict:
+        return {"mean": float(values.mean()), "p10": float(np.percentile(values, 10)),
+                "p90": float(np.percentile(values, 90))}
+    return {
+        "nights": nights,
+        "tables": len(seats),
+        "seats": int(seats.sum()),
+        "period_minutes": int(length * SLOT_MINUTES),
+        "seat_utilization": spread(utilization),
+        "reservations": spread(real.sum(axis=1)),
+        "reservations_refused": spread(refused),
+        "walkins": spread(walkReal.sum(axis=1)),
+        "walkins_turned_away": spread(turnedAway),
+        "walkin_wait_minutes": {"mean": float(waits.mean()) if waits.size else 0.0,
+                                "p50": float(np.percentile(waits, 50)) if waits.size else 0.0,
+                                "p90": float(np.percentile(waits, 90)) if waits.size else 0.0},
+    }
+
+
+# main
+#
+# Simulate from the command line and print the report.
+#
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Simulate nights of pytock bookings on a floor.")
+    parser.add_argument("--seats", default="4,4,6", help="seats of each table, comma separated")
+    parser.add_argument("--nights", type=int, default=10000, help="nights to simulate")
+    parser.add_argument("--reservations", type=float, default=40, help="mean reservations requested per night")
+    parser.add_argument("--walkins", type=float, default=20, help="mean walk-in parties per night")
+    parser.add_argument("--period", type=int, default=DEFAULT_PERIOD // datetime.timedelta(minutes=1),
+                        help="booking period in minutes")
+    parser.add_argument("--override", action="store_true", help="seat walk-ins over reservations, as walkIn does")
+    parser.add_argument("--seed", type=int, help="random seed, for repeatable runs")
+    options = parser.parse_args(argv)
+
+    seats = [int(each) for each in options.seats.split(",") if each.strip()]
+    if any(not 1 <= each <= restaurant.Table.MAX_SEATS for each in seats):
+        parser.error(f"seats must be in the range 1..{restaurant.Table.MAX_SEATS}")
+    report = simulate(seats, options.nights, options.reservations, options.walkins,
+                      datetime.timedelta(minutes=options.period), options.override, options.seed)
+    for name, value in report.items():
+        if isinstance(value, dict):
+            value = "  ".join(f"{key} {number:.3g}" for key, number in value.items())
+        print(f"{name:24} {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,104 @@
+#
+# pytock_sweeper.py
+#
+# Background expiry of bookings for the pytock application. A scheduled job on
+# the server's workers (see pytock_workers.py) runs when the earliest booking
+# expiry of any venue is due (or at most SWEEP_INTERVAL later), and has
+# Bookings.sweepExpired() remove each venue's expired batch, bookings and
+# occurrences of recurring rules alike, as one change to that venue's shared
+# data.
+#
+
+import datetime
+import logging
+
+import pytock_clock
+import pytock_data
+import restaurant
+
+# longest wait between sweeps, so that newly added bookings with an earlier
+# expiry than the one being waited for are not overlooked for long
+SWEEP_INTERVAL = datetime.timedelta(seconds=30)
+
+
+#
+# Sweeper class
+#
+# The sweep and its timing. Expired bookings are handed to the optional
+# onExpired(bookings, venue) callback before they are removed, e.g. to archive
+# them; if it raises, they stay in the store and are swept again next time. A
+# venue that fails does not stop the others being swept.
+#
+
+class Sweeper:
+    """
+    A Sweeper object expires bookings when run by a scheduled job.
+    """
+
+    def __init__(self, interval: datetime.timedelta = SWEEP_INTERVAL, onExpired=None):
+        self.interval = interval
+        self.onExpired = onExpired
+        self.swept = 0
+        self.failed = False                             # last sweep failed for some venue
+
+    def sweep(self) -> list[restaurant.Booking]:
+        """
+        Expire the bookings of every venue that are due now.
+
+        Args:
+            None.
+
+        Returns:
+            List of expired Booking objects.
+
+        Raises:
+            None.
+        """
+        now = pytock_clock.now()
+        output = []
+        self.failed = False
+        for venue in pytock_data.venues():
+            before = (lambda bookings, venue=venue: self.onExpired(bookings, venue)) if self.onExpired else None
+            try:
+                expired = restaurant.Bookings(venue).sweepExpired(now, before)
+            except Exception as error:
+                logging.getLogger(__name__).warning("sweep of venue %s failed: %s", venue, error)
+                self.failed = True
+                continue
+            self.swept += len(expired)
+            output.extend(expired)
+        return output
+
+    def wait(self) -> float:
+        """
+        Report the seconds until the next sweep is due, the whole interval
+        after a failed sweep so that a failing venue is not retried at once.
+
+        Args:
+            None.
+
+        Returns:
+            float, at most the interval.
+
+        Raises:
+            None.
+        """
+        if self.failed:
+            return self.interval.total_seconds()
+        dues = [due for due in (restaurant.Bookings(venue).nextExpiry() for venue in pytock_data.venues())
+                if due is not None]
+        due = min(dues, default=None)
+        wait = self.interval
+        if due is not None:
+            wait = min(wait, max(due - pytock_clock.now(), datetime.timedelta(0)))
+        return wait.total_seconds()
+
+
+# start
+#
+# Schedule the server's sweeper on the workers, returning it.
+#
+def start(workers, interval: datetime.timedelta = SWEEP_INTERVAL, onExpired=None) -> Sweeper:
+    sweeper = Sweeper(interval, onExpired)
+    workers.schedule("expiry_sweep", sweeper.sweep, interval, delay=sweeper.wait)
+    return sweeper
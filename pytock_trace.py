@@ -0,0 +1,183 @@
+#
+# pytock_trace.py
+#
+# Operation trace recording for the pytock application. When a recorder is
+# started, every call made at the Tables/Bookings API boundary is appended to a
+# compact log, one JSON array per line:
+#
+#   [<epoch seconds>, <clock time>, <operation>, [<arguments>], <outcome>, <venue>, <ids>]
+#
+# where the clock time is the pytock_clock time used for the booking date, the
+# outcome is null or the name of the exception raised, and the venue is the id
+# of the venue whose collection was called (see pytock_data.py). Operations
+# that create bookings the caller did not pass in, such as the parts of a joined
+# booking, also record the ids they were given, so that replay can map later
+# references to them; the other records end with the venue. Logs whose names end
+# in ".gz" are gzip compressed. See pytock_replay.py for running a log against a
+# fresh store.
+#
+# Recording can be enabled for a whole server by setting PYTOCK_TRACE to the
+# log path. When no recorder is running the traced() wrapper costs one check.
+#
+
+import atexit
+import datetime
+import functools
+import gzip
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+import pytock_clock
+
+_recorder = None
+_depth = threading.local()                              # nested calls are recorded once
+
+
+#
+# Recorder class
+#
+# Writes trace records to a log file. Writes from concurrent sessions are
+# serialized so that records are never interleaved.
+#
+
+class Recorder:
+    """
+    A Recorder object appends trace records to a log file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        if path.endswith(".gz"):
+            self._file = gzip.open(path, "at", encoding="utf-8")
+        else:
+            self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, op: str, args: tuple, started: float, when: datetime.datetime, outcome: str,
+              venue: str = None, ids: list = None) -> None:
+        record = [round(started, 6), when.isoformat(), op, [encode(arg) for arg in args], outcome, venue]
+        if ids is not None:
+            record.append(ids)
+        line = json.dumps(record, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self.count += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+# start
+#
+# Start recording to the given log, replacing any recorder already running.
+#
+def start(path: str) -> Recorder:
+    global _recorder
+    stop()
+    _recorder = Recorder(path)
+    return _recorder
+
+# stop
+#
+# Stop recording and close the log.
+#
+def stop() -> None:
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder:
+        recorder.close()
+
+# recording
+#
+# True iff a recorder is running.
+#
+def recording() -> bool:
+    return _recorder is not None
+
+# traced
+#
+# Decorator for Tables/Bookings methods. The instance argument is not recorded
+# because the collections are views of the shared store; replay creates a new
+# one for each operation just as the pages do. For operations that create
+# bookings of their own, result(returned value) gives the list of their ids.
+#
+def traced(op: str, result=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if _recorder is None or getattr(_depth, "value", 0):
+                return func(self, *args, **kwargs)
+            started = time.time()
+            when = pytock_clock.now()
+            outcome = ids = None
+            _depth.value = 1
+            try:
+                value = func(self, *args, **kwargs)
+                if result is not None:
+                    ids = result(value)
+                return value
+            except Exception as error:
+                outcome = type(error).__name__
+                raise
+            finally:
+                _depth.value = 0
+                recorder = _recorder
+                if recorder:
+                    recorder.write(op, args + tuple(kwargs.values()), started, when, outcome,
+                                   getattr(self, "venue", None), ids)
+        return wrapper
+    return decorator
+
+# encode
+#
+# Convert an operation argument to JSON-compatible form. Restaurant objects are
+# recognized by their class name to avoid importing restaurant here.
+#
+def encode(value):
+    kind = type(value).__name__
+    if kind == "WalkinBooking":
+        return {"walkin": value.tablename, "id": value.id}
+    if kind == "Booking":
+        return {"booking": [value.tablename, value.name, value.phone,
+                            value.start.time().isoformat(), value.period.isoformat()], "id": value.id}
+    if kind == "JoinedBooking":
+        return {"joined": [value.tablename, value.name, value.phone, value.start.time().isoformat(),
+                           value.period.isoformat(), value.parts, value.tablenames, value.size], "id": value.id}
+    if kind == "RecurringRule":
+        return {"rule": [value.tablename, value.name, value.phone, value.start.isoformat(), value.period.isoformat(),
+                         value.first.isoformat(), value.until and value.until.isoformat(), value.interval],
+                "id": value.id}
+    if kind == "RecurringBooking":
+        return {"occurrence": encode(value.rule), "day": value.start.date().isoformat()}
+    if kind == "Party":
+        return {"party": [value.name, value.size, value.priority, value.arrived.isoformat()], "id": value.id}
+    if kind == "StatusFilter":
+        return {"filter": [value.tablename, value.start.time().isoformat() if value.start else None,
+                           value.end.time().isoformat() if value.end else None, value.state, value.customer]}
+    if kind == "Tables":
+        return {"tables": value.venue}
+    if isinstance(value, (datetime.time, datetime.datetime, datetime.date)):
+        return {kind: value.isoformat()}
+    return value
+
+# read
+#
+# Yield the records of a log one at a time.
+#
+def read(path: str):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+# start recording for the server if requested, closing the log on exit; not in
+# the worker processes, which re-import this module but make no traced calls
+if os.environ.get("PYTOCK_TRACE") and multiprocessing.parent_process() is None:
+    start(os.environ["PYTOCK_TRACE"])
+atexit.register(stop)
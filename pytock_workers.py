@@ -0,0 +1,417 @@
+#
+# pytock_workers.py
+#
+# Background execution for the pytock application. Work that does not need to
+# happen while a host waits, such as booking expiry, archive compaction, table
+# garbage collection and reports, runs here instead of on a session's script
+# thread:
+#
+#   pool = pytock_workers.start()
+#   job = pool.submit("reports", compute, table, process=True)   # CPU heavy
+#   pool.schedule("archive_compaction", compact, interval)        # periodic
+#   pool.cancel(job.id)
+#
+# Jobs run on a thread pool, or on a process pool when they are CPU bound, in
+# which case the function and its arguments must be picklable. Scheduled jobs
+# are driven by one scheduler thread sleeping on a min-heap of due times. Each
+# job keeps its state and timing for the Metrics page; results that sessions
+# need are published through pytock_data by the jobs themselves.
+#
+# One Workers object serves the whole server, created as a cached resource by
+# pytock.py and shut down when the process exits.
+#
+
+import atexit
+import concurrent.futures
+import datetime
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+import pytock_metrics
+
+THREADS = int(os.environ.get("PYTOCK_WORKER_THREADS", "4"))
+PROCESSES = int(os.environ.get("PYTOCK_WORKER_PROCESSES", "2"))
+HISTORY = 100                                           # finished jobs kept for status
+
+_workers = None
+
+
+#
+# Job class
+#
+# One submitted piece of work and its progress through the states
+#
+#   pending -> running -> done | failed
+#   pending -> cancelled
+#
+
+class Job:
+    """
+    A Job object tracks one function run by the worker pool.
+    """
+
+    # class constants
+    STATES = ["pending", "running", "done", "failed", "cancelled"]
+
+    # class state
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, process: bool):
+        self.id = next(Job._ids)
+        self.name = name
+        self.process = process
+        self.state = "pending"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.future = None
+
+    @property
+    def seconds(self) -> float:
+        """Run time so far, or in total once finished."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def result(self, timeout: float = None):
+        """
+        Wait for the job and return its result.
+
+        Args:
+            timeout: seconds to wait, or None to wait as long as it takes.
+
+        Returns:
+            The function's return value.
+
+        Raises:
+            The function's exception, CancelledError, or TimeoutError.
+        """
+        return self.future.result(timeout)
+
+
+#
+# Schedule class
+#
+# A job run again and again. After each run the next one is due `interval`
+# later, unless a `delay` function is given, which is asked for the number of
+# seconds to wait instead, e.g. until the next booking expires.
+#
+
+class Schedule:
+    """
+    A Schedule object describes a recurring job.
+    """
+
+    def __init__(self, name: str, func, interval: datetime.timedelta, delay=None, process: bool = False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.delay = delay
+        self.process = process
+        self.due = None                                 # epoch seconds, None while running
+        self.runs = 0
+        self.failures = 0
+        self.last = None                                # most recent Job
+        self.cancelled = False
+
+    def nextDelay(self) -> float:
+        if self.delay:
+            try:
+                return max(0.0, min(self.delay(), self.interval.total_seconds()))
+            except Exception:
+                logging.getLogger(__name__).exception("delay of scheduled job %s failed", self.name)
+        return self.interval.total_seconds()
+
+
+#
+# Workers class
+#
+# The pools, the scheduler thread and the job history.
+#
+
+class Workers:
+    """
+    A Workers object runs jobs in the background and reports their status.
+    """
+
+    def __init__(self, threads: int = THREADS, processes: int = PROCESSES):
+        self.threads = threads
+        self.processes = processes
+        self._threadPool = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix="pytock-worker")
+        self._processPool = None                        # started on first use
+        self._lock = threading.Lock()
+        self._jobs = { }                                # id -> Job, pending and running
+        self._history = [ ]                             # finished jobs, oldest first
+        self._schedules = { }                           # name -> Schedule
+        self._due = [ ]                                 # heap of (due, sequence, Schedule)
+        self._sequence = itertools.count()
+        self._wake = threading.Condition(self._lock)
+        self._running = True
+        self._scheduler = threading.Thread(target=self.__schedule, name="pytock-scheduler", daemon=True)
+        self._scheduler.start()
+
+    @property
+    def running(self) -> bool:
+        """True until shutdown() is called."""
+        return self._running
+
+    def submit(self, name: str, func, *args, process: bool = False, **kwargs) -> Job:
+        """
+        Run a function in the background.
+
+        Args:
+            name: name shown in the job status.
+            func: the function; module level if process is True.
+            process: True to run on the process pool, for CPU-bound work.
+            remaining arguments are passed to the function.
+
+        Returns:
+            Job object.
+
+        Raises:
+            RuntimeError if the workers have been shut down.
+        """
+        job = Job(name, process)
+        with self._lock:
+            if not self._running:
+                raise RuntimeError("pytock workers have been shut down")
+            self._jobs[job.id] = job
+            if process:
+                if self._processPool is None:
+                    self._processPool = concurrent.futures.ProcessPoolExecutor(
+                        self.processes, mp_context=multiprocessing.get_context("spawn"))
+                job.future = self._processPool.submit(func, *args, **kwargs)
+                job.started = time.time()               # the pool does not tell us when
+                job.state = "running"
+            else:
+                job.future = self._threadPool.submit(self.__run, job, func, args, kwargs)
+        job.future.add_done_callback(lambda future: self.__finished(job, future))
+        return job
+
+    def __run(self, job: Job, func, args: tuple, kwargs: dict):
+        with self._lock:
+            if job.state == "cancelled":
+                return None
+            job.state = "running"
+            job.started = time.time()
+        with pytock_metrics.timer(f"job_{job.name}"):
+            return func(*args, **kwargs)
+
+    def __finished(self, job: Job, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            job.finished = time.time()
+            if future.cancelled():
+                job.state = "cancelled"
+            elif future.exception() is not None:
+                job.state = "failed"
+                job.error = repr(future.exception())
+                logging.getLogger(__name__).error("background job %s failed: %s", job.name, job.error)
+            elif job.state != "cancelled":
+                job.state = "done"
+            self._jobs.pop(job.id, None)
+            self._history.append(job)
+            del self._history[:-HISTORY]
+
+    def cancel(self, jobId: int) -> bool:
+        """
+        Cancel a job that has not started. Running jobs are left to finish.
+
+        Args:
+            jobId: id of the Job.
+
+        Returns:
+            True iff the job was cancelled.
+
+        Raises:
+            None.
+        """
+        with self._lock:
+            job = self._jobs.get(jobId)
+            if job is None or job.state != "pending":
+                return False
+            job.state = "cancelled"
+        job.future.cancel()
+        return True
+
+    def schedule(self, name: str, func, interval: datetime.timedelta, delay=None, process: bool = False,
+                 first: float = 0.0) -> Schedule:
+        """
+        Run a function repeatedly, replacing any schedule of the same name.
+        The next run is timed from the end of the previous one, so runs of a
+        schedule never overlap.
+
+        Args:
+            name: name of the schedule and its jobs.
+            func: the function, called without arguments.
+            interval: datetime.timedelta between runs, and the longest wait.
+            delay: optional function returning the seconds until the next run.
+            process: True to run on the process pool.
+            first: seconds until the first run.
+
+        Returns:
+            Schedule object.
+
+        Raises:
+            None.
+        """
+        schedule = Schedule(name, func, interval, delay, process)
+        with self._wake:
+            previous = self._schedules.get(name)
+            if previous:
+                previous.cancelled = True
+            self._schedules[name] = schedule
+            self.__push(schedule, time.time() + first)
+        return schedule
+
+    def unschedule(self, name: str) -> bool:
+        """
+        Stop a schedule. A run in progress is left to finish.
+
+        Args:
+            name: name of the schedule.
+
+        Returns:
+            True iff there was such a schedule.
+
+        Raises:
+            None.
+        """
+        with self._lock:
+            schedule = self._schedules.pop(name, None)
+            if schedule:
+                schedule.cancelled = True
+        return schedule is not None
+
+    def wake(self, name: str) -> None:
+        """
+        Run a schedule now rather than when it is next due, unless it is
+        running already.
+        """
+        with self._wake:
+            schedule = self._schedules.get(name)
+            if schedule and schedule.due is not None:
+                self.__push(schedule, time.time())
+
+    def __push(self, schedule: Schedule, due: float) -> None:
+        """
+        Set when a schedule is next due. Called with the lock held; entries
+        left in the heap with another due time are skipped when popped.
+        """
+        schedule.due = due
+        heapq.heappush(self._due, (due, next(self._sequence), schedule))
+        self._wake.notify()
+
+    def __schedule(self) -> None:
+        while True:
+            with self._wake:
+                while True:
+                    if not self._running:
+                        return
+                    while self._due and (self._due[0][2].cancelled or self._due[0][2].due != self._due[0][0]):
+                        heapq.heappop(self._due)
+                    if self._due and self._due[0][0] <= time.time():
+                        break
+                    self._wake.wait(self._due[0][0] - time.time() if self._due else None)
+                schedule = heapq.heappop(self._due)[2]
+                schedule.due = None                     # running
+            try:
+                schedule.last = self.submit(schedule.name, schedule.func, process=schedule.process)
+            except RuntimeError:
+                return
+            schedule.last.future.add_done_callback(lambda future, schedule=schedule: self.__reschedule(schedule, future))
+
+    def __reschedule(self, schedule: Schedule, future: concurrent.futures.Future) -> None:
+        schedule.runs += 1
+        if future.cancelled() or future.exception() is not None:
+            schedule.failures += 1
+        wait = schedule.nextDelay()
+        with self._wake:
+            if self._running and not schedule.cancelled:
+                self.__push(schedule, time.time() + wait)
+
+    def status(self) -> dict:
+        """
+        Report the schedules, the jobs in progress and the recent jobs.
+
+        Args:
+            None.
+
+        Returns:
+            dictionary of "schedules", "active" and "history" lists, newest
+            jobs first.
+
+        Raises:
+            None.
+        """
+        with self._lock:
+            now = time.time()
+            schedules = [{"name": each.name, "runs": each.runs, "failures": each.failures,
+                          "next in s": round(max(each.due - now, 0.0), 1) if each.due is not None else None,
+                          "last state": each.last.state if each.last else None}
+                         for each in self._schedules.values()]
+            def row(job: Job) -> dict:
+                return {"id": job.id, "name": job.name, "pool": "process" if job.process else "thread",
+                        "state": job.state, "seconds": round(job.seconds, 3), "error": job.error}
+            return {
+                "schedules": schedules,
+                "active": [row(job) for job in reversed(list(self._jobs.values()))],
+                "history": [row(job) for job in reversed(self._history)],
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        """
+        Stop scheduling, cancel pending jobs and release the pools.
+
+        Args:
+            wait: True to wait for running jobs to finish.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        with self._wake:
+            if not self._running:
+                return
+            self._running = False
+            self._wake.notify()
+        self._threadPool.shutdown(wait=wait, cancel_futures=True)
+        if self._processPool:
+            self._processPool.shutdown(wait=wait, cancel_futures=True)
+
+
+# start
+#
+# Start the server's workers, replacing any that were shut down.
+#
+def start(threads: int = THREADS, processes: int = PROCESSES) -> Workers:
+    global _workers
+    if _workers is None or not _workers.running:
+        _workers = Workers(threads, processes)
+    return _workers
+
+# instance
+#
+# The server's workers, or None before start().
+#
+def instance() -> Workers:
+    return _workers
+
+# shutdown
+#
+# Shut the server's workers down.
+#
+def shutdown() -> None:
+    global _workers
+    workers, _workers = _workers, None
+    if workers:
+        workers.shutdown()
+
+atexit.register(shutdown)
@@ -5,9 +5,21 @@
 #
 #   Table  - an object representing a specific table that can be booked
 #   Tables - a collection of tables having unique names
+#   Customer - the shared record of a guest, by canonical phone and name
+#   Customers - the interned customer records of a venue, by compact customer id
 #   Booking - a specific booking with name/phone/start/period/table
 #   WalkinBooking - for walk-in customers with no name/phone/timing, just table
-#   Bookings - a collection of bookings
+#   JoinedBooking - one table of a booking for a large party at joined tables
+#   RecurringRule - a standing booking repeated weekly, stored once
+#   RecurringBooking - one occurrence of a RecurringRule on a given date
+#   Bookings - a collection of bookings and recurring rules
+#   StatusFilter - criteria for paging through the table status of Bookings
+#   Fragments - the rendered status of each table, kept until the table changes
+#   Occupancy - occupied tables and seats through the day, from Bookings
+#   Availability - free tables and busy customers by time slot, from Bookings
+#   Holds - tentative holds on tables taken while a booking is being entered
+#   Party - a walk-in party waiting for a table, or seated from the waitlist
+#   Waitlist - priority queues of the waiting parties, matched to freed tables
 #
 # These are POD objects to make it easy to manage them in streamlit, i.e. they
 # do not contain pointers to other objects. Backend storage is just the
@@ -16,10 +28,28 @@
 # and notification to other browsers and tabs sharing our backend, so that UI
 # updates can occur in real time.
 #
+# The collections read the immutable snapshot of the current script run (see
+# pytock_data.py), so constructing them copies nothing and every object created
+# during a run sees the same data. Changes are made on a private copy of the
+# latest data, taken under the pytock_data lock, and saved as a new version.
+#
+# Each collection belongs to one venue, by default the venue of the current
+# script run, and reads and changes only that venue's data and lock.
+#
 
 import exceptions
 import datetime
+import heapq
+import itertools
+import math
+import os
+import sys
+import threading
+import time
+import pytock_clock
 import pytock_data
+import pytock_metrics
+import pytock_trace
 
 
 #
@@ -42,13 +72,14 @@ class Table:
     def compareByStartKey(cls, table: 'Table') -> str:
         return table.name
 
-    def __init__(self, name: str, seats: int):
+    def __init__(self, name: str, seats: int, joinable=()):
         """
         Table::__init__ creates a new table object.
 
         Args:
             name: The name must be a non-empty, unique string.
             seats: Must be an integer from 1 through MAX_SEATS.
+            joinable: Names of the tables this one can be put together with.
 
         Returns:
             Returns a table object
@@ -64,6 +95,7 @@ class Table:
         
         self._name = name
         self._seats = seats
+        self._joinable = frozenset(joinable) - {name}
 
     @property
     def name(self):
@@ -75,6 +107,11 @@ class Table:
         """Number of seats at the table."""
         return self._seats
 
+    @property
+    def joinable(self):
+        """Frozen set of the names of the tables this one can be joined with."""
+        return self._joinable
+
     def description(self):
         """
         Display a short description: string <name> - <N> seats.
@@ -103,6 +140,12 @@ class Table:
 # The Tables class enforces unique names among the Table objects, and offers
 # demographics like total tables and seats as well as the usual CRUD operations.
 #
+# Tables that can be put together for a large party name each other as
+# joinable. setJoinable() keeps the relation symmetric by changing both sides,
+# though either side naming the other is enough for data stored before it did,
+# and names of tables that no longer exist are ignored, so deleting a table
+# leaves the others alone.
+#
 # To avoid being annoying during testing, this creates 3 default tables when it
 # is first initializes, but allows all tables to be deleted.
 #
@@ -117,24 +160,41 @@ class Tables:
     MAX_SEATS = 12
     DEF_SEATS = 4
 
-    def __init__(self):
+    @pytock_trace.traced("Tables.load")
+    def __init__(self, venue: str = None, latest: bool = False):
         """
-        Read latest state
+        Read the venue's run snapshot, or the latest state if requested. The
+        venue defaults to that of the current script run.
         """
-        self.__reload()
+        self.venue = pytock_data.current_venue(venue)
+        self.__reload(latest)
 
-    def __reload(self):
-        self.tables = pytock_data.get("restaurant_tables")
-        if not isinstance(self.tables, list):       # allow tables list to be empty
+    def __reload(self, latest: bool = False):
+        """
+        Read the run's snapshot, or for changes the latest
+        """
+        self.tables = pytock_data.latest("restaurant_tables", self.venue) if latest \
+            else pytock_data.get("restaurant_tables", self.venue)
+        if self.tables is None:                     # allow tables list to be empty
             self.tables = [Table("Table 1", 4), Table("Table 2", 4), Table("Table 3", 6)]
             self.__save()
+            for table in self.tables:
+                pytock_data.publish("table_created", "restaurant_tables", table, self.venue)
+        if latest:
+            self.tables = list(self.tables)
+            self.__byName = {table.name: table for table in self.tables}
+        else:
+            self.__byName = pytock_data.derive("restaurant_tables", "byName",
+                                               lambda tables: {table.name: table for table in tables or ()},
+                                               self.venue)
 
     def __save(self):
         """
         Save our state
         """
-        pytock_data.set("restaurant_tables", self.tables)
+        pytock_data.set("restaurant_tables", self.tables, self.venue)
 
+    @pytock_trace.traced("Tables.defName")
     def defName(self) -> str:
         """
         Return a unique default name for a possible new table.
@@ -146,6 +206,7 @@ class Tables:
             if not self.findTable(tablename):
                 return tablename
     
+    @pytock_trace.traced("Tables.capacity")
     def capacity(self) -> tuple[int, int]:
         """
         Report the total table and seat capacity.
@@ -166,6 +227,7 @@ class Tables:
             seatCount += table.seats
         return tableCount, seatCount
 
+    @pytock_trace.traced("Tables.namelist")
     def namelist(self) -> list[str]:
         """
         Get the sorted list of table names.
@@ -181,6 +243,7 @@ class Tables:
         """
         return [table.name for table in self.tables]
 
+    @pytock_trace.traced("Tables.createTable")
     def createTable(self, name: str, seats: int) -> Table:
         """
         Create a table and add it to our list.
@@ -196,15 +259,76 @@ class Tables:
             InvalidInputError: invalid name or seats argument
             DuplicateNameError: a table with that name already exists
         """
-        for table in self.tables:
-            if name == table.name:
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            if name in self.__byName:
                 raise exceptions.DuplicateNameError(f"table name {name} already exists")
-        table = Table(name, seats)
-        self.tables.append(table)
-        self.tables.sort(key=Table.compareByStartKey)
-        self.__save()
+            table = Table(name, seats)
+            self.__byName[table.name] = table
+            self.tables.append(table)
+            self.tables.sort(key=Table.compareByStartKey)
+            self.__save()
+            pytock_data.publish("table_created", "restaurant_tables", table, self.venue)
         return table
 
+    @pytock_trace.traced("Tables.setJoinable")
+    def setJoinable(self, tablename: str, joinable) -> Table:
+        """
+        Set the tables a table can be joined with, on both sides: each table
+        named gets this one as joinable, and each other table loses it.
+
+        Args:
+            tablename: name of the table.
+            joinable: names of the other tables.
+
+        Returns:
+            The changed table object.
+
+        Raises:
+            InternalError if table is not in list.
+        """
+        joinable = frozenset(joinable) - {tablename}
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            table = self.findTable(tablename)
+            if not table:
+                raise exceptions.InternalError
+            updated = [Table(table.name, table.seats, joinable)]
+            for other in self.tables:
+                if other.name == tablename:
+                    continue
+                if other.name in joinable and tablename not in other.joinable:
+                    updated.append(Table(other.name, other.seats, other.joinable | {tablename}))
+                elif other.name not in joinable and tablename in other.joinable:
+                    updated.append(Table(other.name, other.seats, other.joinable - {tablename}))
+            for changed in updated:
+                self.tables[self.tables.index(self.__byName[changed.name])] = changed
+                self.__byName[changed.name] = changed
+            self.__save()
+            for changed in updated:
+                pytock_data.publish("table_changed", "restaurant_tables", changed, self.venue)
+        return updated[0]
+
+    def joins(self, tablename: str) -> set[str]:
+        """
+        Report the existing tables a table can be joined with, named on
+        either side.
+
+        Args:
+            tablename: name of the table.
+
+        Returns:
+            Set of table names.
+
+        Raises:
+            None.
+        """
+        table = self.findTable(tablename)
+        names = set(table.joinable) if table else set()
+        names |= {other.name for other in self.tables if tablename in other.joinable}
+        return names & {other.name for other in self.tables} - {tablename}
+
+    @pytock_trace.traced("Tables.findTable")
     def findTable(self, tablename: str) -> Table:
         """
         Find a table by name.
@@ -218,11 +342,9 @@ class Tables:
         Raises:
             None.
         """
-        for table in self.tables:
-            if tablename == table.name:
-                return table
-        return None
+        return self.__byName.get(tablename)
 
+    @pytock_trace.traced("Tables.deleteTable")
     def deleteTable(self, tablename: str) -> None:
         """
         Delete a table by name from our list
@@ -236,11 +358,211 @@ class Tables:
         Raises:
             InternalError if table is not in list.
         """
-        table = self.findTable(tablename)
-        if not table:
-            raise exceptions.InternalError
-        self.tables.remove(table)
-        self.__save()
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            table = self.findTable(tablename)
+            if not table:
+                raise exceptions.InternalError
+            del self.__byName[tablename]
+            self.tables.remove(table)
+            self.__save()
+            pytock_data.publish("table_deleted", "restaurant_tables", table, self.venue)
+
+
+#
+# Customer class
+#
+# A guest, as given on a booking. The same guest books under many spellings of
+# a phone number, e.g. "+7 (999) 123-45-67" and "79991234567", so a customer is
+# identified by a key of the digits of the phone together with the case-folded
+# name (see Customers.key), and keeps the name and phone as first given for
+# display. A booking being made has a record of its own, with no id, until it
+# is stored and shares the venue's record of the guest.
+#
+
+class Customer:
+    """
+    A Customer object is the record of one guest.
+    """
+
+    __slots__ = ("_id", "_name", "_phone", "_key")
+
+    def __init__(self, customerId: int, name: str, phone: str, key: tuple):
+        self._id = customerId
+        self._name = name
+        self._phone = phone
+        self._key = key
+
+    @property
+    def id(self):
+        """Compact customer id, or None if not stored."""
+        return self._id
+
+    @property
+    def name(self):
+        """Name as first given."""
+        return self._name
+
+    @property
+    def phone(self):
+        """Phone as first given."""
+        return self._phone
+
+    @property
+    def key(self):
+        """Identity of the guest, see Customers.key()."""
+        return self._key
+
+    @property
+    def digits(self):
+        """Canonical phone: its digits only."""
+        return self._key[0]
+
+    def __repr__(self) -> str:
+        return f"Customer({self._id}, {self._name!r}, {self.digits!r})"
+
+
+#
+# Customers class
+#
+# The customer records of a venue's stored bookings and rules, so that many
+# bookings of one guest share one record, with the names and phones interned.
+# Comparing customer keys makes the same-customer checks exact whatever the
+# formatting, and Bookings.customerHistory() finds a guest's bookings by id.
+#
+# Only stored bookings and rules are interned, so the names and phones typed
+# into the booking form are not kept, and the records of guests with nothing
+# left stored are forgotten by a background job (see pytock_maintenance.py).
+# A booking holds its record itself, so a forgotten record still serves the
+# bookings of older versions. Records are added and forgotten under a lock;
+# lookups read the dictionaries without it. The records live in the venue's
+# data, so customer ids mean nothing to another venue or process.
+#
+# Customers are keyed by phone digits and name, so that guests sharing a phone
+# stay apart; PYTOCK_CUSTOMER_KEY=phone keys them by the digits alone.
+#
+
+class Customers:
+    """
+    A Customers object interns the customer records of one venue.
+    """
+
+    # class constants
+    BY_PHONE = os.environ.get("PYTOCK_CUSTOMER_KEY", "") == "phone"
+
+    @staticmethod
+    def venueCustomers(venue: str = None) -> 'Customers':
+        """
+        Return the venue's shared Customers object.
+        """
+        return pytock_data.resource("restaurant_customers", Customers, venue)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._byId = { }                                    # customer id -> Customer
+        self._byKey = { }                                   # key -> Customer
+        self._byText = { }                                  # (name, phone) as given -> Customer
+        self._byDigits = { }                                # digits -> tuple of Customers
+
+    def __len__(self) -> int:
+        return len(self._byId)
+
+    @staticmethod
+    def canonicalPhone(phone: str) -> str:
+        """The digits of a phone number, e.g. "79991234567"."""
+        return "".join(char for char in phone if char.isdigit())
+
+    @staticmethod
+    def key(name: str, phone: str) -> tuple:
+        """The identity of a customer: canonical phone and folded name."""
+        if Customers.BY_PHONE:
+            return (Customers.canonicalPhone(phone),)
+        return Customers.canonicalPhone(phone), " ".join(name.split()).casefold()
+
+    @staticmethod
+    def guest(name: str, phone: str) -> Customer:
+        """
+        Return a record, not stored, of the customer with this name and phone.
+        """
+        return Customer(None, name, phone, Customers.key(name, phone))
+
+    def intern(self, customer: Customer) -> Customer:
+        """
+        Return the stored record of a customer, storing a new one.
+
+        Args:
+            customer: Customer object, e.g. from guest().
+
+        Returns:
+            Customer object with an id.
+
+        Raises:
+            None.
+        """
+        if self._byId.get(customer.id) is customer:
+            return customer
+        stored = self._byText.get((customer.name, customer.phone))
+        if stored is not None:
+            return stored
+        with self._lock:
+            stored = self._byKey.get(customer.key)
+            if stored is None:
+                key = (sys.intern(customer.key[0]),) + customer.key[1:]
+                stored = Customer(next(self._ids), sys.intern(customer.name), sys.intern(customer.phone), key)
+                self.__add(stored)
+            self._byText[(customer.name, customer.phone)] = stored  # one entry per spelling
+        return stored
+
+    def __add(self, customer: Customer) -> None:
+        self._byId[customer.id] = customer
+        self._byKey[customer.key] = customer
+        self._byDigits[customer.digits] = self._byDigits.get(customer.digits, ()) + (customer,)
+
+    def retain(self, items) -> int:
+        """
+        Forget the customers that none of the items refers to.
+
+        Args:
+            items: the stored Booking and RecurringRule objects.
+
+        Returns:
+            The number of customers forgotten.
+
+        Raises:
+            None.
+        """
+        kept = {item.customer.key for item in items}
+        with self._lock:
+            customers = [customer for customer in self._byId.values() if customer.key in kept]
+            forgotten = len(self._byId) - len(customers)
+            if forgotten:
+                self._byId, self._byKey, self._byDigits = { }, { }, { }
+                for customer in customers:
+                    self.__add(customer)
+                self._byText = {text: customer for text, customer in self._byText.items()
+                                if self._byId.get(customer.id) is customer}
+        return forgotten
+
+    def find(self, name: str, phone: str) -> int:
+        """
+        Return the id of the customer with this name and phone, or None if
+        there is none.
+        """
+        customer = self._byText.get((name, phone)) or self._byKey.get(self.key(name, phone))
+        return customer.id if customer is not None else None
+
+    def get(self, customerId: int) -> Customer:
+        """
+        Return the record of a customer id.
+        """
+        return self._byId[customerId]
+
+    def withPhone(self, phone: str) -> tuple[Customer, ...]:
+        """
+        Return the customers who gave this phone, in any format.
+        """
+        return self._byDigits.get(self.canonicalPhone(phone), ())
 
 
 #
@@ -249,6 +571,15 @@ class Tables:
 # Just POD with some additional semantics important to bookings. This is also
 # the parent class of WalkinBooking, defined below.
 #
+# Each booking is given a compact integer id when it is created, which is how
+# Bookings stores, finds, and deletes it, and how the UI keys its widgets. The
+# guest is held as a customer record (see Customers), shared with the other
+# bookings of the guest once stored, and bookings are the same customer exactly
+# when their customer keys are equal.
+#
+# Bookings are created in great numbers and never changed once stored, so their
+# attributes are slots.
+#
 
 class Booking:
     """
@@ -256,6 +587,14 @@ class Booking:
     table, phone, start time, and reservation period.
     """
 
+    __slots__ = ("_id", "_tablename", "_customer", "_start", "_period")
+
+    # class constants
+    EXPIRY_GRACE = datetime.timedelta(minutes=int(os.environ.get("PYTOCK_EXPIRY_GRACE", "15")))
+
+    # class state
+    _ids = itertools.count(1)
+
     @classmethod
     def compareByStartKey(cls, bk: 'Booking') -> datetime.datetime:
         return bk.start
@@ -267,7 +606,7 @@ class Booking:
         """
 
         # get current time + 1 hour
-        deftime = datetime.datetime.now()
+        deftime = pytock_clock.now()
     
         # Calculate the remaining minutes and seconds to the next hour
         minutes_to_add = (60 - deftime.minute) % 60
@@ -275,7 +614,7 @@ class Booking:
 
         # Add a timedelta for the remaining time to get to at least another hour
         time_to_next_hour = datetime.timedelta(hours=1, minutes=minutes_to_add, seconds=seconds_to_add)
-        rounded_time = datetime.datetime.now() + time_to_next_hour
+        rounded_time = pytock_clock.now() + time_to_next_hour
 
         # Zero out minutes, seconds, and microseconds
         rounded_time = rounded_time.replace(minute=0, second=0, microsecond=0)
@@ -283,35 +622,51 @@ class Booking:
 
     @classmethod
     def defBookingPeriod(cls) -> datetime.datetime:
-        return datetime.timedelta(minutes=90) + datetime.datetime.now().replace(hour=0,minute=0,second=0,microsecond=0)
+        return datetime.timedelta(minutes=90) + pytock_clock.now().replace(hour=0,minute=0,second=0,microsecond=0)
 
     @classmethod
     def maxBookingTime(cls) -> datetime.time:
         # maximum table booking time is 8 hours
         return datetime.time(8, 0)
 
-    def __init__(self, tablename, name, phone, start, period):
+    def __init__(self, tablename, name, phone, start, period, bookingId: int = None, day: datetime.date = None,
+                 customer: Customer = None):
+        self._id = bookingId if bookingId is not None else next(Booking._ids)
         self._tablename = tablename
-        self._name = name
-        self._phone = phone
-        todate = datetime.datetime.today().date()
+        self._customer = customer or Customers.guest(name, phone)
+        todate = day or pytock_clock.today()
         self._start = datetime.datetime.combine(todate, start)
         self._period = period
 
+    @property
+    def id(self):
+        """Unique booking id."""
+        return self._id
+
     @property
     def tablename(self):
         """Name of the booked table."""
         return self._tablename
 
+    @property
+    def customer(self):
+        """Customer record."""
+        return self._customer
+
+    @property
+    def customerId(self):
+        """Id of the customer record, or None if not stored."""
+        return self._customer.id
+
     @property
     def name(self):
         """Customer name."""
-        return self._name
+        return self._customer.name
 
     @property
     def phone(self):
         """Customer phone."""
-        return self._phone
+        return self._customer.phone
 
     @property
     def start(self):
@@ -323,12 +678,30 @@ class Booking:
         """Period datetime.time."""
         return self._period
 
-    def keyString(self) -> str:
-        return "-".join([self.tablename, self.name, self.phone, str(self.start), str(self.period)])
+    @property
+    def end(self):
+        """End datetime.datetime."""
+        return self.start + datetime.timedelta(hours=self.period.hour, minutes=self.period.minute)
+
+    @property
+    def expires(self):
+        """Datetime.datetime after which the booking has expired."""
+        return self.end + Booking.EXPIRY_GRACE
 
     def expired(self, now: datetime.datetime) -> bool:
-        # bookings never expire because we live in a timeless world
-        False
+        """
+        True iff the booking ended more than EXPIRY_GRACE before now.
+
+        Args:
+            now: datetime.datetime.
+
+        Returns:
+            bool.
+
+        Raises:
+            None.
+        """
+        return now >= self.expires
     
     def overlap(self, booking: 'Booking') -> bool:
         """
@@ -366,7 +739,7 @@ class Booking:
             None.
         """
 
-        if self.name != booking.name or self.phone != booking.phone:
+        if self._customer.key != booking._customer.key:
             return False
         if matchTable and booking.tablename != self.tablename:
             return False
@@ -388,11 +761,17 @@ class Booking:
             None.
         """
         return self.tablename == booking.tablename \
-            and self.name == booking.name \
-            and self.phone == booking.phone \
+            and self._customer.key == booking._customer.key \
             and self.start == booking.start \
             and self.period == booking.period
 
+    def intern(self, customers: 'Customers') -> None:
+        """
+        Share the venue's record of our customer. Called by Bookings just
+        before the booking is stored, the one change made to a booking.
+        """
+        self._customer = customers.intern(self._customer)
+
     def description(self) -> str:
         """
         Display a description string:
@@ -429,9 +808,20 @@ class WalkinBooking(Booking):
     A WalkinBooking object tracks the state of a walk-in customer booking, which
     occupies a "layer" in front of the advanced reservations.
     """
+
+    __slots__ = ()
+
+    # class constants
+    GUEST = Customers.guest("Walk-In Guest", "")            # not a customer, so never interned
         
-    def __init__(self, tablename: str):
-        super().__init__(tablename, "Walk-In Guest", "", datetime.time(hour=0,minute=0,second=0), datetime.time(hour=23,minute=59,second=59))
+    def __init__(self, tablename: str, bookingId: int = None):
+        super().__init__(tablename, "Walk-In Guest", "", datetime.time(hour=0,minute=0,second=0), datetime.time(hour=23,minute=59,second=59), bookingId,
+                         customer=WalkinBooking.GUEST)
+
+    def intern(self, customers: 'Customers') -> None:
+        """
+        Walk-ins share the one GUEST record.
+        """
 
     def overlap(self, booking: 'Booking') -> bool:
         """
@@ -469,258 +859,2371 @@ class WalkinBooking(Booking):
 
 
 #
-# Bookings class
-#
-# A Bookings object is a collection of Booking objects, where the "source of
-# truth" and backing data storage is the shared streamlit backend resource
-# cache. Callers may instantiate a new Bookings() object at any time and it will
-# have the latest data.
-#
-# Bookings references tables, but the reverse is carefully avoided. A Table is
-# created or deleted without any notice to Bookings, so it is necessary to check
-# that all referenced tables exist when performing booking operations. Bookings
-# with missing tables are culled when identified by the self.__tableGC() method.
-# Design alternatives would require more coupling between tables and bookings,
-# which is better avoided where possible.
-#
-# Conflict management is quite simplified from the real world. Customers are the
-# same if their name and phone number match exactly. Customers may have as many
-# bookings as they like that do not overlap, but they may not book more than one
-# table at any given time.
-#
-# Because this is a classroom project it does not actually track real time. The
-# date/time model used here is a single day where the period of a booking can
-# overflow to the next day. Obviously in a real system bookings would be used or
-# expired, but here we are apart from time and tables are considered "free" only
-# when they have no bookings at any time.
+# JoinedBooking class
 #
-# WalkIns are just another booking, except that they are in addition to any
-# existing advance booking for the table involved. At most one walkIn is allowed
-# for each table.
+# Subclass of Booking for one table of a party seated at several joined tables.
+# A joined booking is stored as one part per table, so that every per-table
+# check, view and expiry treats it like any other booking; each part knows the
+# ids and tables of all the parts, which are added and deleted together.
 #
 
-class Bookings:
+class JoinedBooking(Booking):
     """
-    A Bookings object maintains a list of bookings and their group semantics,
-    such as ensuring that there are no overlapping reservations for the same
-    table, or that a name/phone has not been used for double-booking.
+    A JoinedBooking object books one of the tables joined for a large party.
     """
 
-    def __init__(self):
-        self.__reload()
+    __slots__ = ("_parts", "_tablenames", "_size")
 
-    def __reload(self):
-        """
-        Read latest state
-        """
-        self.bookings = pytock_data.get("restaurant_bookings")
-        if not self.bookings:
-            self.bookings = []
-            self.__save()
+    def __init__(self, tablename, name, phone, start, period, parts: tuple, tablenames: tuple, size: int,
+                 bookingId: int = None, day: datetime.date = None):
+        super().__init__(tablename, name, phone, start, period, bookingId, day)
+        self._parts = tuple(parts)
+        self._tablenames = tuple(tablenames)
+        self._size = size
 
-    def __save(self):
-        """
-        Save our state
-        """
-        pytock_data.set("restaurant_bookings", self.bookings)
+    @property
+    def parts(self):
+        """Booking ids of all the parts, this one included."""
+        return self._parts
 
-    def __tableGC(self):
-        """
-        Remove bookings that reference missing tables.
-        """
-        tables = Tables()
-        now = datetime.datetime.now()
-        self.bookings = [bk for bk in self.bookings if self.__validBooking(bk, tables, now)]
-        self.__save()
-        return tables
+    @property
+    def tablenames(self):
+        """Names of all the joined tables."""
+        return self._tablenames
 
-    def __validBooking(self, bk: Booking, tables: Tables, now: datetime.datetime) -> bool:
-        """
-        Return true iff booking is still valid
-        """
-        return tables.findTable(bk.tablename) and not bk.expired(now)
+    @property
+    def size(self):
+        """Number of guests in the party."""
+        return self._size
 
-    def utilization(self) -> tuple[int, int]:
+    def description(self) -> str:
         """
-        Report the utilized (non-free) tables and seats.
+        Display our description string, marked with the joined tables.
 
         Args:
             None.
 
         Returns:
-            tables, seats.
+            string.
 
         Raises:
             None.
         """
-        tables = self.__tableGC()
-        utilized = { }
-        tableCount = 0
-        seatCount = 0
-        for bk in self.bookings:
-            table = tables.findTable(bk.tablename)
-            if not bk.tablename in utilized:
-                utilized[bk.tablename] = True
-                tableCount += 1
-                seatCount += table.seats
-        return tableCount, seatCount
+        others = " + ".join(name for name in self.tablenames if name != self.tablename)
+        return super().description() + f"*{self.size} guests, joined with {others}*  \n"
 
-    def tableStatus(self) -> dict:
-        """
-        Report the booking status by tables.
 
-        Args:
-            None.
+#
+# RecurringRule class
+#
+# A standing booking, e.g. every week at 19:00 on Table 5, stored as one object
+# however long it runs. Occurrences are generated on demand for the dates being
+# looked at, so a rule costs the same whether it ends next month or never.
+# Single dates can be skipped without changing the rest of the series.
+#
+# Like Booking, a rule is never changed once stored: skip() returns a new rule,
+# as does after(), which the expiry sweep uses to start a rule from its next
+# date once an occurrence has expired.
+#
 
-        Returns:
-            Dictionary with table names as keys and array of Booking objects
-            as data. Each array of bookings is sorted by start time.
+class RecurringRule:
+    """
+    A RecurringRule object describes a booking repeated every `interval` weeks
+    from its first date, optionally until a last date.
+    """
 
-        Raises:
-            None.
-        """
+    def __init__(self, tablename: str, name: str, phone: str, start: datetime.time, period: datetime.time,
+                 first: datetime.date = None, until: datetime.date = None, interval: int = 1,
+                 ruleId: int = None, skipped: frozenset = frozenset(), customer: Customer = None):
+        if interval < 1:
+            raise exceptions.InvalidInputError(f"invalid interval argument '{interval}'")
+        self._id = ruleId if ruleId is not None else next(Booking._ids)
+        self._tablename = tablename
+        self._customer = customer or Customers.guest(name, phone)
+        self._start = start
+        self._period = period
+        self._first = first or pytock_clock.today()
+        self._until = until
+        self._interval = interval
+        self._skipped = frozenset(skipped)
 
-        self.__tableGC()
-        output = { }
-        for bk in self.bookings:
-            if bk.tablename in output:
-                output[bk.tablename].append(bk)
-            else:
-                output[bk.tablename] = [bk]
-        for tablename, bookings in output.items():
-            bookings.sort(key=Booking.compareByStartKey)
-        return output
+    @property
+    def id(self):
+        """Unique rule id, shared by all its occurrences."""
+        return self._id
 
-    def bookingAvailable(self, booking: Booking) -> bool:
-        """
-        Check if a new booking would conflict in time and table. This ignores
-        the name and phone.
+    @property
+    def tablename(self):
+        """Name of the booked table."""
+        return self._tablename
 
-        Args:
-            Booking object.
+    @property
+    def customer(self):
+        """Customer record."""
+        return self._customer
 
-        Returns:
-            True if available, otherwise False.
+    @property
+    def customerId(self):
+        """Id of the customer record, or None if not stored."""
+        return self._customer.id
 
-        Raises:
-            None.
-        """
-        self.__tableGC()
-        for bk in self.bookings:
-            if bk.tablename == booking.tablename and bk.overlap(booking):
-                return False
-        return True
+    @property
+    def name(self):
+        """Customer name."""
+        return self._customer.name
+
+    @property
+    def phone(self):
+        """Customer phone."""
+        return self._customer.phone
+
+    @property
+    def start(self):
+        """Start datetime.time of each occurrence."""
+        return self._start
+
+    @property
+    def period(self):
+        """Period datetime.time of each occurrence."""
+        return self._period
+
+    @property
+    def first(self):
+        """Date of the first occurrence."""
+        return self._first
+
+    @property
+    def until(self):
+        """Last date on which the rule may occur, or None if open-ended."""
+        return self._until
+
+    @property
+    def interval(self):
+        """Weeks between occurrences."""
+        return self._interval
+
+    @property
+    def skipped(self):
+        """Frozenset of dates on which the rule does not occur."""
+        return self._skipped
+
+    def occursOn(self, day: datetime.date) -> bool:
+        """
+        True iff the rule has an occurrence on the date.
+
+        Args:
+            day: datetime.date.
+
+        Returns:
+            bool.
+
+        Raises:
+            None.
+        """
+        return day >= self.first and (self.until is None or day <= self.until) \
+            and (day - self.first).days % (7 * self.interval) == 0 and day not in self.skipped
+
+    def occurrences(self, fromDate: datetime.date, toDate: datetime.date, withSkipped: bool = False):
+        """
+        Generate the occurrences within an inclusive date range, in date order.
+        Only the dates of the series are visited, a step of whole weeks apart.
+
+        Args:
+            fromDate: first datetime.date.
+            toDate: last datetime.date.
+            withSkipped: True to include the skipped dates.
+
+        Returns:
+            Generator of RecurringBooking objects.
+
+        Raises:
+            None.
+        """
+        step = datetime.timedelta(weeks=self.interval)
+        day = max(fromDate, self.first)
+        day += datetime.timedelta(days=-(day - self.first).days % step.days)
+        last = toDate if self.until is None else min(toDate, self.until)
+        while day <= last:
+            if withSkipped or day not in self.skipped:
+                yield RecurringBooking(self, day)
+            day += step
+
+    def occurrencesNear(self, booking: Booking):
+        """
+        Generate the occurrences that could overlap a booking, i.e. those
+        starting from the day before it, whose period may run past midnight.
+
+        Args:
+            booking: Booking object.
+
+        Returns:
+            Generator of RecurringBooking objects.
+
+        Raises:
+            None.
+        """
+        return self.occurrences(booking.start.date() - datetime.timedelta(days=1), booking.end.date())
+
+    def conflicts(self, rule: 'RecurringRule') -> tuple[bool, bool]:
+        """
+        Check whether another rule ever overlaps us on the same table, or for
+        the same name/phone. Both series repeat together every least common
+        multiple of their intervals, so only one such cycle from the later
+        first date is examined. Skipped dates are ignored, as they could be
+        restored by a new rule.
+
+        Args:
+            rule: RecurringRule object.
+
+        Returns:
+            (busy, duplicate) booleans.
+
+        Raises:
+            None.
+        """
+        fromDate = max(self.first, rule.first)
+        toDate = fromDate + datetime.timedelta(weeks=math.lcm(self.interval, rule.interval), days=1)
+        busy = duplicate = False
+        for ours in self.occurrences(fromDate - datetime.timedelta(days=1), toDate, True):
+            for theirs in rule.occurrences(ours.start.date() - datetime.timedelta(days=1), ours.end.date(), True):
+                busy = busy or (ours.tablename == theirs.tablename and bool(ours.overlap(theirs)))
+                duplicate = duplicate or bool(ours.duplicate(theirs))
+            if busy and duplicate:
+                break
+        return busy, duplicate
+
+    def skip(self, day: datetime.date) -> 'RecurringRule':
+        """
+        Return a copy of the rule without the occurrence on the date.
+
+        Args:
+            day: datetime.date.
+
+        Returns:
+            RecurringRule object.
+
+        Raises:
+            None.
+        """
+        return RecurringRule(self.tablename, self.name, self.phone, self.start, self.period,
+                             self.first, self.until, self.interval, self.id, self.skipped | {day}, self._customer)
+
+    def after(self, day: datetime.date) -> 'RecurringRule':
+        """
+        Return a copy of the rule that starts with its first date after the
+        date, dropping the skipped dates before it, e.g. once the occurrences
+        up to the date have expired.
+
+        Args:
+            day: datetime.date.
+
+        Returns:
+            RecurringRule object, or None if the rule has no later date.
+
+        Raises:
+            None.
+        """
+        step = 7 * self.interval
+        first = self.first + datetime.timedelta(days=max(0, ((day - self.first).days // step + 1) * step))
+        if self.until is not None and first > self.until:
+            return None
+        return RecurringRule(self.tablename, self.name, self.phone, self.start, self.period, first, self.until,
+                             self.interval, self.id, {each for each in self.skipped if each >= first},
+                             self._customer)
+
+    def intern(self, customers: 'Customers') -> None:
+        """
+        Share the venue's record of our customer. Called by Bookings just
+        before the rule is stored, the one change made to a rule.
+        """
+        self._customer = customers.intern(self._customer)
+
+    def description(self) -> str:
+        """
+        Display a description string, e.g. "every week from 2026-10-19".
+
+        Args:
+            None.
+
+        Returns:
+            string.
+
+        Raises:
+            None.
+        """
+        every = "every week" if self.interval == 1 else f"every {self.interval} weeks"
+        until = f" until {self.until.isoformat()}" if self.until else ""
+        return f"{every} from {self.first.isoformat()}{until}"
+
+
+#
+# RecurringBooking class
+#
+# Subclass of Booking for one occurrence of a RecurringRule. Occurrences are
+# made on the fly and never stored; they carry the id of their rule, which is
+# unique among the bookings shown for any one date.
+#
+
+class RecurringBooking(Booking):
+    """
+    A RecurringBooking object is the occurrence of a RecurringRule on a date.
+    """
+
+    __slots__ = ("_rule",)
+
+    def __init__(self, rule: RecurringRule, day: datetime.date):
+        super().__init__(rule.tablename, rule.name, rule.phone, rule.start, rule.period, rule.id, day,
+                         customer=rule.customer)
+        self._rule = rule
+
+    @property
+    def ruleId(self):
+        """Id of the rule this is an occurrence of."""
+        return self._rule.id
+
+    @property
+    def rule(self):
+        """The RecurringRule this is an occurrence of."""
+        return self._rule
+
+    def description(self) -> str:
+        """
+        Display our description string, marked as recurring.
+
+        Args:
+            None.
+
+        Returns:
+            string.
+
+        Raises:
+            None.
+        """
+        return super().description() + f"*{self._rule.description()}*  \n"
+
+
+#
+# Bookings class
+#
+# A Bookings object is a collection of Booking objects, where the "source of
+# truth" and backing data storage is the shared streamlit backend resource
+# cache. Callers may instantiate a new Bookings() object at any time and it will
+# have the latest data.
+#
+# Bookings references tables, but the reverse is carefully avoided. A Table is
+# created or deleted without any notice to Bookings, so it is necessary to check
+# that all referenced tables exist when performing booking operations. Bookings
+# with missing tables are culled when identified by the self.__tableGC() method.
+# Design alternatives would require more coupling between tables and bookings,
+# which is better avoided where possible.
+#
+# Conflict management is quite simplified from the real world. Customers are the
+# same if their names match ignoring case and spacing and their phones have the
+# same digits, i.e. they have the same customer key (see Customers). Customers
+# may have as many bookings as they like that do not overlap, but they may not
+# book more than one table at any given time.
+#
+# The date/time model used here is a single day where the period of a booking
+# can overflow to the next day. Bookings expire EXPIRY_GRACE after they end, and
+# tables are considered "free" only when they have no unexpired bookings. Expiry
+# is driven by a min-heap of (expiry time, booking id) shared by all sessions,
+# which sweepExpired() pops from a background task (see pytock_sweeper.py), so
+# that only expired bookings are touched and queries need not check the time.
+# Entries for bookings deleted earlier are simply discarded when popped.
+#
+# Changes are made under the pytock_data lock on freshly loaded state, so that
+# concurrent sessions and the sweeper never overwrite each other's changes. An
+# operation copies only the containers it changes, when it first changes them,
+# and hands the copy over to the store when it saves.
+#
+# WalkIns are just another booking, except that they are in addition to any
+# existing advance booking for the table involved. At most one walkIn is allowed
+# for each table.
+#
+# The stored bookings are a dictionary from booking id to Booking, kept in the
+# order the bookings were made, so that finding a booking by its id takes
+# constant time. Stored data is never changed in place, since sessions may
+# still be reading it in their run snapshots, so adding or deleting a booking
+# copies the dictionary: O(n) in the bookings stored, once per operation
+# however many bookings it changes.
+#
+# Every change is also published on the pytock_data change feed, e.g. as
+# "booking_added", "walk_out" or "booking_expired" with the booking concerned.
+#
+# Standing bookings are stored separately as RecurringRule objects, by rule id.
+# Their occurrences are never stored: the checks for a new booking generate
+# only the occurrences around its date, and the status views only those of
+# today, which count like any other booking. The sweeper expires occurrences
+# like bookings, archiving them and moving each rule on to its next date; a rule
+# with no dates left is deleted.
+#
+# Walk-in parties that find no table wait on a waitlist, stored by party id.
+# Whenever a table may have come free, i.e. a walk-out, a deleted booking or
+# occurrence, or an expiry, the parties are matched against just those tables
+# (see Waitlist), and the best fit is seated there as a walk-in.
+#
+
+class Bookings:
+    """
+    A Bookings object maintains a list of bookings and their group semantics,
+    such as ensuring that there are no overlapping reservations for the same
+    table, or that a name/phone has not been used for double-booking.
+    """
+
+    # class constants
+    SEATED_KEPT = 10                                        # seated parties still shown
+
+    @pytock_trace.traced("Bookings.load")
+    def __init__(self, venue: str = None):
+        """
+        Read the venue's run snapshot. The venue defaults to that of the current
+        script run.
+        """
+        self.venue = pytock_data.current_venue(venue)
+        self.__reload()
+
+    def __reload(self, latest: bool = False):
+        """
+        Read the run's snapshot, or for changes the latest
+        """
+        self.byId = pytock_data.latest("restaurant_bookings", self.venue) if latest \
+            else pytock_data.get("restaurant_bookings", self.venue)
+        if self.byId is None:
+            self.byId = { }
+            self.__save()
+        self.rules = pytock_data.latest("restaurant_rules", self.venue) if latest \
+            else pytock_data.get("restaurant_rules", self.venue)
+        if self.rules is None:
+            self.rules = { }
+            self.__saveRules()
+        self.parties = pytock_data.latest("restaurant_waitlist", self.venue) if latest \
+            else pytock_data.get("restaurant_waitlist", self.venue)
+        if self.parties is None:
+            self.parties = { }
+            self.__saveParties()
+        self.__latest = latest
+
+    def __changing(self, name: str) -> dict:
+        """
+        Return the container named, "byId", "rules" or "parties", ready to be
+        changed: the stored read-only mapping is copied on the first change
+        after loading or saving it, so an operation copies only what it
+        changes, in O(n) of its size.
+        """
+        value = getattr(self, name)
+        if not isinstance(value, dict):
+            value = dict(value)
+            setattr(self, name, value)
+        return value
+
+    def __save(self):
+        """
+        Save our state, handing it over: what was saved is read-only
+        from now on
+        """
+        pytock_data.set("restaurant_bookings", self.byId, self.venue)
+        self.byId = pytock_data.latest("restaurant_bookings", self.venue)
+
+    def __saveRules(self):
+        """
+        Save our recurring rules, handing them over: what was saved is
+        read-only from now on
+        """
+        pytock_data.set("restaurant_rules", self.rules, self.venue)
+        self.rules = pytock_data.latest("restaurant_rules", self.venue)
+
+    def __saveParties(self, waitlist: 'Waitlist' = None):
+        """
+        Save our waitlist, handing it over: what was saved is read-only
+        from now on. The shared Waitlist, if changed along, reflects it.
+        """
+        pytock_data.set("restaurant_waitlist", self.parties, self.venue)
+        self.parties = pytock_data.latest("restaurant_waitlist", self.venue)
+        if waitlist is not None:
+            waitlist.source = self.parties
+
+    @pytock_trace.traced("Bookings.collectGarbage")
+    def collectGarbage(self) -> int:
+        """
+        Remove the bookings and rules of deleted tables now, rather than when
+        they are next looked at. Run by a background job after tables are
+        deleted (see pytock_maintenance.py).
+
+        Args:
+            None.
+
+        Returns:
+            The number of bookings and rules removed.
+
+        Raises:
+            None.
+        """
+        with pytock_data.lock(self.venue):                  # count on the latest data, not the snapshot
+            self.__reload(latest=True)
+            before = len(self.byId) + len(self.rules)
+            self.__tableGC()
+            removed = before - len(self.byId) - len(self.rules)
+        self.__reload()
+        return removed
+
+    @pytock_trace.traced("Bookings.forgetCustomers")
+    def forgetCustomers(self) -> int:
+        """
+        Forget the customer records of guests with no stored booking or rule
+        left. Run by a background job (see pytock_maintenance.py).
+
+        Args:
+            None.
+
+        Returns:
+            The number of customers forgotten.
+
+        Raises:
+            None.
+        """
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            forgotten = Customers.venueCustomers(self.venue).retain(
+                itertools.chain(self.byId.values(), self.rules.values()))
+        self.__reload()
+        return forgotten
+
+    @property
+    def bookings(self) -> list[Booking]:
+        """List of bookings in the order they were made."""
+        return list(self.byId.values())
+
+    @property
+    def recurring(self) -> list[RecurringRule]:
+        """List of recurring rules in the order they were made."""
+        return list(self.rules.values())
+
+    @staticmethod
+    def dayBookings(byId, rules, day: datetime.date) -> list[Booking]:
+        """
+        Stored bookings together with the occurrences of the rules on the day.
+        """
+        output = list((byId or {}).values())
+        for rule in (rules or {}).values():
+            output.extend(rule.occurrences(day, day))
+        return output
+
+    def occurrences(self, fromDate: datetime.date, toDate: datetime.date):
+        """
+        Generate the occurrences of all recurring rules within an inclusive
+        date range, rule by rule.
+
+        Args:
+            fromDate: first datetime.date.
+            toDate: last datetime.date.
+
+        Returns:
+            Generator of RecurringBooking objects.
+
+        Raises:
+            None.
+        """
+        for rule in self.rules.values():
+            yield from rule.occurrences(fromDate, toDate)
+
+    def __today(self) -> list[Booking]:
+        """
+        Return the stored bookings and today's occurrences.
+        """
+        return Bookings.dayBookings(self.byId, self.rules, pytock_clock.today())
+
+    @staticmethod
+    def findStale(byId, rules, tables) -> tuple[tuple, tuple]:
+        """
+        Find the ids of the bookings and rules that reference missing tables.
+        Used to derive the shared per-version result.
+        """
+        names = {table.name for table in tables or ()}
+        return tuple(bk.id for bk in (byId or {}).values() if bk.tablename not in names), \
+            tuple(rule.id for rule in (rules or {}).values() if rule.tablename not in names)
+
+    @pytock_metrics.timed("bookings_tableGC")
+    def __tableGC(self):
+        """
+        Remove bookings that reference missing tables, with every part of a
+        joined booking that has a part on one. The stale ids of the stored
+        data are found once per version and shared, so this is a lookup unless
+        a table was deleted; a private copy being changed is scanned.
+        """
+        tables = Tables(self.venue)
+        if self.__latest:
+            stale, staleRules = Bookings.findStale(self.byId, self.rules, tables.tables)
+        else:
+            stale, staleRules = pytock_data.derive(("restaurant_bookings", "restaurant_rules", "restaurant_tables"),
+                                                   "stale", Bookings.findStale, self.venue)
+        if stale or staleRules:
+            with pytock_data.lock(self.venue):                          # recheck, tables may be newer than the snapshot
+                self.__reload(latest=True)
+                tables = Tables(self.venue, latest=True)
+                culled = [ ]
+                for bookingId in stale:
+                    bk = self.byId.get(bookingId)
+                    if bk and not self.__validBooking(bk, tables):
+                        parts = bk.parts if isinstance(bk, JoinedBooking) else (bookingId,)     # all or none
+                        culled.extend(self.__changing("byId").pop(partId) for partId in parts if partId in self.byId)
+                culledRules = [ ]
+                for ruleId in staleRules:
+                    rule = self.rules.get(ruleId)
+                    if rule and not self.__validBooking(rule, tables):
+                        culledRules.append(self.__changing("rules").pop(ruleId))
+                self.__save()
+                self.__saveRules()
+                for bk in culled:
+                    self.__published(Bookings.deletedKind(bk), bk)
+                for rule in culledRules:
+                    pytock_data.publish("rule_deleted", "restaurant_rules", rule, self.venue)
+        return tables
+
+    def __validBooking(self, bk: Booking, tables: Tables) -> bool:
+        """
+        Return true iff booking or rule is still valid
+        """
+        return tables.findTable(bk.tablename) is not None
+
+    def __expiryHeap(self) -> list:
+        """
+        Return the shared expiry heap of (expires, booking id) tuples.
+        """
+        return pytock_data.resource("restaurant_expiry", list, self.venue)
+
+    def __insert(self, *bookings: Booking) -> None:
+        """
+        Store new bookings as one change and schedule their expiry. Called
+        with the lock held.
+        """
+        customers = Customers.venueCustomers(self.venue)
+        for booking in bookings:
+            booking.intern(customers)
+            self.__changing("byId")[booking.id] = booking
+            heapq.heappush(self.__expiryHeap(), (booking.expires, booking.id))
+        self.__save()
+        for booking in bookings:
+            self.__published("walk_in" if isinstance(booking, WalkinBooking) else "booking_added", booking)
+
+    def __published(self, kind: str, booking: Booking) -> None:
+        """
+        Publish a change to the stored bookings on the pytock_data feed.
+        """
+        pytock_data.publish(kind, "restaurant_bookings", booking, self.venue)
+
+    @staticmethod
+    def deletedKind(booking: Booking) -> str:
+        """
+        The feed event kind for removing a booking before it expired.
+        """
+        return "walk_out" if isinstance(booking, WalkinBooking) else "booking_deleted"
+
+    def sweepExpired(self, now: datetime.datetime, before=None) -> list[Booking]:
+        """
+        Remove all bookings that have expired, publishing them as one change.
+        Only the expiry heap entries that are due are examined. The expired
+        occurrences of recurring rules are removed too, by starting each rule
+        from its next date, and a rule with none left is deleted. The bookings
+        and occurrences due are first handed to before(bookings), if given,
+        without the lock; should it raise, nothing is removed and they stay
+        due.
+
+        Args:
+            now: datetime.datetime.
+            before: optional callable, e.g. to archive the bookings.
+
+        Returns:
+            List of the expired Booking and RecurringBooking objects removed.
+
+        Raises:
+            Whatever before() raises.
+        """
+        with pytock_data.lock(self.venue):
+            byId = pytock_data.latest("restaurant_bookings", self.venue) or { }
+            heap = self.__expiryHeap()
+            if not heap and byId:                           # rebuild if the heap was lost
+                heap.extend((bk.expires, bk.id) for bk in byId.values())
+                heapq.heapify(heap)
+            due = [ ]
+            while heap and heap[0][0] <= now:
+                expires, bookingId = heapq.heappop(heap)
+                if bookingId in byId:
+                    due.append(byId[bookingId])
+            occurrences = [occurrence for rule in (pytock_data.latest("restaurant_rules", self.venue) or { }).values()
+                           for occurrence in rule.occurrences(rule.first, now.date()) if occurrence.expired(now)]
+        if not due and not occurrences:
+            return [ ]
+        if before:
+            try:
+                before(due + occurrences)
+            except Exception:
+                with pytock_data.lock(self.venue):
+                    for booking in due:
+                        heapq.heappush(heap, (booking.expires, booking.id))
+                raise
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            expired = [self.__changing("byId").pop(booking.id) for booking in due if booking.id in self.byId]
+            if expired:
+                self.__save()
+                for booking in expired:
+                    self.__published("booking_expired", booking)
+            lastDays = { }
+            for occurrence in occurrences:
+                lastDays[occurrence.ruleId] = max(lastDays.get(occurrence.ruleId, occurrence.start.date()),
+                                                  occurrence.start.date())
+            moved, ended = set(), [ ]
+            for ruleId, day in lastDays.items():
+                rule = self.rules.get(ruleId)
+                if rule is None or rule.first > day:        # deleted or already moved on
+                    continue
+                later = rule.after(day)
+                if later is None:
+                    ended.append(self.__changing("rules").pop(ruleId))
+                else:
+                    self.__changing("rules")[ruleId] = later
+                moved.add(ruleId)
+            occurrences = [occurrence for occurrence in occurrences if occurrence.ruleId in moved]
+            if moved:
+                self.__saveRules()
+                for occurrence in occurrences:
+                    pytock_data.publish("occurrence_expired", "restaurant_rules", occurrence, self.venue)
+                for rule in ended:
+                    pytock_data.publish("rule_deleted", "restaurant_rules", rule, self.venue)
+            if expired or occurrences:
+                self.__seatWaiting({booking.tablename for booking in expired + occurrences})
+        return expired + occurrences
+
+    def nextExpiry(self) -> datetime.datetime:
+        """
+        Report when the earliest scheduled expiry is due, of a stored booking
+        or of an occurrence of a recurring rule up to today.
+
+        Args:
+            None.
+
+        Returns:
+            datetime.datetime, or None if nothing is scheduled.
+
+        Raises:
+            None.
+        """
+        today = pytock_clock.today()
+        with pytock_data.lock(self.venue):
+            heap = self.__expiryHeap()
+            dues = [heap[0][0]] if heap else [ ]
+            for rule in (pytock_data.latest("restaurant_rules", self.venue) or { }).values():
+                occurrence = next(rule.occurrences(rule.first, today), None)
+                if occurrence is not None:
+                    dues.append(occurrence.expires)
+            return min(dues, default=None)
+
+    @pytock_trace.traced("Bookings.utilization")
+    def utilization(self) -> tuple[int, int]:
+        """
+        Report the utilized (non-free) tables and seats.
+
+        Args:
+            None.
+
+        Returns:
+            tables, seats.
+
+        Raises:
+            None.
+        """
+        tables = self.__tableGC()
+        utilized = { }
+        tableCount = 0
+        seatCount = 0
+        for bk in self.__today():
+            table = tables.findTable(bk.tablename)
+            if not bk.tablename in utilized:
+                utilized[bk.tablename] = True
+                tableCount += 1
+                seatCount += table.seats
+        return tableCount, seatCount
+
+    @pytock_trace.traced("Bookings.tableStatus")
+    def tableStatus(self) -> dict:
+        """
+        Report the booking status by tables.
+
+        Args:
+            None.
+
+        Returns:
+            Dictionary with table names as keys and array of Booking objects
+            as data. Each array of bookings is sorted by start time.
+
+        Raises:
+            None.
+        """
+
+        self.__tableGC()
+        output = { }
+        for bk in self.__today():
+            if bk.tablename in output:
+                output[bk.tablename].append(bk)
+            else:
+                output[bk.tablename] = [bk]
+        for tablename, bookings in output.items():
+            bookings.sort(key=Booking.compareByStartKey)
+        return output
+
+    @pytock_trace.traced("Bookings.occupancy")
+    def occupancy(self) -> 'Occupancy':
+        """
+        Report occupied tables and seats through the day. This is computed
+        once per version of the bookings and tables and shared by all sessions.
+
+        Args:
+            None.
+
+        Returns:
+            Occupancy object, which must not be changed.
+
+        Raises:
+            None.
+        """
+        self.__tableGC()
+        today = pytock_clock.today()
+        return pytock_data.derive(("restaurant_bookings", "restaurant_rules", "restaurant_tables"), ("occupancy", today),
+                                  lambda byId, rules, tables: Occupancy(Bookings.dayBookings(byId, rules, today),
+                                                                        tables or ()),
+                                  self.venue)
+
+    @pytock_trace.traced("Bookings.availability")
+    def availability(self) -> 'Availability':
+        """
+        Report free tables and busy customers by time slot for today. This is
+        computed once per version of the bookings, rules and tables and shared
+        by all sessions, so that checking a candidate booking costs a few
+        operations per slot instead of a scan of the bookings. Bookings of
+        missing tables are ignored rather than culled here.
+
+        Args:
+            None.
+
+        Returns:
+            Availability object, which must not be changed.
+
+        Raises:
+            None.
+        """
+        today = pytock_clock.today()
+        return pytock_data.derive(("restaurant_bookings", "restaurant_rules", "restaurant_tables"),
+                                  ("availability", today),
+                                  lambda byId, rules, tables: Availability(Bookings.dayBookings(byId, rules, today),
+                                                                           tables or (), today),
+                                  self.venue)
+
+    def customerHistory(self, customerId: int) -> tuple[list, list]:
+        """
+        Report a customer's stored bookings and recurring rules, from a
+        grouping by customer id made once per version of the bookings and
+        rules and shared by all sessions. Walk-ins have no customer.
+
+        Args:
+            customerId: id of the customer, e.g. from Customers.find().
+
+        Returns:
+            (list of Booking objects by start time, list of RecurringRule
+            objects), which must not be changed.
+
+        Raises:
+            None.
+        """
+        def group(byId, rules) -> dict:
+            byCustomer = { }
+            for bk in sorted((byId or { }).values(), key=Booking.compareByStartKey):
+                if not isinstance(bk, WalkinBooking):
+                    byCustomer.setdefault(bk.customerId, ([], []))[0].append(bk)
+            for rule in (rules or { }).values():
+                byCustomer.setdefault(rule.customerId, ([], []))[1].append(rule)
+            return byCustomer
+        byCustomer = pytock_data.derive(("restaurant_bookings", "restaurant_rules"), "byCustomer", group, self.venue)
+        return byCustomer.get(customerId, ([], []))
+
+    @staticmethod
+    def groupByTable(bookings) -> dict:
+        """
+        Group bookings by table name, unsorted. Used to derive the shared
+        per-version grouping, which callers must not change.
+        """
+        byTable = { }
+        for bk in bookings:
+            if bk.tablename in byTable:
+                byTable[bk.tablename].append(bk)
+            else:
+                byTable[bk.tablename] = [bk]
+        return byTable
+
+    @pytock_trace.traced("Bookings.statusPage")
+    def statusPage(self, tables: Tables, statusFilter: 'StatusFilter', page: int, pageSize: int) -> tuple[list, int]:
+        """
+        Report the booking status by tables for one page of a filtered view.
+        Bookings are grouped by table once per data version, and the tables
+        on the requested page are rendered only if they changed since they
+        were last shown (see Fragments).
+
+        Args:
+            tables: Tables object supplying the table order.
+            statusFilter: StatusFilter object selecting tables and bookings.
+            page: zero-based page number, clamped to the available pages.
+            pageSize: number of tables per page.
+
+        Returns:
+            (rows, total) where rows is a list of (Table, markdown, [(Booking,
+            markdown)]) tuples for the page, bookings in time order, and total
+            is the number of tables matching the filter.
+
+        Raises:
+            None.
+        """
+
+        self.__tableGC()
+        today = pytock_clock.today()
+        byTable = pytock_data.derive(("restaurant_bookings", "restaurant_rules"), ("byTable", today),
+                                     lambda byId, rules: Bookings.groupByTable(Bookings.dayBookings(byId, rules, today)),
+                                     self.venue)
+
+        matched = [ ]
+        for table in tables.tables:
+            if statusFilter.matchTable(table, byTable.get(table.name, [])):
+                matched.append(table)
+
+        total = len(matched)
+        pageCount = max(1, -(-total // pageSize))
+        page = min(max(page, 0), pageCount - 1)
+        fragments = Fragments.venueFragments(self.venue)
+        rows = [ ]
+        for table in matched[page * pageSize:(page + 1) * pageSize]:
+            text, rendered = fragments.render(table, byTable.get(table.name, []))
+            rows.append((table, text, [(bk, markdown) for bk, markdown in rendered if statusFilter.matchBooking(bk)]))
+        return rows, total
+
+    @pytock_trace.traced("Bookings.bookingAvailable")
+    def bookingAvailable(self, booking: Booking) -> bool:
+        """
+        Check if a new booking would conflict in time and table. This ignores
+        the name and phone. Windows held by other sessions count as taken.
+
+        Args:
+            Booking object.
+
+        Returns:
+            True if available, otherwise False.
+
+        Raises:
+            None.
+        """
+        self.__tableGC()
+        for bk in self.byId.values():
+            if bk.tablename == booking.tablename and bk.overlap(booking):
+                return False
+        for rule in self.rules.values():
+            if rule.tablename == booking.tablename:
+                for bk in rule.occurrencesNear(booking):
+                    if bk.overlap(booking):
+                        return False
+        for held in self.__heldByOthers(booking.tablename):
+            if held.overlap(booking):
+                return False
+        return True
+
+    def __heldByOthers(self, tablename: str) -> list[Booking]:
+        """
+        The windows on the table held by other sessions. Holds only stand in
+        the way of other hosts, so work without a session, i.e. background
+        jobs and replay, sees none.
+        """
+        session = pytock_data.session()
+        if session is None:
+            return [ ]
+        return Holds.venueHolds(self.venue).others(tablename, session)
+
+    @pytock_trace.traced("Bookings.bookingDuplicate")
+    def bookingDuplicate(self, booking: Booking, matchTable: bool = False) -> bool:
+        """
+        Check if a new booking would conflict in time and name/phone. This is
+        useful for checking if the customer has an existing booking during the
+        same time range.
+
+        Args:
+            Booking object.
+
+        Returns:
+            True if duplicated, otherwise False.
+
+        Raises:
+            None.
+        """
+        self.__tableGC()
+        for bk in self.byId.values():
+            if bk.duplicate(booking, matchTable):
+                return True
+        for rule in self.rules.values():
+            if rule.customer.key == booking.customer.key:
+                for bk in rule.occurrencesNear(booking):
+                    if bk.duplicate(booking, matchTable):
+                        return True
+        return False
+
+    @staticmethod
+    def __checkNotPast(booking: Booking) -> None:
+        """
+        Refuse a booking that the sweeper would expire at once. Bookings are
+        for today, so a time already past, e.g. one meant for after midnight,
+        cannot be booked.
+        """
+        if booking.expired(pytock_clock.now()):
+            raise exceptions.InvalidInputError(f"booking at {booking.start.strftime('%H:%M')} would already have ended")
+
+    @pytock_trace.traced("Bookings.add")
+    @pytock_metrics.timed("bookings_add")
+    def add(self, booking: Booking) -> bool:
+        """
+        Add a booking if the time and table are available.
+
+        Args:
+            Booking object.
+
+        Returns:
+            True iff successfully booked.
+
+        Raises:
+            InvalidInputError if the booking would have expired already,
+            DuplicateBookingError, TableBusyError.
+        """
+        Bookings.__checkNotPast(booking)
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            if self.bookingDuplicate(booking):
+                raise exceptions.DuplicateBookingError
+            if not self.bookingAvailable(booking):
+                raise exceptions.TableBusyError
+            self.__insert(booking)
+            Holds.venueHolds(self.venue).release(pytock_data.session())
+        return True
+
+    @pytock_trace.traced("Bookings.addJoined", result=lambda booking: list(booking.parts))
+    @pytock_metrics.timed("bookings_addJoined")
+    def addJoined(self, name: str, phone: str, start: datetime.time, period: datetime.time,
+                  size: int) -> JoinedBooking:
+        """
+        Book a party on the free combination of joinable tables with the
+        fewest empty seats (see Availability.combination), reserving all the
+        tables as one change. The combination is searched on the latest data
+        under the lock; a table that fails the exact check, e.g. because it
+        is held by another session, is left out and the search repeated.
+
+        Args:
+            name: customer name.
+            phone: customer phone.
+            start: datetime.time of day.
+            period: datetime.time duration.
+            size: number of guests.
+
+        Returns:
+            The JoinedBooking of the first table.
+
+        Raises:
+            InvalidInputError if the booking would have expired already,
+            DuplicateBookingError, TableBusyError if no combination is free.
+        """
+        Bookings.__checkNotPast(Booking("", name, phone, start, period, bookingId=0))
+        today = pytock_clock.today()
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            self.__tableGC()
+            if self.bookingDuplicate(Booking("", name, phone, start, period, bookingId=0)):
+                raise exceptions.DuplicateBookingError
+            availability = Availability(Bookings.dayBookings(self.byId, self.rules, today),
+                                        pytock_data.latest("restaurant_tables", self.venue) or (), today)
+            excluded = set()
+            while True:
+                tablenames = availability.combination(size, start, period, excluded)
+                if tablenames is None:
+                    raise exceptions.TableBusyError
+                parts = tuple(next(Booking._ids) for _ in tablenames)
+                bookings = [JoinedBooking(tablename, name, phone, start, period, parts, tablenames, size, partId)
+                            for tablename, partId in zip(tablenames, parts)]
+                taken = {bk.tablename for bk in bookings if not self.bookingAvailable(bk)}
+                if not taken:
+                    break
+                excluded |= taken
+            self.__insert(*bookings)
+            Holds.venueHolds(self.venue).release(pytock_data.session())
+        return bookings[0]
+
+    @pytock_trace.traced("Bookings.addRule")
+    @pytock_metrics.timed("bookings_addRule")
+    def addRule(self, rule: RecurringRule) -> bool:
+        """
+        Add a recurring rule if none of its occurrences would conflict with
+        the stored bookings, the occurrences of other rules or the holds of
+        other sessions. Each stored booking is checked only against the
+        occurrences around its own date.
+
+        Args:
+            RecurringRule object.
+
+        Returns:
+            True iff successfully booked.
+
+        Raises:
+            InvalidInputError if the first occurrence would have expired
+            already, DuplicateBookingError, TableBusyError.
+        """
+        Bookings.__checkNotPast(RecurringBooking(rule, rule.first))
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            self.__tableGC()
+            for bk in self.byId.values():
+                for occurrence in rule.occurrencesNear(bk):
+                    if occurrence.duplicate(bk):
+                        raise exceptions.DuplicateBookingError
+                    if occurrence.tablename == bk.tablename and bk.overlap(occurrence):     # as bookingAvailable
+                        raise exceptions.TableBusyError
+            for other in self.rules.values():
+                busy, duplicate = rule.conflicts(other)
+                if duplicate:
+                    raise exceptions.DuplicateBookingError
+                if busy:
+                    raise exceptions.TableBusyError
+            for held in self.__heldByOthers(rule.tablename):
+                for occurrence in rule.occurrencesNear(held):
+                    if occurrence.overlap(held):
+                        raise exceptions.TableBusyError
+            rule.intern(Customers.venueCustomers(self.venue))
+            self.__changing("rules")[rule.id] = rule
+            self.__saveRules()
+            pytock_data.publish("rule_added", "restaurant_rules", rule, self.venue)
+            Holds.venueHolds(self.venue).release(pytock_data.session())
+        return True
+
+    @pytock_trace.traced("Bookings.deleteRule")
+    def deleteRule(self, ruleId: int) -> None:
+        """
+        Delete a recurring rule, and so all its occurrences, if it exists.
+
+        Args:
+            rule id.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            if ruleId in self.rules:
+                rule = self.__changing("rules").pop(ruleId)
+                self.__saveRules()
+                pytock_data.publish("rule_deleted", "restaurant_rules", rule, self.venue)
+                self.__seatWaiting({rule.tablename})
+
+    @pytock_trace.traced("Bookings.skipOccurrence")
+    def skipOccurrence(self, ruleId: int, day: datetime.date) -> None:
+        """
+        Cancel the occurrence of a recurring rule on one date, leaving the
+        rest of the series.
+
+        Args:
+            rule id.
+            day: datetime.date.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            rule = self.rules.get(ruleId)
+            if rule and rule.occursOn(day):
+                self.__changing("rules")[ruleId] = rule.skip(day)
+                self.__saveRules()
+                pytock_data.publish("occurrence_skipped", "restaurant_rules", RecurringBooking(rule, day), self.venue)
+                self.__seatWaiting({rule.tablename})
+
+    @pytock_trace.traced("Bookings.delete")
+    def delete(self, booking: Booking) -> None:
+        """
+        Delete a booking if it exists. For the occurrence of a recurring rule
+        only that date is cancelled.
+
+        Args:
+            Booking object.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        if isinstance(booking, RecurringBooking):
+            self.skipOccurrence(booking.ruleId, booking.start.date())
+        else:
+            self.deleteId(booking.id)
+
+    @pytock_trace.traced("Bookings.deleteId")
+    def deleteId(self, bookingId: int) -> None:
+        """
+        Delete a booking by id if it exists, with all its parts if it is
+        joined.
+
+        Args:
+            booking id.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            if bookingId in self.byId:
+                parts = self.byId[bookingId].parts if isinstance(self.byId[bookingId], JoinedBooking) else (bookingId,)
+                deleted = [self.__changing("byId").pop(partId) for partId in parts if partId in self.byId]
+                self.__save()
+                for booking in deleted:
+                    self.__published(Bookings.deletedKind(booking), booking)
+                self.__seatWaiting({booking.tablename for booking in deleted})
+
+    @pytock_trace.traced("Bookings.find")
+    def find(self, bookingId: int) -> Booking:
+        """
+        Find a booking by id.
+
+        Args:
+            booking id.
+
+        Returns:
+            Booking or None.
+
+        Raises:
+            None.
+        """
+        return self.byId.get(bookingId)
+    
+    @pytock_trace.traced("Bookings.walkInAvailable")
+    def walkInAvailable(self, tablename: str) -> bool:
+        """
+        True if table available for a walkIn customer, or False otherwise.
+
+        Args:
+            tablename.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        if not tablename:
+            return False
+        booking = WalkinBooking(tablename)
+        return not self.bookingDuplicate(booking, True)
+
+    @pytock_trace.traced("Bookings.walkIn", result=lambda booking: [booking.id])
+    def walkIn(self, tablename: str) -> 'WalkinBooking':
+        """
+        Take the table for a walkIn customer, overriding any booking.
+
+        Args:
+            tablename.
+
+        Returns:
+            The WalkinBooking.
+
+        Raises:
+            TableBusyError if already taken for a walkIn.
+        """
+        booking = WalkinBooking(tablename)
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            if self.bookingDuplicate(booking, True):
+                raise exceptions.TableBusyError
+            self.__insert(booking)
+        return booking
+
+    @pytock_trace.traced("Bookings.walkOut")
+    def walkOut(self, tablename: str) -> None:
+        """
+        Release the table from a walkIn customer.
+
+        Args:
+            tablename.
+
+        Returns:
+            None.
+
+        Raises:
+            TableFreeError if not already taken for a walkIn.
+        """
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            self.__tableGC()
+            for bk in self.byId.values():
+                if isinstance(bk, WalkinBooking) and bk.tablename == tablename:
+                    self.deleteId(bk.id)
+                    return
+        raise exceptions.TableFreeError
+
+    @property
+    def waiting(self) -> list['Party']:
+        """List of the waiting parties, first to be seated first, sorted once per change."""
+        return list(pytock_data.derive("restaurant_waitlist", "waiting", lambda parties: tuple(sorted(
+            (party for party in (parties or { }).values() if party.tablename is None), key=Waitlist.order)),
+            self.venue))
+
+    @property
+    def seatedParties(self) -> list['Party']:
+        """List of the parties recently seated from the waitlist, latest first."""
+        return list(pytock_data.derive("restaurant_waitlist", "seated", lambda parties: tuple(sorted(
+            (party for party in (parties or { }).values() if party.tablename is not None),
+            key=lambda party: party.seated, reverse=True)), self.venue))
+
+    @pytock_trace.traced("Bookings.joinWaitlist")
+    def joinWaitlist(self, party: 'Party') -> 'Party':
+        """
+        Add a party to the waitlist, seating it at once if a table that fits
+        is free.
+
+        Args:
+            Party object.
+
+        Returns:
+            The Party as seated, or None if it is waiting.
+
+        Raises:
+            InvalidInputError if no table seats the party.
+        """
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            largest = max((table.seats for table in Tables(self.venue, latest=True).tables), default=0)
+            if party.size > largest:
+                raise exceptions.InvalidInputError(f"no table seats {party.size}")
+            waitlist = Waitlist.venueWaitlist(self.venue, self.parties)
+            waitlist.source = None                          # changing
+            self.__changing("parties")[party.id] = party
+            waitlist.push(party)
+            self.__saveParties(waitlist)
+            pytock_data.publish("party_waiting", "restaurant_waitlist", party, self.venue)
+            seated = self.__seatWaiting()
+        return next((each for each in seated if each.id == party.id), None)
+
+    @pytock_trace.traced("Bookings.leaveWaitlist")
+    def leaveWaitlist(self, partyId: int) -> None:
+        """
+        Remove a party from the waitlist, or from the recently seated, if it
+        is there.
+
+        Args:
+            party id.
+
+        Returns:
+            None.
+
+        Raises:
+            None.
+        """
+        with pytock_data.lock(self.venue):
+            self.__reload(latest=True)
+            if partyId in self.parties:
+                waitlist = Waitlist.venueWaitlist(self.venue, self.parties)
+                waitlist.source = None                      # changing
+                party = self.__changing("parties").pop(partyId)
+                waitlist.discard(partyId)
+                self.__saveParties(waitlist)
+                pytock_data.publish("party_left", "restaurant_waitlist", party, self.venue)
+
+    def __busyNow(self, tablenames: set) -> set:
+        """
+        Report which of the tables cannot take a party now for its seating
+        period: taken by a walk-in, booked, or held by a session.
+        """
+        now = pytock_clock.now()
+        window = Booking("", "", "", now.time(), Party.SEATING_PERIOD, bookingId=0, day=now.date())
+        busy = set()
+        for bk in self.byId.values():
+            if bk.tablename in tablenames and (isinstance(bk, WalkinBooking) or bk.overlap(window)):
+                busy.add(bk.tablename)
+        for rule in self.rules.values():
+            if rule.tablename in tablenames and rule.tablename not in busy:
+                if any(bk.overlap(window) for bk in rule.occurrencesNear(window)):
+                    busy.add(rule.tablename)
+        holds = Holds.venueHolds(self.venue)
+        for tablename in tablenames - busy:
+            if any(held.overlap(window) for held in holds.others(tablename, None)):
+                busy.add(tablename)
+        return busy
+
+    def __seatWaiting(self, tablenames: set = None) -> list['Party']:
+        """
+        Seat waiting parties at those of the tables, by default all, that are
+        free now, smallest tables first, each taking the best fit from the
+        waitlist as a walk-in. The walk-ins are stored as one change. Called
+        with the lock held on the latest data.
+        """
+        waitlist = Waitlist.venueWaitlist(self.venue, self.parties)
+        if not waitlist:
+            return [ ]
+        with pytock_metrics.timer("waitlist_seating"):
+            tables = [table for table in pytock_data.latest("restaurant_tables", self.venue) or ()
+                      if tablenames is None or table.name in tablenames]
+            busy = self.__busyNow({table.name for table in tables})
+            now = pytock_clock.now()
+            seated, walkins = [ ], [ ]
+            for table in sorted(tables, key=lambda table: table.seats):
+                if table.name in busy or waitlist.best(table.seats) is None:
+                    continue
+                waitlist.source = None                      # changing
+                party = waitlist.pop(table.seats)
+                walkins.append(WalkinBooking(table.name))
+                party = party.seatedAt(table.name, now)
+                parties = self.__changing("parties")
+                parties[party.id] = party
+                for dropped in waitlist.seated(party, Bookings.SEATED_KEPT):
+                    parties.pop(dropped.id, None)
+                seated.append(party)
+            if seated:
+                self.__insert(*walkins)                     # one change however many are seated
+                self.__saveParties(waitlist)
+                for party in seated:
+                    pytock_data.publish("party_seated", "restaurant_waitlist", party, self.venue)
+        return seated
+
+
+#
+# StatusFilter class
+#
+# Just POD describing which tables and bookings a status view should show. The
+# table name and customer searches are case-insensitive substring matches, and
+# the time range selects bookings that overlap it. Free/busy is judged within
+# the time range when one is given, otherwise over the whole day as elsewhere.
+#
+
+class StatusFilter:
+    """
+    A StatusFilter object selects the tables and bookings shown by
+    Bookings.statusPage().
+    """
+
+    # class constants
+    STATES = ["All", "Free", "Busy"]
+
+    def __init__(self, tablename: str = "", start: datetime.time = None, end: datetime.time = None,
+                 state: str = "All", customer: str = ""):
+        if state not in StatusFilter.STATES:
+            raise exceptions.InvalidInputError(f"invalid state argument '{state}'")
+        self._tablename = tablename.strip().casefold()
+        self._customer = customer.strip().casefold()
+        self._state = state
+        todate = pytock_clock.today()
+        self._start = datetime.datetime.combine(todate, start) if start else None
+        self._end = datetime.datetime.combine(todate, end) if end else None
+        if self._start and self._end and self._end <= self._start:
+            self._end += datetime.timedelta(days=1)         # range wraps past midnight
+
+    @property
+    def tablename(self):
+        """Table name search text."""
+        return self._tablename
+
+    @property
+    def customer(self):
+        """Customer name or phone search text."""
+        return self._customer
+
+    @property
+    def state(self):
+        """One of STATES."""
+        return self._state
+
+    @property
+    def start(self):
+        """Start datetime.datetime of the time range, or None."""
+        return self._start
+
+    @property
+    def end(self):
+        """End datetime.datetime of the time range, or None."""
+        return self._end
+
+    def inRange(self, bk: Booking) -> bool:
+        """
+        True iff the booking overlaps our time range, or we have no range.
+
+        Args:
+            Booking object.
+
+        Returns:
+            bool.
+
+        Raises:
+            None.
+        """
+        if self._start and bk.end <= self._start:
+            return False
+        if self._end and bk.start >= self._end:
+            return False
+        return True
+
+    def matchBooking(self, bk: Booking) -> bool:
+        """
+        True iff the booking should be shown for its table.
+
+        Args:
+            Booking object.
+
+        Returns:
+            bool.
+
+        Raises:
+            None.
+        """
+        if not self.inRange(bk):
+            return False
+        if self._customer and self._customer not in bk.name.casefold() \
+                and self._customer not in bk.phone.casefold():
+            return False
+        return True
+
+    def matchTable(self, table: Table, bookings: list[Booking]) -> bool:
+        """
+        True iff the table should be listed, given all of its bookings.
+
+        Args:
+            table: Table object.
+            bookings: unsorted list of the table's Booking objects.
+
+        Returns:
+            bool.
+
+        Raises:
+            None.
+        """
+        if self._tablename and self._tablename not in table.name.casefold():
+            return False
+        if self._state != "All":
+            busy = any(self.inRange(bk) for bk in bookings)
+            if busy != (self._state == "Busy"):
+                return False
+        if self._customer:
+            return any(self.matchBooking(bk) for bk in bookings)
+        return True
 
-    def bookingDuplicate(self, booking: Booking, matchTable: bool = False) -> bool:
+
+#
+# Fragments class
+#
+# The rendered status of each table, i.e. the markdown of Table.description()
+# and of the descriptions of its bookings in time order, shared by the sessions
+# of a venue so that a rerun renders only the tables that changed. Each table
+# has a version, bumped when a change feed event concerns it; a table's entry
+# is dropped then and rendered again when next shown, while the entries of the
+# other tables stay. After a lost event or on a new day every entry is dropped.
+#
+# A session runs on the snapshot taken when its run began, which may be from
+# just before or after an event is delivered, so an entry is also checked
+# against the Table object and booking ids it was rendered from. Both are never
+# changed once stored, so equal ids mean equal descriptions.
+#
+
+class Fragments:
+    """
+    A Fragments object caches the rendered status of a venue's tables.
+    """
+
+    # class constants
+    KINDS = {"table_created", "table_changed", "table_deleted", "booking_added", "booking_deleted",
+             "booking_expired", "walk_in", "walk_out", "rule_added", "rule_deleted", "occurrence_skipped",
+             "occurrence_expired"}
+
+    @staticmethod
+    def venueFragments(venue: str = None) -> 'Fragments':
         """
-        Check if a new booking would conflict in time and name/phone. This is
-        useful for checking if the customer has an existing booking during the
-        same time range.
+        Return the venue's shared Fragments object.
+        """
+        venue = pytock_data.current_venue(venue)
+        return pytock_data.resource("restaurant_fragments", lambda: Fragments(venue), venue)
+
+    def __init__(self, venue: str):
+        self.venue = venue
+        self.renders = 0                                    # tables rendered, for testing
+        self._lock = threading.Lock()
+        self._day = None
+        self._versions = { }                                # table name -> version
+        self._entries = { }                                 # table name -> (version, Table, ids, text, rendered)
+        self._feed = pytock_data.subscribe(Fragments.KINDS, venue)
+
+    def __update(self) -> None:
+        """
+        Apply the events since the last call. Called with our lock held.
+        """
+        today = pytock_clock.today()
+        if self._feed.dropped or today != self._day:
+            self._feed.dropped = 0
+            self._feed.drain()
+            self._day = today
+            self._versions = {name: version + 1 for name, version in self._versions.items()}
+            self._entries.clear()
+            return
+        for event in self._feed.drain():
+            name = event.item.name if isinstance(event.item, Table) else event.item.tablename
+            self._versions[name] = self._versions.get(name, 0) + 1
+            self._entries.pop(name, None)
+
+    def render(self, table: Table, bookings: list[Booking]) -> tuple[str, list]:
+        """
+        Return a table's rendered status, rendering it only if it changed.
 
         Args:
-            Booking object.
+            table: Table object.
+            bookings: all of the table's bookings for today, in any order.
 
         Returns:
-            True if duplicated, otherwise False.
+            (markdown of the table, list of (Booking, markdown) tuples in
+            time order), which must not be changed.
 
         Raises:
             None.
         """
-        self.__tableGC()
-        for bk in self.bookings:
-            if bk.duplicate(booking, matchTable):
-                return True
-        return False
+        ids = tuple(sorted(bk.id for bk in bookings))
+        with self._lock:
+            self.__update()
+            version = self._versions.get(table.name, 0)
+            entry = self._entries.get(table.name)
+            if entry and entry[0] == version and entry[1] is table and entry[2] == ids:
+                return entry[3], entry[4]
+        text = table.description()
+        rendered = [(bk, bk.description()) for bk in sorted(bookings, key=Booking.compareByStartKey)]
+        with self._lock:
+            self.renders += 1
+            self.__update()
+            if self._versions.get(table.name, 0) == version:    # no change while we rendered
+                self._entries[table.name] = (version, table, ids, text, rendered)
+        return text, rendered
+
+    def close(self) -> None:
+        pytock_data.unsubscribe(self._feed)
 
-    def add(self, booking: Booking) -> bool:
+
+#
+# Occupancy class
+#
+# Occupied tables and seats through the day, computed with a sweep over the
+# sorted start and end events of all bookings, so it takes O(n log n) time for
+# n bookings. A table counts once however many bookings cover it at a time,
+# e.g. overlapping parts of a day's reservations. The sweep also yields each
+# table's busy intervals, which are spread over hourly bins for a heatmap.
+#
+# Walk-ins are left out, as in Availability: a WalkinBooking spans the whole day
+# rather than the time the guests were seated, so it would show the table
+# occupied from midnight.
+#
+
+class Occupancy:
+    """
+    An Occupancy object holds the occupancy curve and hourly heatmap of a set of
+    bookings. Seats are those of the occupied tables, since bookings do not
+    record party size.
+    """
+
+    def __init__(self, bookings, tables):
+        seats = {table.name: table.seats for table in tables}
+        events = [ ]
+        for bk in bookings:
+            if bk.tablename in seats and bk.end > bk.start and not isinstance(bk, WalkinBooking):
+                events.append((bk.start, 1, bk.tablename))
+                events.append((bk.end, -1, bk.tablename))
+        events.sort()                                       # ends (-1) before starts at the same time
+
+        self._curve = [ ]                                   # (datetime, tables, seats) at each change
+        self._intervals = { }                               # tablename -> [(begin, end)]
+        active = { }
+        began = { }
+        tableCount = seatCount = 0
+        for index, (when, delta, tablename) in enumerate(events):
+            count = active.get(tablename, 0) + delta
+            active[tablename] = count
+            if delta > 0 and count == 1:
+                tableCount += 1
+                seatCount += seats[tablename]
+                began[tablename] = when
+            elif delta < 0 and count == 0:
+                tableCount -= 1
+                seatCount -= seats[tablename]
+                self._intervals.setdefault(tablename, []).append((began.pop(tablename), when))
+            if index + 1 == len(events) or events[index + 1][0] != when:
+                if not self._curve or self._curve[-1][1:] != (tableCount, seatCount):
+                    self._curve.append((when, tableCount, seatCount))
+
+        self._hours = [ ]
+        if events:
+            first = events[0][0].replace(minute=0, second=0, microsecond=0)
+            last = events[-1][0]
+            hour = first
+            while hour < last:
+                self._hours.append(hour)
+                hour += datetime.timedelta(hours=1)
+
+    @property
+    def curve(self) -> list[tuple]:
+        """List of (datetime, tables, seats) at each change, in time order."""
+        return self._curve
+
+    @property
+    def hours(self) -> list[datetime.datetime]:
+        """Start of each hour spanned by the bookings."""
+        return self._hours
+
+    def peak(self) -> tuple[int, int]:
         """
-        Add a booking if the time and table are available.
+        Report the most tables and seats occupied at once.
 
         Args:
-            Booking object.
+            None.
 
         Returns:
-            True iff successfully booked.
+            tables, seats.
 
         Raises:
-            TableBusyError.
+            None.
         """
-        if self.bookingDuplicate(booking):
-            raise exceptions.DuplicateBookingError
-        if not self.bookingAvailable(booking):
-            raise exceptions.TableBusyError
-        self.bookings.append(booking)
-        self.__save()
-        return True
+        return max((point[1] for point in self._curve), default=0), max((point[2] for point in self._curve), default=0)
 
-    def delete(self, booking: Booking) -> None:
+    def heatmap(self, tablenames: list[str]) -> dict:
         """
-        Delete a matching booking if it exists.
+        Report the fraction of each hour that each table is occupied.
 
         Args:
-            Booking object.
+            tablenames: the tables to report, e.g. those on the visible page.
 
         Returns:
+            Dictionary with table names as keys and lists of fractions from
+            0.0 to 1.0 as data, one per entry of hours.
+
+        Raises:
+            None.
+        """
+        output = { }
+        if not self._hours:
+            return output
+        first = self._hours[0]
+        hour = datetime.timedelta(hours=1)
+        for tablename in tablenames:
+            row = [0.0] * len(self._hours)
+            for begin, end in self._intervals.get(tablename, []):
+                index = int((begin - first) / hour)
+                while index < len(row):
+                    binStart = first + index * hour
+                    overlap = min(end, binStart + hour) - max(begin, binStart)
+                    if overlap <= datetime.timedelta(0):
+                        break
+                    row[index] += overlap / hour
+                    index += 1
+            output[tablename] = row
+        return output
+
+    def coversByHour(self) -> list[float]:
+        """
+        Report the average number of seats occupied in each hour.
+
+        Args:
             None.
 
+        Returns:
+            List of floats, one per entry of hours.
+
         Raises:
             None.
         """
-        self.__tableGC()
-        self.bookings = [bk for bk in self.bookings if not bk.equals(booking)]
-        self.__save()
-    
-    def walkInAvailable(self, tablename: str) -> bool:
+        output = [0.0] * len(self._hours)
+        if not self._hours:
+            return output
+        first = self._hours[0]
+        hour = datetime.timedelta(hours=1)
+        for (when, tables, seats), following in zip(self._curve, self._curve[1:]):
+            begin, end = when, following[0]
+            index = int((begin - first) / hour)
+            while seats and index < len(output):
+                binStart = first + index * hour
+                overlap = min(end, binStart + hour) - max(begin, binStart)
+                if overlap <= datetime.timedelta(0):
+                    break
+                output[index] += seats * (overlap / hour)
+                index += 1
+        return output
+
+
+#
+# Availability class
+#
+# Precomputed answers to "which tables are free from 19:00 for 1:30?" and "is
+# this customer already booked then?" for one day. Time is divided into SLOT
+# long slots over two days, since a booking may run past midnight. Because
+# bookings that merely touch still conflict (see Booking.overlap), each slot
+# boundary is a point of its own, giving alternating points and open slots:
+#
+#   index 2k     the instant k * SLOT after midnight
+#   index 2k+1   the open slot between instants k and k+1
+#
+# Each index holds a bitmask of the busy tables, built by one sweep over the
+# bookings' start and end indexes, so a query ORs the masks of the indexes it
+# covers. Times off the SLOT grid are rounded outward, which can only report a
+# table or customer busy that is actually free; Bookings.add() still makes the
+# exact check. Walk-ins do not block reservations and are left out.
+#
+
+class Availability:
+    """
+    An Availability object holds the busy tables for each time slot of a day
+    and the booked times of each customer.
+    """
+
+    # class constants
+    SLOT = datetime.timedelta(minutes=15)
+    DAYS = 2
+    MAX_JOINED = 6                                          # most tables in a combination
+    SEARCH_LIMIT = 5000                                     # most combinations looked at
+
+    def __init__(self, bookings, tables, day: datetime.date):
+        self._midnight = datetime.datetime.combine(day, datetime.time())
+        self._names = [table.name for table in tables]
+        self._seats = {table.name: table.seats for table in tables}
+        self._joins = {name: set() for name in self._names}  # joinable either way, existing tables only
+        for table in tables:
+            for other in table.joinable:
+                if other in self._joins:
+                    self._joins[table.name].add(other)
+                    self._joins[other].add(table.name)
+        bits = {name: 1 << index for index, name in enumerate(self._names)}
+        size = 2 * (Availability.DAYS * datetime.timedelta(days=1) // Availability.SLOT) + 1
+        self._last = size - 1
+        starts = [[] for _ in range(size)]
+        ends = [[] for _ in range(size + 1)]
+        self._customers = { }                               # customer key -> [(start, end)]
+        for bk in bookings:
+            if isinstance(bk, WalkinBooking) or bk.tablename not in bits:
+                continue                                    # tables missing are culled by Bookings
+            self._customers.setdefault(bk.customer.key, []).append((bk.start, bk.end))
+            first, last = self.__indexes(bk.start, bk.end)
+            starts[first].append(bk.tablename)
+            ends[last + 1].append(bk.tablename)
+        self._free = { }                                    # (first, last) -> free table names
+
+        self._busy = [0] * size
+        active = { }
+        mask = 0
+        for index in range(size):
+            for tablename in ends[index]:
+                active[tablename] -= 1
+                if not active[tablename]:
+                    mask &= ~bits[tablename]
+            for tablename in starts[index]:
+                active[tablename] = active.get(tablename, 0) + 1
+                mask |= bits[tablename]
+            self._busy[index] = mask
+
+    def __indexes(self, start: datetime.datetime, end: datetime.datetime) -> tuple[int, int]:
         """
-        True if table available for a walkIn customer, or False otherwise.
+        Return the first and last indexes covering the closed interval.
+        """
+        first = 2 * ((start - self._midnight) // Availability.SLOT)
+        last = 2 * -((self._midnight - end) // Availability.SLOT)            # rounded up
+        return min(max(first, 0), self._last), min(max(last, 0), self._last)
+
+    def __window(self, start: datetime.time, period: datetime.time) -> tuple[datetime.datetime, datetime.datetime]:
+        """
+        Return the datetimes of a candidate booking.
+        """
+        begin = datetime.datetime.combine(self._midnight.date(), start)
+        return begin, begin + datetime.timedelta(hours=period.hour, minutes=period.minute)
+
+    def freeTables(self, start: datetime.time, period: datetime.time) -> list[str]:
+        """
+        Report the tables free for a booking from start for period.
 
         Args:
-            tablename.
+            start: datetime.time of day.
+            period: datetime.time duration.
+
+        Returns:
+            List of table names, in table order. Results are kept per slot
+            window, so repeated queries cost a dictionary lookup.
+
+        Raises:
+            None.
+        """
+        window = self.__indexes(*self.__window(start, period))
+        free = self._free.get(window)
+        if free is None:
+            busy = 0
+            for mask in self._busy[window[0]:window[1] + 1]:
+                busy |= mask
+            free = self._free[window] = tuple(name for index, name in enumerate(self._names) if not busy >> index & 1)
+        return list(free)
+
+    def combination(self, size: int, start: datetime.time, period: datetime.time, exclude=()) -> list[str]:
+        """
+        Find the free tables that seat a party with the fewest empty seats,
+        then the fewest tables. Either one table, or tables that are each
+        joinable with another of them, so that they can be put together.
+
+        The search grows sets of joined tables from each free table, largest
+        first, and never grows a set that already seats the party, that the
+        largest tables could no longer complete within MAX_JOINED, or that is
+        found again by another path. It stops after SEARCH_LIMIT sets, which
+        only the most interconnected floors reach, with the best found so far.
+
+        Args:
+            size: number of guests.
+            start: datetime.time of day.
+            period: datetime.time duration.
+            exclude: names of tables not to use, e.g. held by others.
 
         Returns:
+            List of table names in table order, or None if none seat the party.
+
+        Raises:
             None.
+        """
+        free = [name for name in self.freeTables(start, period) if name not in exclude]
+        seats = self._seats
+        joins = {name: frozenset(self._joins[name].intersection(free)) for name in free}
+        largest = max((seats[name] for name in free), default=0)
+        seen = set()
+        best = None                                         # (empty seats, tables, names)
+        budget = Availability.SEARCH_LIMIT
+
+        def grow(chosen: frozenset, total: int, frontier: frozenset) -> None:
+            nonlocal best, budget
+            budget -= 1
+            if total >= size:
+                if best is None or (total - size, len(chosen)) < best[:2]:
+                    best = (total - size, len(chosen), chosen)
+                return
+            remaining = Availability.MAX_JOINED - len(chosen)
+            if largest * remaining < size - total:
+                return
+            if best is not None and (0, len(chosen) + 1) >= best[:2]:
+                return                                      # cannot beat the best any more
+            for name in sorted(frontier, key=seats.get, reverse=True):
+                grown = chosen | {name}
+                if grown in seen or budget <= 0:
+                    continue
+                seen.add(grown)
+                grow(grown, total + seats[name], (frontier | joins[name]) - grown)
+
+        for name in sorted(free, key=seats.get, reverse=True):
+            if budget <= 0:
+                break
+            seen.add(frozenset((name,)))
+            grow(frozenset((name,)), seats[name], joins[name])
+        if best is None:
+            return None
+        return [name for name in self._names if name in best[2]]
+
+    def customerBusy(self, name: str, phone: str, start: datetime.time, period: datetime.time) -> bool:
+        """
+        True iff the customer has a booking overlapping start for period.
+
+        Args:
+            name: customer name.
+            phone: customer phone.
+            start: datetime.time of day.
+            period: datetime.time duration.
+
+        Returns:
+            bool.
 
         Raises:
             None.
         """
-        if not tablename:
+        begin, end = self.__window(start, period)
+        return any(other < end and otherEnd >= begin or begin < otherEnd and end >= other
+                   for other, otherEnd in self._customers.get(Customers.key(name, phone), ()))
+
+
+#
+# Holds class
+#
+# Tentative holds on a table for a time window, taken while a host fills in the
+# booking form so that no other session books the slot meanwhile. Each session
+# holds at most one window, which lapses after HOLD_TTL unless taken again and
+# is released, under the venue lock, when Bookings.add(), addJoined() or
+# addRule() books it. Holds keep other hosts off a slot: bookings made without a
+# session, by background jobs or replay, ignore them, while waitlist seating
+# still avoids held tables. Holds are not stored data: one Holds object per
+# venue is shared by its sessions as a pytock_data resource, and changing it
+# reruns no one.
+#
+# Lapsed holds are reclaimed from a min-heap of expiry times, so reclaiming and
+# releasing a hold cost O(log n), and taking one or checking a table looks only
+# at the holds on that table. heldTables(), for the waitlist, walks every hold,
+# of which there is at most one per open session. Renewed and released holds
+# leave their old heap entry behind, which is skipped when it reaches the top.
+#
+
+class Holds:
+    """
+    A Holds object tracks the tentative holds of one venue, by session.
+    """
+
+    # class constants
+    HOLD_TTL = datetime.timedelta(seconds=int(os.environ.get("PYTOCK_HOLD_TTL", "120")))
+
+    @staticmethod
+    def venueHolds(venue: str = None) -> 'Holds':
+        """
+        Return the venue's shared Holds object.
+        """
+        return pytock_data.resource("restaurant_holds", Holds, venue)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._byOwner = { }                                 # owner -> (Booking, expires)
+        self._byTable = { }                                 # table name -> {owner: Booking}
+        self._expiry = [ ]                                  # heap of (expires, sequence, owner)
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.__reclaim()
+            return len(self._byOwner)
+
+    def __drop(self, owner) -> bool:
+        entry = self._byOwner.pop(owner, None)
+        if entry is None:
             return False
-        booking = WalkinBooking(tablename)
-        return not self.bookingDuplicate(booking, True)
+        held = self._byTable[entry[0].tablename]
+        del held[owner]
+        if not held:
+            del self._byTable[entry[0].tablename]
+        return True
 
-    def walkIn(self, tablename: str) -> None:
+    def __reclaim(self) -> None:
         """
-        Take the table for a walkIn customer, overriding any booking.
+        Drop the holds that have lapsed. Called with our lock held.
+        """
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, sequence, owner = heapq.heappop(self._expiry)
+            entry = self._byOwner.get(owner)
+            if entry and entry[1] == expires:
+                self.__drop(owner)
+
+    def take(self, owner, tablename: str, name: str, phone: str, start: datetime.time, period: datetime.time,
+             ttl: datetime.timedelta = None) -> bool:
+        """
+        Hold a table for a time window on behalf of a session, replacing and
+        renewing any hold the session had.
 
         Args:
-            tablename.
+            owner: session id.
+            tablename, name, phone, start, period: as for a Booking today.
+            ttl: datetime.timedelta until the hold lapses, by default HOLD_TTL.
 
         Returns:
+            True iff held, False if another session holds an overlapping
+            window on the table.
+
+        Raises:
             None.
+        """
+        booking = Booking(tablename, name, phone, start, period, bookingId=0)
+        with self._lock:
+            self.__reclaim()
+            for other, held in self._byTable.get(tablename, { }).items():
+                if other != owner and held.overlap(booking):
+                    return False
+            self.__drop(owner)
+            expires = time.monotonic() + (ttl or Holds.HOLD_TTL).total_seconds()
+            self._byOwner[owner] = (booking, expires)
+            self._byTable.setdefault(tablename, { })[owner] = booking
+            heapq.heappush(self._expiry, (expires, next(self._sequence), owner))
+        return True
+
+    def release(self, owner) -> bool:
+        """
+        Release the session's hold, if any.
+
+        Args:
+            owner: session id.
+
+        Returns:
+            True iff there was a hold.
 
         Raises:
-            TableBusyError if already taken for a walkIn.
+            None.
         """
-        booking = WalkinBooking(tablename)
-        if self.bookingDuplicate(booking, True):
-            raise exceptions.TableBusyError
-        self.bookings.append(booking)
-        self.__save()
+        with self._lock:
+            return self.__drop(owner)
 
-    def walkOut(self, tablename: str) -> None:
+    def others(self, tablename: str, owner) -> list[Booking]:
         """
-        Release the table from a walkIn customer.
+        Report the windows on a table held by sessions other than the owner.
 
         Args:
-            tablename.
+            tablename: table name.
+            owner: session id, or None to report every hold.
 
         Returns:
+            List of Booking objects, one per hold.
+
+        Raises:
             None.
+        """
+        with self._lock:
+            self.__reclaim()
+            return [held for other, held in self._byTable.get(tablename, { }).items() if other != owner]
+
+    def heldTables(self, start: datetime.time, period: datetime.time, owner) -> set[str]:
+        """
+        Report the tables that other sessions hold during a window today.
+
+        Args:
+            start: datetime.time of day.
+            period: datetime.time duration.
+            owner: session id, whose own hold is left out.
+
+        Returns:
+            Set of table names.
 
         Raises:
-            TableFreeError if not already taken for a walkIn.
+            None.
         """
-        booking = WalkinBooking(tablename)
-        if not self.bookingDuplicate(booking, True):
-            raise exceptions.TableFreeError
-        self.delete(booking)
+        window = Booking("", "", "", start, period, bookingId=0)
+        with self._lock:
+            self.__reclaim()
+            return {booking.tablename for other, (booking, expires) in self._byOwner.items()
+                    if other != owner and booking.overlap(window)}
+
+
+#
+# Party class
+#
+# A walk-in party on the waitlist, waiting for a table with enough seats. Like
+# the bookings, parties are immutable: seating one stores a new Party that
+# records the table and time, which is shown for a while after.
+#
+
+class Party:
+    """
+    A Party object is a group of walk-in guests waiting for, or given, a table.
+    """
+
+    # class constants
+    SEATING_PERIOD = datetime.time(1, 30)                   # table time a party needs
+
+    def __init__(self, name: str, size: int, priority: int = 0, arrived: datetime.datetime = None,
+                 partyId: int = None, tablename: str = None, seated: datetime.datetime = None):
+        if not 1 <= size <= Table.MAX_SEATS:
+            raise exceptions.InvalidInputError(f"invalid size argument '{size}'")
+        self._id = partyId if partyId is not None else next(Booking._ids)
+        self._name = name
+        self._size = size
+        self._priority = priority
+        self._arrived = arrived or pytock_clock.now()
+        self._tablename = tablename
+        self._seated = seated
+
+    @property
+    def id(self):
+        """Unique party id."""
+        return self._id
+
+    @property
+    def name(self):
+        """Name the party is called by."""
+        return self._name
+
+    @property
+    def size(self):
+        """Number of guests."""
+        return self._size
+
+    @property
+    def priority(self):
+        """Higher priorities are seated first."""
+        return self._priority
+
+    @property
+    def arrived(self):
+        """datetime.datetime the party joined the waitlist."""
+        return self._arrived
+
+    @property
+    def tablename(self):
+        """Name of the table given, or None while waiting."""
+        return self._tablename
+
+    @property
+    def seated(self):
+        """datetime.datetime the party was seated, or None while waiting."""
+        return self._seated
+
+    def seatedAt(self, tablename: str, when: datetime.datetime) -> 'Party':
+        """
+        Return this party as seated at a table.
+        """
+        return Party(self.name, self.size, self.priority, self.arrived, self.id, tablename, when)
+
+    def description(self) -> str:
+        """
+        Display a description string, e.g. "Ann - 4 guests, waiting since 19:05".
+
+        Args:
+            None.
+
+        Returns:
+            string.
+
+        Raises:
+            None.
+        """
+        guests = "1 guest" if self.size == 1 else f"{self.size} guests"
+        if self.tablename:
+            return f"{self.name} - {guests}, seated at {self.tablename} at {self.seated.strftime('%H:%M')}"
+        first = " (priority)" if self.priority > 0 else ""
+        return f"{self.name} - {guests}{first}, waiting since {self.arrived.strftime('%H:%M')}"
+
+
+#
+# Waitlist class
+#
+# The waiting parties as a priority queue per party size. A table of n seats is
+# matched by looking only at the head of the queues for sizes 1 to n and taking
+# the best fit: the highest priority first, then the fewest empty seats, then
+# the longest wait. That is at most MAX_SEATS comparisons and one heap pop,
+# however many parties are waiting.
+#
+# One Waitlist per venue is kept as a pytock_data resource and changed with the
+# stored parties under the venue lock: a party joining is pushed, one seated
+# popped, and one leaving is dropped from the waiting and skipped when its heap
+# entry reaches the top. It notes the stored parties it reflects, and is built
+# again from them should they be others, e.g. after a failed change.
+#
+
+class Waitlist:
+    """
+    A Waitlist object picks the waiting party to seat at a table.
+    """
+
+    @staticmethod
+    def venueWaitlist(venue: str, parties) -> 'Waitlist':
+        """
+        Return the venue's shared Waitlist, built again unless it reflects
+        the stored parties given. Called with the lock held.
+        """
+        waitlist = pytock_data.resource("restaurant_waitlist_queue", Waitlist, venue)
+        if waitlist.source is not parties:
+            waitlist.rebuild(parties.values())
+            waitlist.source = parties
+        return waitlist
+
+    def __init__(self, parties=()):
+        self.source = None                                  # stored parties reflected, if any
+        self.rebuild(parties)
+
+    def rebuild(self, parties) -> None:
+        """
+        Queue the waiting parties given, forgetting any others.
+        """
+        self._queues = { }                                  # size -> heap of ((-priority, arrived, id), Party)
+        self._waiting = { }                                 # party id -> Party
+        self._seated = [ ]                                  # recently seated Party objects, latest first
+        for party in parties:
+            if party.tablename is None:
+                self._waiting[party.id] = party
+                self._queues.setdefault(party.size, []).append((Waitlist.order(party), party))
+            else:
+                self._seated.append(party)
+        for queue in self._queues.values():
+            heapq.heapify(queue)
+        self._seated.sort(key=lambda party: party.seated, reverse=True)
+
+    @staticmethod
+    def order(party: Party) -> tuple:
+        """
+        Sort key of the waiting parties, first to be seated first.
+        """
+        return (-party.priority, party.arrived, party.id)
+
+    def __len__(self) -> int:
+        return len(self._waiting)
+
+    def push(self, party: Party) -> None:
+        """
+        Add a waiting party.
+        """
+        self._waiting[party.id] = party
+        heapq.heappush(self._queues.setdefault(party.size, []), (Waitlist.order(party), party))
+
+    def discard(self, partyId: int) -> None:
+        """
+        Remove a party, waiting or recently seated.
+        """
+        if self._waiting.pop(partyId, None) is None:
+            self._seated = [party for party in self._seated if party.id != partyId]
+
+    def seated(self, party: Party, kept: int) -> list[Party]:
+        """
+        Record a party as seated, returning those seated before that are no
+        longer among the latest kept.
+        """
+        self._seated.insert(0, party)
+        dropped, self._seated = self._seated[kept:], self._seated[:kept]
+        return dropped
+
+    def best(self, seats: int) -> Party:
+        """
+        Report the party to seat at a table, without removing it.
+
+        Args:
+            seats: number of seats at the table.
+
+        Returns:
+            Party object, or None if no waiting party fits.
+
+        Raises:
+            None.
+        """
+        best = None
+        for size, queue in self._queues.items():
+            if size > seats:
+                continue
+            while queue and self._waiting.get(queue[0][1].id) is not queue[0][1]:
+                heapq.heappop(queue)                        # left the waitlist
+            if queue:
+                key, party = queue[0]
+                rank = (key[0], seats - size, key[1], key[2])
+                if best is None or rank < best[0]:
+                    best = (rank, size)
+        return self._queues[best[1]][0][1] if best else None
+
+    def pop(self, seats: int) -> Party:
+        """
+        Remove and return the party to seat at a table.
+
+        Args:
+            seats: number of seats at the table.
+
+        Returns:
+            Party object, or None if no waiting party fits.
+
+        Raises:
+            None.
+        """
+        party = self.best(seats)
+        if party:
+            heapq.heappop(self._queues[party.size])
+            del self._waiting[party.id]
+        return party
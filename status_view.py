@@ -0,0 +1,76 @@
+#
+# status_view.py
+#
+# Shared filter and pagination controls for the table status listings on the
+# Booking and Table Status pages. Only the page of tables selected here is
+# computed and rendered, so the listings stay responsive with large floors.
+#
+
+import streamlit as st
+import restaurant
+
+PAGE_SIZES = [10, 20, 50]
+
+# filter_controls
+#
+# Show the status filter inputs in a collapsible section, returning a
+# StatusFilter object. The prefix keeps widget keys unique for each page.
+#
+def filter_controls(prefix: str) -> restaurant.StatusFilter:
+    def resetPage():
+        st.session_state[f"{prefix}_page"] = 0              # filter changes restart at the first page
+
+    with st.expander("Filter tables"):
+        col_table, col_state = st.columns(2)
+        with col_table:
+            tablename = st.text_input("Table", key=f"{prefix}_filter_table", on_change=resetPage)
+        with col_state:
+            state = st.selectbox("Show", restaurant.StatusFilter.STATES, key=f"{prefix}_filter_state", on_change=resetPage)
+        customer = st.text_input("Customer name or phone", key=f"{prefix}_filter_customer", on_change=resetPage)
+        ranged = st.checkbox("Limit to time range", key=f"{prefix}_filter_ranged", on_change=resetPage)
+        col_from, col_to = st.columns(2)
+        with col_from:
+            start = st.time_input("From", key=f"{prefix}_filter_from", value=None, step=900, disabled=not ranged, on_change=resetPage)
+        with col_to:
+            end = st.time_input("To", key=f"{prefix}_filter_to", value=None, step=900, disabled=not ranged, on_change=resetPage)
+
+    if not ranged:
+        start = end = None
+    return restaurant.StatusFilter(tablename, start, end, state, customer)
+
+# page_controls
+#
+# Return the current zero-based page number and page size for the listing.
+#
+def page_controls(prefix: str) -> tuple[int, int]:
+    if f"{prefix}_page" not in st.session_state:
+        st.session_state[f"{prefix}_page"] = 0
+    return st.session_state[f"{prefix}_page"], st.session_state.get(f"{prefix}_page_size", PAGE_SIZES[1])
+
+# page_navigation
+#
+# Show previous/next buttons and the page size once the total number of
+# matching tables is known.
+#
+def page_navigation(prefix: str, total: int) -> None:
+    page, pageSize = page_controls(prefix)
+    pageCount = max(1, -(-total // pageSize))
+    page = min(page, pageCount - 1)
+    st.session_state[f"{prefix}_page"] = page
+
+    def turn(step: int):
+        st.session_state[f"{prefix}_page"] = min(max(page + step, 0), pageCount - 1)
+
+    def resize():
+        st.session_state[f"{prefix}_page"] = 0
+
+    col_prev, col_info, col_next, col_size = st.columns([0.2, 0.4, 0.2, 0.2], vertical_alignment="center")
+    with col_prev:
+        st.button("Previous", key=f"{prefix}_prev", disabled=page == 0, on_click=turn, args=(-1,))
+    with col_info:
+        st.markdown(f"Page **{page + 1}** of **{pageCount}** ({total} tables)")
+    with col_next:
+        st.button("Next", key=f"{prefix}_next", disabled=page >= pageCount - 1, on_click=turn, args=(1,))
+    with col_size:
+        st.selectbox("Per page", PAGE_SIZES, index=PAGE_SIZES.index(pageSize), key=f"{prefix}_page_size",
+                     label_visibility="collapsed", on_change=resize)
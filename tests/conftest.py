@@ -0,0 +1,36 @@
+#
+# conftest.py
+#
+# Shared fixtures for the pytock tests. Every test starts on an empty store,
+# i.e. the default tables only, at a fixed time, and with the session reruns
+# of pytock_data.rerun_sessions() switched off since there are no sessions.
+#
+
+import datetime
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytock_clock
+import pytock_data
+
+NOW = datetime.datetime(2026, 10, 19, 12, 0)
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    monkeypatch.setattr(pytock_data, "rerun_sessions", lambda venueId=None: None)
+    pytock_data.reset()
+    yield
+    pytock_data.reset()
+
+
+@pytest.fixture(autouse=True)
+def clock():
+    clock = pytock_clock.FixedClock(NOW)
+    pytock_clock.set_clock(clock)
+    yield clock
+    pytock_clock.set_clock(None)
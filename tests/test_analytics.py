@@ -0,0 +1,88 @@
+#
+# test_analytics.py
+#
+# Reports: live bookings and occurrences of recurring rules are included, a
+# joined party counts once, and computed reports are kept without changing the
+# shared data.
+#
+
+import datetime
+import gzip
+import itertools
+import json
+
+import pytest
+
+import pytock_analytics
+import pytock_archive
+import pytock_data
+import restaurant
+
+from conftest import NOW
+
+TODAY = NOW.date()
+
+
+@pytest.fixture(autouse=True)
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(pytock_archive, "ARCHIVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_live_table_includes_occurrences():
+    bookings = restaurant.Bookings()
+    bookings.add(restaurant.Booking("Table 1", "Ann Lee", "+7 999 123 45 67", datetime.time(19), datetime.time(1)))
+    bookings.addRule(restaurant.RecurringRule("Table 2", "Bob Ray", "+7 999 765 43 21", datetime.time(20),
+                                              datetime.time(1)))
+    table = pytock_analytics.bookings_table(TODAY, TODAY)
+    assert sorted(table["name"].to_pylist()) == ["Ann Lee", "Bob Ray"]
+    assert sorted(table["seats"].to_pylist()) == [4, 4]
+
+
+def test_joined_party_counts_once():
+    restaurant.Tables().setJoinable("Table 1", ["Table 2"])
+    restaurant.Bookings().addJoined("Ann Lee", "+7 999 123 45 67", datetime.time(19), datetime.time(1), 8)
+    turnover = pytock_analytics.reports(pytock_analytics.bookings_table(TODAY, TODAY))["table_turnover"]
+    assert turnover.loc[TODAY.isoformat(), "parties"] == 1
+    assert turnover.loc[TODAY.isoformat(), "tables_used"] == 2
+
+
+def test_archive_without_party_counts_bookings(archive):
+    directory = pytock_archive.directory_for(pytock_data.DEFAULT_VENUE)
+    records = [{"id": number, "table": "Table 1", "seats": 4, "name": "Ann Lee", "phone": "",
+                "start": f"{TODAY.isoformat()}T0{number}:00:00", "end": f"{TODAY.isoformat()}T0{number}:30:00",
+                "walkin": False} for number in (1, 2)]
+    archive.joinpath(pytock_data.DEFAULT_VENUE).mkdir()
+    with gzip.open(pytock_archive.path(TODAY, directory), "wt", encoding="utf-8") as file:
+        file.write("".join(json.dumps(record) + "\n" for record in records))
+    turnover = pytock_analytics.reports(pytock_analytics.bookings_table(TODAY, TODAY))["table_turnover"]
+    assert turnover.loc[TODAY.isoformat(), "parties"] == 2
+
+
+def test_parties_counted_across_restart(monkeypatch):
+    def serve(start: datetime.time) -> None:
+        monkeypatch.setattr(restaurant.Booking, "_ids", itertools.count(1000))     # as in a new process
+        restaurant.Tables().setJoinable("Table 1", ["Table 2"])
+        bookings = restaurant.Bookings()
+        bookings.addJoined("Big Party", "111", start, datetime.time(1), 8)
+        bookings.add(restaurant.Booking("Table 3", "Ann Lee", "222", start, datetime.time(1)))
+    serve(datetime.time(12))
+    due = restaurant.Bookings().nextExpiry()
+    assert len(restaurant.Bookings().sweepExpired(due, lambda expired: pytock_archive.on_expired(
+        expired, pytock_data.DEFAULT_VENUE))) == 3
+    pytock_data.reset()                                     # the restart
+    serve(datetime.time(19))
+    table = pytock_analytics.bookings_table(TODAY, TODAY)
+    assert sorted(table["id"].to_pylist()) == [1000, 1000, 1001, 1001, 1002, 1002]
+    turnover = pytock_analytics.reports(table)["table_turnover"]
+    assert turnover.loc[TODAY.isoformat(), "parties"] == 4
+
+
+def test_reports_kept_without_changing_shared_data():
+    restaurant.Tables(), restaurant.Bookings()              # the sources exist
+    reports = pytock_analytics.request_reports(TODAY, TODAY)
+    assert reports.computed == NOW
+    assert pytock_data.version("analytics_reports") == 0
+    assert pytock_analytics.request_reports(TODAY, TODAY) is reports
+    restaurant.Tables().createTable("Patio", 2)
+    assert pytock_analytics.request_reports(TODAY, TODAY) is not reports
@@ -0,0 +1,62 @@
+#
+# test_availability.py
+#
+# The booking preview: the tables free for a window and whether a customer is
+# already booked then, from slot masks derived once per version of the data.
+#
+
+import datetime
+
+import restaurant
+
+HOUR = datetime.time(1)
+
+
+def preview() -> restaurant.Availability:
+    return restaurant.Bookings().availability()
+
+
+def test_free_tables():
+    restaurant.Bookings().add(restaurant.Booking("Table 1", "Ann Lee", "555", datetime.time(13), HOUR))
+    assert preview().freeTables(datetime.time(13, 30), HOUR) == ["Table 2", "Table 3"]
+    assert preview().freeTables(datetime.time(12), HOUR) == ["Table 2", "Table 3"]      # touching conflicts
+    assert preview().freeTables(datetime.time(14), HOUR) == ["Table 2", "Table 3"]
+    assert preview().freeTables(datetime.time(14, 15), HOUR) == ["Table 1", "Table 2", "Table 3"]
+    assert preview().freeTables(datetime.time(11), datetime.time(0, 45)) == ["Table 1", "Table 2", "Table 3"]
+
+
+def test_off_grid_rounded_outward():
+    restaurant.Bookings().add(restaurant.Booking("Table 1", "Ann Lee", "555", datetime.time(13), HOUR))
+    assert "Table 1" not in preview().freeTables(datetime.time(14, 5), HOUR)
+    assert not restaurant.Bookings().bookingAvailable(
+        restaurant.Booking("Table 1", "Bob Ray", "666", datetime.time(14), HOUR))
+    assert restaurant.Bookings().bookingAvailable(
+        restaurant.Booking("Table 1", "Bob Ray", "666", datetime.time(14, 5), HOUR))   # the exact check
+
+
+def test_occurrences_count_walkins_do_not():
+    restaurant.Bookings().addRule(restaurant.RecurringRule("Table 2", "Bob Ray", "666", datetime.time(19), HOUR))
+    restaurant.Bookings().walkIn("Table 3")
+    assert preview().freeTables(datetime.time(19), HOUR) == ["Table 1", "Table 3"]
+    assert preview().freeTables(datetime.time(12), HOUR) == ["Table 1", "Table 2", "Table 3"]
+
+
+def test_customer_busy():
+    restaurant.Bookings().add(restaurant.Booking("Table 1", "Ann Lee", "555", datetime.time(13), HOUR))
+    availability = preview()
+    assert availability.customerBusy("Ann Lee", "555", datetime.time(13, 30), HOUR)
+    assert availability.customerBusy("Ann Lee", "555", datetime.time(12), HOUR)
+    assert not availability.customerBusy("Ann Lee", "555", datetime.time(15), HOUR)
+    assert not availability.customerBusy("Bob Ray", "666", datetime.time(13), HOUR)
+
+
+def test_derived_once_per_version():
+    restaurant.Tables()
+    bookings = restaurant.Bookings()
+    first = preview()
+    assert preview() is first
+    bookings.add(restaurant.Booking("Table 2", "Ann Lee", "555", datetime.time(18), HOUR))
+    second = preview()
+    assert second is not first
+    assert second.freeTables(datetime.time(18), HOUR) == ["Table 1", "Table 3"]
+    assert first.freeTables(datetime.time(18), HOUR) == ["Table 1", "Table 2", "Table 3"]
@@ -0,0 +1,69 @@
+#
+# test_board.py
+#
+# Status boards: a refresh renders again only the tables that the change
+# events concern, writes nothing when there were none, and renders the board
+# in full on a new day.
+#
+
+import datetime
+import json
+
+import pytest
+
+import pytock_board
+import pytock_data
+import restaurant
+
+
+@pytest.fixture
+def boards(tmp_path):
+    restaurant.Tables()
+    restaurant.Bookings()
+    boards = pytock_board.Boards(str(tmp_path))
+    yield boards
+    boards.close()
+
+
+def board(boards: pytock_board.Boards) -> pytock_board.Board:
+    return boards._boards[pytock_data.DEFAULT_VENUE]
+
+
+def status(tmp_path) -> dict:
+    with open(tmp_path / pytock_data.DEFAULT_VENUE / "status.json", encoding="utf-8") as file:
+        return {table["name"]: [row["name"] for row in table["bookings"]] for table in json.load(file)["tables"]}
+
+
+def test_first_refresh_renders_all(boards, tmp_path):
+    assert boards.refresh() == 1
+    assert board(boards).renders == 3
+    assert status(tmp_path) == {"Table 1": [ ], "Table 2": [ ], "Table 3": [ ]}
+    assert boards.refresh() == 0 and board(boards).renders == 3
+
+
+def test_only_changed_tables_rendered(boards, tmp_path):
+    boards.refresh()
+    booking = restaurant.Booking("Table 1", "Ann Lee", "555-0101", datetime.time(13), datetime.time(1))
+    restaurant.Bookings().add(booking)
+    assert boards.refresh() == 1 and board(boards).renders == 4
+    assert status(tmp_path)["Table 1"] == ["Ann Lee"]
+    page = (tmp_path / pytock_data.DEFAULT_VENUE / "index.html").read_text(encoding="utf-8")
+    assert "Ann Lee" in page and "555-0101" not in page
+    restaurant.Bookings().delete(booking)
+    assert boards.refresh() == 1 and board(boards).renders == 5
+    assert status(tmp_path)["Table 1"] == [ ]
+
+
+def test_table_changed_renders_its_tables(boards, tmp_path):
+    boards.refresh()
+    restaurant.Tables().setJoinable("Table 1", ["Table 2"])
+    assert boards.refresh() == 1 and board(boards).renders == 5   # both tables changed
+    restaurant.Tables().deleteTable("Table 3")
+    assert boards.refresh() == 1 and board(boards).renders == 5
+    assert list(status(tmp_path)) == ["Table 1", "Table 2"]
+
+
+def test_new_day_renders_all(boards, clock):
+    boards.refresh()
+    clock.advance(datetime.timedelta(days=1))
+    assert boards.refresh() == 1 and board(boards).renders == 6
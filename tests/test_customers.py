@@ -0,0 +1,73 @@
+#
+# test_customers.py
+#
+# Customer records: stored bookings of one guest share one record, whatever the
+# phone formatting, with interned strings; form input is not kept, and records
+# with nothing stored are forgotten.
+#
+
+import datetime
+import sys
+
+import restaurant
+
+
+def booking(name: str, phone: str, tablename: str = "Table 1", start: datetime.time = datetime.time(19)):
+    return restaurant.Booking(tablename, name, phone, start, datetime.time(1, 0))
+
+
+def customers() -> restaurant.Customers:
+    return restaurant.Customers.venueCustomers()
+
+
+def test_same_guest_shares_record():
+    first = booking("Ann Lee", "+7 (999) 123-45-67")
+    second = booking("ann  lee", "79991234567", "Table 2", datetime.time(21))
+    bookings = restaurant.Bookings()
+    bookings.add(first)
+    bookings.add(second)
+    assert first.customer is second.customer
+    assert first.customerId is not None and len(customers()) == 1
+    assert customers().find("Ann Lee", "8 999 123 45 67") is None           # another number
+    assert customers().find("ANN LEE", "+79991234567") == first.customerId
+
+
+def test_stored_strings_interned():
+    typed = "".join(["Ann ", "Lee"])                        # not a constant, so not interned already
+    stored = booking(typed, "+7 999 123 45 67")
+    restaurant.Bookings().add(stored)
+    assert stored.name is sys.intern("Ann Lee")
+
+
+def test_guests_sharing_phone_kept_apart():
+    bookings = restaurant.Bookings()
+    bookings.add(booking("Ann Lee", "+7 999 123 45 67"))
+    bookings.add(booking("Bob Lee", "+7 999 123 45 67", "Table 2"))
+    assert len(customers().withPhone("79991234567")) == 2
+
+
+def test_unstored_input_not_kept():
+    restaurant.Bookings().bookingAvailable(booking("Ann Lee", "+7 999 123 45 67"))
+    assert len(customers()) == 0
+
+
+def test_customers_without_bookings_forgotten():
+    kept, gone = booking("Ann Lee", "+7 999 123 45 67"), booking("Bob Ray", "+7 999 765 43 21", "Table 2")
+    bookings = restaurant.Bookings()
+    bookings.add(kept)
+    bookings.add(gone)
+    bookings.deleteId(gone.id)
+    assert restaurant.Bookings().forgetCustomers() == 1
+    assert customers().find("Bob Ray", "+7 999 765 43 21") is None
+    assert customers().get(kept.customerId) is kept.customer
+    assert gone.name == "Bob Ray"                           # the booking still holds its record
+
+
+def test_history_by_customer():
+    bookings = restaurant.Bookings()
+    bookings.add(booking("Ann Lee", "+7 999 123 45 67"))
+    bookings.add(booking("Ann Lee", "7 (999) 123-45-67", "Table 2", datetime.time(21)))
+    bookings.add(booking("Bob Ray", "+7 999 765 43 21", "Table 3"))
+    customerId = customers().find("Ann Lee", "+7 999 123 45 67")
+    history, rules = restaurant.Bookings().customerHistory(customerId)
+    assert [bk.tablename for bk in history] == ["Table 1", "Table 2"] and rules == []
@@ -0,0 +1,56 @@
+#
+# test_expiry.py
+#
+# Expiry: bookings leave the store from the heap once their grace period has
+# passed, in order, archived first, and stay due if archiving fails.
+#
+
+import datetime
+
+import pytest
+
+import pytock_archive
+import restaurant
+
+GRACE = restaurant.Booking.EXPIRY_GRACE
+
+
+def book(tablename: str, start: datetime.time, name: str = "Ann Lee") -> restaurant.Booking:
+    booking = restaurant.Booking(tablename, name, "+7 999 123 45 67", start, datetime.time(1, 0))
+    restaurant.Bookings().add(booking)
+    return booking
+
+
+def test_heap_schedules_earliest_expiry(clock):
+    book("Table 1", datetime.time(15))
+    early = book("Table 2", datetime.time(13))
+    assert restaurant.Bookings().nextExpiry() == early.expires
+
+
+def test_sweep_removes_only_due_bookings(clock):
+    early, late = book("Table 1", datetime.time(13)), book("Table 2", datetime.time(15))
+    bookings = restaurant.Bookings()
+    assert bookings.sweepExpired(early.expires - datetime.timedelta(seconds=1)) == []
+    assert bookings.sweepExpired(early.expires) == [early]
+    assert restaurant.Bookings().find(early.id) is None
+    assert restaurant.Bookings().nextExpiry() == late.expires
+
+
+def test_expired_bookings_archived_with_seats(clock, tmp_path):
+    booking = book("Table 1", datetime.time(13))
+    expired = restaurant.Bookings().sweepExpired(booking.expires,
+                                                 lambda due: pytock_archive.archive(due, str(tmp_path), {"Table 1": 4}))
+    assert expired == [booking]
+    records = list(pytock_archive.query(directory=str(tmp_path)))
+    assert [(rec["id"], rec["table"], rec["seats"]) for rec in records] == [(booking.id, "Table 1", 4)]
+
+
+def test_failed_archive_leaves_bookings_due(clock):
+    booking = book("Table 1", datetime.time(13))
+    def fail(due):
+        raise OSError("disk full")
+    with pytest.raises(OSError):
+        restaurant.Bookings().sweepExpired(booking.expires, fail)
+    assert restaurant.Bookings().find(booking.id) is booking
+    assert restaurant.Bookings().nextExpiry() == booking.expires
+    assert restaurant.Bookings().sweepExpired(booking.expires) == [booking]
@@ -0,0 +1,32 @@
+#
+# test_feed.py
+#
+# The change feed: subscribers receive the events they asked for, and a reset
+# closes the subscriptions of the venue's resources but not the others.
+#
+
+import pytock_data
+import restaurant
+
+
+def test_booking_event_reaches_subscriber():
+    tables = restaurant.Tables()                            # the default tables first
+    feed = pytock_data.subscribe({"table_created"})
+    tables.createTable("Patio", 2)
+    events = feed.drain()
+    assert [event.kind for event in events] == ["table_created"]
+    assert events[0].item.name == "Patio"
+    pytock_data.unsubscribe(feed)
+
+
+def test_reset_closes_venue_subscriptions():
+    fragments = restaurant.Fragments.venueFragments()
+    everywhere = pytock_data.subscribe({"table_created"})
+    pytock_data.reset()
+    assert fragments._feed.closed
+    assert not everywhere.closed
+    assert pytock_data._subscriptions == [everywhere]
+    restaurant.Tables()
+    assert fragments._feed.drain() == []
+    assert len(everywhere.drain()) == 3
+    pytock_data.unsubscribe(everywhere)
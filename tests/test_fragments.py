@@ -0,0 +1,67 @@
+#
+# test_fragments.py
+#
+# Rendered table status: a table is rendered again only when a change concerns
+# it, however many times the status is shown.
+#
+
+import datetime
+
+import restaurant
+
+
+def show() -> list:
+    rows, total = restaurant.Bookings().statusPage(restaurant.Tables(), restaurant.StatusFilter(), 0, 50)
+    return rows
+
+
+def renders() -> int:
+    return restaurant.Fragments.venueFragments().renders
+
+
+def test_unchanged_tables_not_rendered_again():
+    show()
+    assert renders() == 3
+    show()
+    show()
+    assert renders() == 3
+
+
+def test_booking_renders_its_table_only():
+    show()
+    restaurant.Bookings().add(restaurant.Booking("Table 2", "Ann", "123", datetime.time(19), datetime.time(1)))
+    rows = show()
+    assert renders() == 4
+    table, text, bookings = rows[1]
+    assert table.name == "Table 2" and len(bookings) == 1
+    assert "Ann" in bookings[0][1]
+
+
+def test_walk_in_and_out_render_again():
+    show()
+    restaurant.Bookings().walkIn("Table 1")
+    assert show()[0][2][0][1] == "Walk-In Guest"
+    restaurant.Bookings().walkOut("Table 1")
+    assert show()[0][2] == [ ]
+    assert renders() == 5
+
+
+def test_table_change_renders_again():
+    show()
+    restaurant.Tables().setJoinable("Table 1", ["Table 3"])    # changes both tables
+    show()
+    assert renders() == 5
+
+
+def test_new_day_renders_everything(clock):
+    show()
+    clock.advance(datetime.timedelta(days=1))
+    show()
+    assert renders() == 6
+
+
+def test_deleted_booking_not_shown():
+    restaurant.Bookings().add(restaurant.Booking("Table 3", "Bob", "555", datetime.time(20), datetime.time(1)))
+    assert len(show()[2][2]) == 1
+    restaurant.Bookings().deleteId(restaurant.Bookings().bookings[0].id)
+    assert show()[2][2] == [ ]
@@ -0,0 +1,69 @@
+#
+# test_holds.py
+#
+# Table holds: a hold keeps other sessions off its window until it lapses or
+# its own session books it, while work without a session ignores it.
+#
+
+import datetime
+
+import pytest
+
+import exceptions
+import pytock_data
+import restaurant
+
+
+@pytest.fixture
+def session(monkeypatch):
+    def act_as(owner):
+        monkeypatch.setattr(pytock_data, "session", lambda: owner)
+    return act_as
+
+
+@pytest.fixture
+def monotonic(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(restaurant.time, "monotonic", lambda: now[0])
+    return now
+
+
+def booking(name: str, hour: int) -> restaurant.Booking:
+    return restaurant.Booking("Table 1", name, "555", datetime.time(hour), datetime.time(1))
+
+
+def test_hold_lapses_after_ttl(monotonic):
+    holds = restaurant.Holds.venueHolds()
+    assert holds.take("a", "Table 1", "Ann", "555", datetime.time(13), datetime.time(1),
+                      ttl=datetime.timedelta(seconds=60))
+    assert not holds.take("b", "Table 1", "Bob", "666", datetime.time(13, 30), datetime.time(1))
+    monotonic[0] += 59
+    assert len(holds) == 1 and holds.heldTables(datetime.time(13), datetime.time(1), "b") == {"Table 1"}
+    monotonic[0] += 1
+    assert len(holds) == 0 and holds.others("Table 1", "b") == [ ]
+    assert holds.take("b", "Table 1", "Bob", "666", datetime.time(13, 30), datetime.time(1))
+
+
+def test_hold_blocks_other_sessions(session):
+    restaurant.Tables()
+    holds = restaurant.Holds.venueHolds()
+    session("a")
+    assert holds.take("a", "Table 1", "Ann", "555", datetime.time(13), datetime.time(1))
+    session("b")
+    with pytest.raises(exceptions.TableBusyError):
+        restaurant.Bookings().add(booking("Bob", 13))
+    assert restaurant.Bookings().add(booking("Bob", 15))     # outside the window
+    assert holds.heldTables(datetime.time(13), datetime.time(1), "b") == {"Table 1"}
+    assert holds.heldTables(datetime.time(13), datetime.time(1), "a") == set()
+    session(None)                                           # background work ignores holds
+    assert restaurant.Bookings().add(booking("Cat", 13))
+
+
+def test_hold_released_on_add(session):
+    restaurant.Tables()
+    holds = restaurant.Holds.venueHolds()
+    session("a")
+    assert holds.take("a", "Table 1", "Ann", "555", datetime.time(13), datetime.time(1))
+    assert restaurant.Bookings().add(booking("Ann", 13))
+    assert len(holds) == 0
+    assert not holds.release("a")
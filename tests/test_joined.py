@@ -0,0 +1,80 @@
+#
+# test_joined.py
+#
+# Joined tables for large parties: the combination with the fewest empty seats,
+# then the fewest tables, booked as one change.
+#
+
+import datetime
+
+import pytest
+
+import exceptions
+import restaurant
+
+EVENING, PERIOD = datetime.time(19), datetime.time(2)
+
+
+@pytest.fixture(autouse=True)
+def floor():
+    restaurant.Tables().setJoinable("Table 1", ["Table 2", "Table 3"])     # 4 + 4, 4 + 6
+
+
+def combination(size: int, exclude=()) -> list:
+    return restaurant.Bookings().availability().combination(size, EVENING, PERIOD, exclude)
+
+
+def test_combination_fewest_empty_seats():
+    assert combination(8) == ["Table 1", "Table 2"]
+    assert combination(9) == ["Table 1", "Table 3"]
+    assert combination(10) == ["Table 1", "Table 3"]
+    assert combination(12) == ["Table 1", "Table 2", "Table 3"]
+
+
+def test_combination_one_table_when_it_fits():
+    assert combination(6) == ["Table 3"]
+
+
+def test_combination_only_joinable_tables():
+    restaurant.Tables().setJoinable("Table 1", [ ])
+    assert combination(8) is None
+
+
+def test_combination_leaves_out_excluded_and_busy_tables():
+    assert combination(8, {"Table 2"}) == ["Table 1", "Table 3"]
+    restaurant.Bookings().add(restaurant.Booking("Table 2", "Ann", "123", datetime.time(20), datetime.time(1)))
+    assert combination(8) == ["Table 1", "Table 3"]
+    assert combination(14) is None
+
+
+def test_add_joined_books_every_table():
+    first = restaurant.Bookings().addJoined("Big Party", "555", EVENING, PERIOD, 8)
+    stored = restaurant.Bookings().bookings
+    assert [bk.tablename for bk in stored] == ["Table 1", "Table 2"]
+    assert all(isinstance(bk, restaurant.JoinedBooking) and bk.parts == first.parts for bk in stored)
+    assert first.size == 8 and first.tablenames == ("Table 1", "Table 2")
+
+
+def test_add_joined_refuses_when_no_combination_free():
+    restaurant.Bookings().add(restaurant.Booking("Table 1", "Ann", "123", datetime.time(20), datetime.time(1)))
+    with pytest.raises(exceptions.TableBusyError):
+        restaurant.Bookings().addJoined("Big Party", "555", EVENING, PERIOD, 8)
+
+
+def test_add_joined_refuses_duplicate_customer():
+    restaurant.Bookings().add(restaurant.Booking("Table 3", "Big Party", "555", EVENING, datetime.time(1)))
+    with pytest.raises(exceptions.DuplicateBookingError):
+        restaurant.Bookings().addJoined("big  party", "5-5-5", EVENING, PERIOD, 8)
+
+
+def test_deleting_one_part_deletes_all():
+    first = restaurant.Bookings().addJoined("Big Party", "555", EVENING, PERIOD, 8)
+    restaurant.Bookings().deleteId(first.parts[-1])
+    assert restaurant.Bookings().bookings == [ ]
+
+
+def test_deleted_table_culls_all_parts():
+    restaurant.Bookings().addJoined("Big Party", "555", EVENING, PERIOD, 8)
+    restaurant.Tables().deleteTable("Table 2")
+    assert restaurant.Bookings().collectGarbage() == 2
+    assert restaurant.Bookings().bookings == [ ]
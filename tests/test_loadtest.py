@@ -0,0 +1,45 @@
+#
+# test_loadtest.py
+#
+# The load test harness, without opening sessions: its quantiles, the report
+# comparison, and the store hooks put back after a level fails.
+#
+
+import pytest
+
+import pytock_data
+import pytock_loadtest
+
+
+def row(sessions: int, rerun: float, errors: int = 0) -> dict:
+    return {key: rerun for key, title, spec in pytock_loadtest.COLUMNS} | {"sessions": sessions, "errors": errors}
+
+
+def test_quantile():
+    samples = [float(each) for each in range(1, 101)]
+    assert pytock_loadtest.quantile(samples, 0.5) == 51
+    assert pytock_loadtest.quantile(samples, 0.99) == 100
+    assert pytock_loadtest.quantile(samples, 1.0) == 100
+    assert pytock_loadtest.quantile([ ], 0.5) == 0.0
+
+
+def test_comparison_by_sessions(capsys):
+    base = {"build": {"commit": "old"}, "levels": [row(1, 2.0), row(10, 4.0)]}
+    report = {"build": {"commit": "new"}, "levels": [row(1, 1.0), row(10, 8.0), row(50, 9.0)]}
+    pytock_loadtest.print_comparison(report, base)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "build new against old (ratio new/old)"
+    assert len(lines) == 4                                  # header and the two levels in both
+    assert lines[1].split()[:3] == ["N", "p50", "ms"]
+    assert "0.50x" in lines[2] and lines[2].rstrip().endswith("-")      # no errors before
+    assert "2.00x" in lines[3]
+
+
+def test_hooks_restored_after_failure(monkeypatch):
+    def fail(number: int, page: str):
+        raise RuntimeError(f"session {number} cannot open {page}")
+    monkeypatch.setattr(pytock_loadtest, "Session", fail)
+    rerun = pytock_data.rerun_sessions
+    with pytest.raises(RuntimeError):
+        pytock_loadtest.LoadTest(changes=1, tables=5).run([1])
+    assert pytock_data.rerun_sessions is rerun
@@ -0,0 +1,80 @@
+#
+# test_metrics.py
+#
+# The metrics registry: counters, gauges and histograms by labels, the
+# operations and changes recorded by a booking, and the Prometheus text.
+#
+
+import datetime
+
+import pytest
+
+import pytock_data
+import pytock_metrics
+import restaurant
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    pytock_metrics.reset()
+    yield
+    pytock_metrics.reset()
+
+
+def test_counters_and_gauges_by_labels():
+    pytock_metrics.inc("events_total", kind="walk_in", venue="main")
+    pytock_metrics.inc("events_total", 2, venue="main", kind="walk_in")     # label order does not matter
+    pytock_metrics.inc("events_total", kind="walk_out", venue="main")
+    pytock_metrics.gauge("stored_items", 5, key="restaurant_bookings")
+    pytock_metrics.gauge("stored_items", 3, key="restaurant_bookings")
+    values = pytock_metrics.snapshot()
+    assert values[("events_total", (("kind", "walk_in"), ("venue", "main")))] == 3
+    assert values[("events_total", (("kind", "walk_out"), ("venue", "main")))] == 1
+    assert values[("stored_items", (("key", "restaurant_bookings"),))] == 3
+
+
+def test_histogram_buckets_and_quantile():
+    for sessions in [0, 1, 1, 2, 7, 1000]:
+        pytock_metrics.observe("rerun_fanout_sessions", sessions)
+    histogram = pytock_metrics.snapshot()[("rerun_fanout_sessions", ())]
+    assert histogram.count == 6 and histogram.sum == 1011
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.8) == 10
+    assert histogram.quantile(1.0) == float("inf")
+    assert pytock_metrics.Histogram(pytock_metrics.COUNT_BUCKETS).quantile(0.5) is None
+
+
+def test_snapshot_is_a_copy():
+    pytock_metrics.observe("rerun_fanout_sessions", 1)
+    histogram = pytock_metrics.snapshot()[("rerun_fanout_sessions", ())]
+    pytock_metrics.observe("rerun_fanout_sessions", 1)
+    assert histogram.count == 1
+
+
+def test_booking_recorded():
+    bookings = restaurant.Bookings()                        # stores the empty bookings first
+    pytock_metrics.reset()
+    bookings.add(restaurant.Booking("Table 1", "Ann Lee", "555", datetime.time(13), datetime.time(1)))
+    values = pytock_metrics.snapshot()
+    venue = pytock_data.DEFAULT_VENUE
+    assert values[("operation_seconds", (("op", "bookings_add"),))].count == 1
+    assert values[("changes_total", (("key", "restaurant_bookings"), ("venue", venue)))] == 1
+    assert values[("stored_items", (("key", "restaurant_bookings"), ("venue", venue)))] == 1
+    assert values[("events_total", (("kind", "booking_added"), ("venue", venue)))] == 1
+
+
+def test_prometheus_text(tmp_path):
+    pytock_metrics.inc("changes_total", key="restaurant_tables")
+    pytock_metrics.observe("rerun_fanout_sessions", 1)
+    pytock_metrics.observe("rerun_fanout_sessions", 3)
+    lines = pytock_metrics.prometheus_text().splitlines()
+    assert "# TYPE pytock_changes_total counter" in lines
+    assert 'pytock_changes_total{key="restaurant_tables"} 1' in lines
+    assert 'pytock_rerun_fanout_sessions_bucket{le="1"} 1' in lines
+    assert 'pytock_rerun_fanout_sessions_bucket{le="5"} 2' in lines
+    assert 'pytock_rerun_fanout_sessions_bucket{le="+Inf"} 2' in lines
+    assert "pytock_rerun_fanout_sessions_count 2" in lines
+    assert not any("profiles_total" in line for line in lines)
+    path = pytock_metrics.write_textfile(str(tmp_path / "pytock.prom"))
+    with open(path) as file:
+        assert file.read() == pytock_metrics.prometheus_text()
@@ -0,0 +1,45 @@
+#
+# test_occupancy.py
+#
+# Occupancy: the sweep counts each table once while any booking covers it,
+# spreads busy time over hourly bins, and leaves walk-ins out.
+#
+
+import datetime
+
+import restaurant
+
+HOUR = datetime.time(1)
+
+
+def book(tablename: str, start: datetime.time, name: str, period: datetime.time = HOUR) -> None:
+    restaurant.Bookings().add(restaurant.Booking(tablename, name, name, start, period))
+
+
+def test_curve_and_peak():
+    book("Table 1", datetime.time(13), "Ann")
+    book("Table 2", datetime.time(13, 30), "Bob")               # 4 + 4 seats
+    occupancy = restaurant.Bookings().occupancy()
+    assert [(when.time(), tables, seats) for when, tables, seats in occupancy.curve] == [
+        (datetime.time(13), 1, 4), (datetime.time(13, 30), 2, 8), (datetime.time(14), 1, 4),
+        (datetime.time(14, 30), 0, 0)]
+    assert occupancy.peak() == (2, 8)
+
+
+def test_heatmap_and_covers_by_hour():
+    book("Table 1", datetime.time(13, 30), "Ann")
+    occupancy = restaurant.Bookings().occupancy()
+    assert [hour.time() for hour in occupancy.hours] == [datetime.time(13), datetime.time(14)]
+    assert occupancy.heatmap(["Table 1", "Table 2"]) == {"Table 1": [0.5, 0.5], "Table 2": [0.0, 0.0]}
+    assert occupancy.coversByHour() == [2.0, 2.0]
+
+
+def test_walkins_left_out():
+    restaurant.Bookings().walkIn("Table 1")
+    occupancy = restaurant.Bookings().occupancy()
+    assert occupancy.hours == [] and occupancy.peak() == (0, 0)
+    assert occupancy.heatmap(["Table 1"]) == { }
+    book("Table 2", datetime.time(13), "Ann")
+    occupancy = restaurant.Bookings().occupancy()
+    assert occupancy.heatmap(["Table 1", "Table 2"]) == {"Table 1": [0.0], "Table 2": [1.0]}
+    assert occupancy.peak() == (1, 4)
@@ -0,0 +1,131 @@
+#
+# test_outbox.py
+#
+# Reminder outbox: deduplication, retries with backoff, and what a restart
+# sends again or cancels.
+#
+
+import datetime
+
+import pytest
+
+import pytock_data
+import pytock_outbox
+import restaurant
+
+
+@pytest.fixture
+def transport():
+    return pytock_outbox.StubTransport(latency=0, failure=0)
+
+
+@pytest.fixture
+def outboxes(transport, tmp_path):
+    opened = [ ]
+    def open_outbox():
+        opened.append(pytock_outbox.Outbox(transport, str(tmp_path)))
+        return opened[-1]
+    yield open_outbox
+    for outbox in opened:
+        outbox.close()
+
+
+def book(tablename: str = "Table 1", name: str = "Ann Lee", start: datetime.time = datetime.time(13, 30)):
+    return restaurant.Bookings().add(restaurant.Booking(tablename, name, "+7 999 123 45 67", start,
+                                                        datetime.time(1, 0)))
+
+
+def test_reminder_sent_once(outboxes, transport):
+    outbox = outboxes()
+    book()
+    assert outbox.dispatch() == 1
+    assert outbox.dispatch() == 0
+    assert len(transport.sent) == 1
+    key, phone, text = transport.sent[0]
+    assert key.startswith(f"main:booking:{pytock_outbox.EPOCH}:")
+    assert "Ann Lee" in text and "13:30" in text
+
+
+def test_reminder_not_due_yet(outboxes, transport):
+    outbox = outboxes()
+    book(start=datetime.time(18, 0))                        # due at 16:00
+    assert outbox.dispatch() == 0
+    assert outbox.status()["counts"]["pending"] == 1
+
+
+def test_deleted_booking_cancels_reminder(outboxes, transport):
+    outbox = outboxes()
+    book(start=datetime.time(18, 0))
+    bookings = restaurant.Bookings()
+    bookings.deleteId(bookings.bookings[0].id)
+    outbox.dispatch()
+    assert outbox.status()["counts"]["cancelled"] == 1
+    assert transport.sent == [ ]
+
+
+def test_failed_reminder_retried_after_backoff(outboxes, transport, clock):
+    outbox = outboxes()
+    book()
+    transport.failure = 1.0
+    assert outbox.dispatch() == 0
+    transport.failure = 0.0
+    clock.advance(pytock_outbox.BACKOFF / 2 - datetime.timedelta(seconds=1))
+    assert outbox.dispatch() == 0                           # backoff is at least half the delay
+    clock.advance(pytock_outbox.BACKOFF / 2 + datetime.timedelta(seconds=1))
+    assert outbox.dispatch() == 1
+    assert outbox.status()["counts"] == {"pending": 0, "sent": 1, "cancelled": 0, "failed": 0}
+
+
+def test_reminder_fails_after_max_attempts(outboxes, transport, clock):
+    outbox = outboxes()
+    book()
+    transport.failure = 1.0
+    for attempt in range(pytock_outbox.MAX_ATTEMPTS):
+        outbox.dispatch()
+        clock.advance(pytock_outbox.MAX_BACKOFF)
+    status = outbox.status()
+    assert status["counts"]["failed"] == 1
+    assert status["reminders"][0]["attempts"] == pytock_outbox.MAX_ATTEMPTS
+
+
+def test_restart_does_not_send_again(outboxes, transport):
+    outboxes().dispatch()
+    book()
+    first = outboxes()
+    assert first.dispatch() == 1
+    first.close()
+    second = outboxes()
+    assert second.dispatch() == 0
+    assert second.status()["counts"]["sent"] == 1
+    assert len(transport.sent) == 1
+
+
+def test_restart_sends_pending_reminder(outboxes, transport, clock):
+    book()
+    transport.failure = 1.0
+    first = outboxes()
+    first.dispatch()
+    first.close()
+    transport.failure = 0.0
+    second = outboxes()
+    clock.advance(pytock_outbox.BACKOFF)
+    assert second.dispatch() == 1
+
+
+def test_restart_cancels_reminders_without_booking(outboxes, transport):
+    book(start=datetime.time(18, 0))
+    first = outboxes()
+    first.dispatch()
+    first.close()
+    pytock_data.reset()                                     # the bookings went with the process
+    second = outboxes()
+    second.dispatch()
+    assert second.status()["counts"] == {"pending": 0, "sent": 0, "cancelled": 1, "failed": 0}
+
+
+def test_recurring_occurrences_reminded(outboxes, transport):
+    outbox = outboxes()
+    restaurant.Bookings().addRule(restaurant.RecurringRule("Table 3", "Bob", "555", datetime.time(13, 0),
+                                                           datetime.time(1, 0)))
+    assert outbox.dispatch() == 1
+    assert transport.sent[0][0].endswith(":2026-10-19")      # weekly, so today's only
@@ -0,0 +1,88 @@
+#
+# test_profile.py
+#
+# Profiling: only the admin password unlocks the switch that profiles every
+# session, and profiles are named by the pytock clock.
+#
+
+import os
+import threading
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import pytock_clock
+import pytock_profile
+import pytock_workers
+
+PAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "page4_metrics.py")
+
+
+@pytest.fixture
+def password(monkeypatch):
+    monkeypatch.setattr(pytock_profile, "ADMIN_PASSWORD", "s3cret")
+    return "s3cret"
+
+
+@pytest.fixture(autouse=True)
+def switch():
+    yield
+    pytock_profile.switch(False)
+
+
+def test_no_admins_without_password():
+    assert not pytock_profile.admin("")
+    assert not pytock_profile.admin("anything")
+
+
+def test_admin_password_checked(password):
+    assert pytock_profile.admin(password)
+    assert not pytock_profile.admin("wrong")
+    assert not pytock_profile.admin("")
+
+
+def test_switch_hidden_until_admin(password):
+    page = AppTest.from_file(PAGE).run()
+    assert not page.exception
+    assert len(page.toggle) == 0
+    page.text_input(key="admin_password").input("wrong").run()
+    assert len(page.toggle) == 0 and page.error
+    page.text_input(key="admin_password").input(password).run()
+    assert len(page.toggle) == 1
+    page.toggle[0].set_value(True).run()
+    assert pytock_profile.switched()
+
+
+def test_switch_hidden_without_password():
+    page = AppTest.from_file(PAGE).run()
+    assert not page.exception
+    assert len(page.toggle) == 0 and len(page.text_input) == 0
+
+
+def test_cancel_job_needs_admin(password):
+    release = threading.Event()
+    workers = pytock_workers.start(threads=1)
+    try:
+        workers.submit("busy", release.wait)
+        waiting = workers.submit("waiting", sum, [])
+        page = AppTest.from_file(PAGE).run()
+        assert not page.exception
+        assert not [button for button in page.button if button.label == "Cancel job"]
+        page.text_input(key="admin_password").input(password).run()
+        cancel = [button for button in page.button if button.label == "Cancel job"]
+        assert len(cancel) == 1
+        cancel[0].click().run()
+        assert waiting.state == "cancelled"
+    finally:
+        release.set()
+        pytock_workers.shutdown()
+
+
+def test_profile_named_by_clock(tmp_path):
+    pytock_profile.run(lambda: sum(range(100)), "Metrics", True, str(tmp_path))
+    pytock_profile.run(lambda: sum(range(100)), "Metrics", True, str(tmp_path))
+    names = pytock_profile.profiles(str(tmp_path))
+    stamp = pytock_clock.now().strftime("%Y%m%d-%H%M%S")
+    assert len(names) == 2 and all(os.path.basename(name).startswith(stamp) for name in names)
+    with open(f"{names[0]}.txt", encoding="utf-8") as file:
+        assert pytock_clock.now().strftime("%Y-%m-%d %H:%M:%S") in file.readline()
@@ -0,0 +1,90 @@
+#
+# test_recurring.py
+#
+# Recurring rules: occurrences generated for the dates asked, skipped dates,
+# refusing a rule that starts in the past, and expiring occurrences by moving
+# the rule on to its next date.
+#
+
+import datetime
+
+import pytest
+
+import exceptions
+import pytock_clock
+import restaurant
+
+MONDAY = datetime.date(2026, 10, 19)
+WEEK = datetime.timedelta(weeks=1)
+
+
+def rule(start: datetime.time = datetime.time(19), **options) -> restaurant.RecurringRule:
+    return restaurant.RecurringRule("Table 1", "Ann Lee", "+7 999 123 45 67", start, datetime.time(1, 0),
+                                    **options)
+
+
+def days(occurrences) -> list:
+    return [occurrence.start.date() for occurrence in occurrences]
+
+
+def test_occurrences_every_interval_until():
+    every = rule(first=MONDAY, until=MONDAY + 4 * WEEK, interval=2)
+    assert days(every.occurrences(MONDAY - WEEK, MONDAY + 10 * WEEK)) == [MONDAY, MONDAY + 2 * WEEK, MONDAY + 4 * WEEK]
+    assert days(every.occurrences(MONDAY + datetime.timedelta(days=1), MONDAY + 3 * WEEK)) == [MONDAY + 2 * WEEK]
+    assert every.occursOn(MONDAY + 2 * WEEK) and not every.occursOn(MONDAY + WEEK)
+
+
+def test_skipped_date_left_out():
+    skipping = rule(first=MONDAY).skip(MONDAY + WEEK)
+    assert days(skipping.occurrences(MONDAY, MONDAY + 2 * WEEK)) == [MONDAY, MONDAY + 2 * WEEK]
+    assert len(list(skipping.occurrences(MONDAY, MONDAY + 2 * WEEK, withSkipped=True))) == 3
+
+
+def test_after_moves_to_next_date():
+    later = rule(first=MONDAY, until=MONDAY + WEEK).skip(MONDAY).after(MONDAY)
+    assert later.first == MONDAY + WEEK and later.skipped == frozenset()
+    assert later.after(MONDAY + WEEK) is None
+
+
+def test_occurrence_shown_today():
+    restaurant.Bookings().addRule(rule())
+    status = restaurant.Bookings().tableStatus()
+    assert [type(bk) for bk in status["Table 1"]] == [restaurant.RecurringBooking]
+
+
+def test_rule_starting_in_past_refused():
+    with pytest.raises(exceptions.InvalidInputError):
+        restaurant.Bookings().addRule(rule(datetime.time(9)))
+    restaurant.Bookings().addRule(rule(datetime.time(9), first=MONDAY + WEEK))
+    assert len(restaurant.Bookings().recurring) == 1
+
+
+def test_expired_occurrence_moves_rule_on(clock):
+    restaurant.Bookings().addRule(rule(datetime.time(13)))
+    bookings = restaurant.Bookings()
+    due = bookings.nextExpiry()
+    assert due == datetime.datetime.combine(MONDAY, datetime.time(14)) + restaurant.Booking.EXPIRY_GRACE
+    archived = [ ]
+    expired = bookings.sweepExpired(due, archived.extend)
+    assert days(expired) == [MONDAY] and archived == expired
+    assert restaurant.Bookings().recurring[0].first == MONDAY + WEEK
+    assert "Table 1" not in restaurant.Bookings().tableStatus()
+    assert bookings.sweepExpired(due) == []
+
+
+def test_rule_with_no_dates_left_deleted(clock):
+    restaurant.Bookings().addRule(rule(datetime.time(13), until=MONDAY))
+    due = restaurant.Bookings().nextExpiry()
+    assert len(restaurant.Bookings().sweepExpired(due)) == 1
+    assert restaurant.Bookings().recurring == []
+
+
+def test_failed_archive_keeps_occurrence_due(clock):
+    restaurant.Bookings().addRule(rule(datetime.time(13)))
+    due = restaurant.Bookings().nextExpiry()
+    def fail(expired):
+        raise OSError("disk full")
+    with pytest.raises(OSError):
+        restaurant.Bookings().sweepExpired(due, fail)
+    assert restaurant.Bookings().recurring[0].first == pytock_clock.today()
+    assert len(restaurant.Bookings().sweepExpired(due)) == 1
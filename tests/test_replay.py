@@ -0,0 +1,83 @@
+#
+# test_replay.py
+#
+# Trace and replay: a recorded session replayed on a fresh store leaves the
+# same bookings, maps the ids of bookings made by the operations themselves,
+# and counts references it cannot map instead of running them.
+#
+
+import datetime
+import json
+
+import pytest
+
+import pytock_replay
+import pytock_trace
+import restaurant
+
+EVENING, HOUR = datetime.time(19), datetime.time(1)
+
+
+@pytest.fixture
+def trace(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    pytock_trace.start(path)
+    yield path
+    pytock_trace.stop()
+
+
+def replay(path: str) -> pytock_replay.Replayer:
+    pytock_trace.stop()
+    replayer = pytock_replay.Replayer()
+    replayer.run(pytock_trace.read(path))
+    return replayer
+
+
+def live() -> list:
+    return sorted((bk.tablename, bk.name) for bk in restaurant.Bookings().bookings)
+
+
+def test_round_trip(trace):
+    restaurant.Tables().createTable("Patio", 2)
+    bookings = restaurant.Bookings()
+    kept = restaurant.Booking("Table 1", "Ann Lee", "111", EVENING, HOUR)
+    gone = restaurant.Booking("Table 2", "Bob Ray", "222", EVENING, HOUR)
+    bookings.add(kept)
+    bookings.add(gone)
+    bookings.deleteId(gone.id)
+    with pytest.raises(Exception):
+        bookings.add(restaurant.Booking("Table 1", "Cy Dee", "333", EVENING, HOUR))
+    before = live()
+    replayer = replay(trace)
+    assert replayer.mismatches == 0
+    assert live() == before
+    assert "Patio" in restaurant.Tables().namelist()
+
+
+def test_joined_parts_mapped(trace):
+    restaurant.Tables().setJoinable("Table 1", ["Table 2"])
+    bookings = restaurant.Bookings()
+    restaurant.Booking("", "Spare", "", EVENING, HOUR)         # ids in the replay differ from the recording
+    joined = bookings.addJoined("Big Party", "999", EVENING, HOUR, 8)
+    bookings.walkIn("Table 3")
+    bookings.add(restaurant.Booking("Table 3", "Ann Lee", "111", datetime.time(21), HOUR))
+    bookings.deleteId(joined.parts[1])
+    walkin = next(bk for bk in restaurant.Bookings().bookings if isinstance(bk, restaurant.WalkinBooking))
+    bookings.delete(walkin)
+    before = live()
+    assert before == [("Table 3", "Ann Lee")]
+    replayer = replay(trace)
+    assert replayer.mismatches == 0 and replayer.unmapped == 0
+    assert live() == before
+
+
+def test_unmapped_id_counted_not_run(trace, tmp_path):
+    restaurant.Bookings().add(restaurant.Booking("Table 1", "Ann Lee", "111", EVENING, HOUR))
+    pytock_trace.stop()
+    records = list(pytock_trace.read(trace))
+    records.append(records[-1][:2] + ["Bookings.deleteId", [12345], None, "main"])
+    path = tmp_path / "edited.jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    replayer = replay(str(path))
+    assert replayer.unmapped == 1 and replayer.mismatches == 1
+    assert live() == [("Table 1", "Ann Lee")]
@@ -0,0 +1,69 @@
+#
+# test_search.py
+#
+# Customer search: names with typos and phones in any format, following the
+# change feed, and queries too short to have trigrams.
+#
+
+import datetime
+
+import pytest
+
+import pytock_search
+import restaurant
+
+
+def book(tablename: str, name: str, phone: str, start: datetime.time = datetime.time(19)) -> restaurant.Booking:
+    booking = restaurant.Booking(tablename, name, phone, start, datetime.time(1, 0))
+    restaurant.Bookings().add(booking)
+    return booking
+
+
+def names(query: str) -> list:
+    return [item.name for score, item in pytock_search.index().search(query)]
+
+
+@pytest.fixture
+def guests():
+    return book("Table 1", "John Smith", "+7 (999) 123-45-67"), book("Table 2", "Mary Jones", "8 912 000 11 22")
+
+
+def test_name_with_typo(guests):
+    assert names("jon smth") == ["John Smith"]
+    assert names("MARY") == ["Mary Jones"]
+
+
+def test_phone_in_any_format(guests):
+    assert names("79991234567") == ["John Smith"]
+    assert names("4567") == ["John Smith"]
+    assert names("000-11") == ["Mary Jones"]
+
+
+@pytest.mark.parametrize("query", ["12", "!!", "7 9", " "])
+def test_query_without_trigrams_finds_nothing(guests, query):
+    assert pytock_search.index().search(query) == []
+
+
+def test_follows_added_and_deleted(guests):
+    index = pytock_search.index()
+    late = book("Table 3", "Anna Lee", "+7 999 765 43 21")
+    assert names("anna") == ["Anna Lee"]
+    restaurant.Bookings().deleteId(late.id)
+    assert names("anna") == []
+    assert len(index) == 2
+
+
+def test_rules_found():
+    restaurant.Bookings().addRule(restaurant.RecurringRule("Table 1", "Olga Petrova", "", datetime.time(20),
+                                                           datetime.time(1, 0)))
+    found = pytock_search.index().search("olga")
+    assert [type(item) for score, item in found] == [restaurant.RecurringRule]
+
+
+def test_joined_party_listed_once():
+    restaurant.Tables().setJoinable("Table 1", ["Table 2"])
+    joined = restaurant.Bookings().addJoined("Big Party", "+7 999 555 00 00", datetime.time(19), datetime.time(1), 8)
+    found = pytock_search.index().search("big party")
+    assert [item.id for score, item in found] == [joined.parts[0]]
+    restaurant.Bookings().deleteId(joined.id)
+    assert pytock_search.index().search("big party") == []
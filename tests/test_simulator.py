@@ -0,0 +1,49 @@
+#
+# test_simulator.py
+#
+# The capacity simulator: repeatable with a seed, nobody turned away from a
+# floor with room for everyone, and its input checks.
+#
+
+import datetime
+
+import pytest
+
+import pytock_simulator
+
+
+def test_seed_repeats():
+    first = pytock_simulator.simulate([4, 4, 6], nights=200, seed=7)
+    assert pytock_simulator.simulate([4, 4, 6], nights=200, seed=7) == first
+    assert pytock_simulator.simulate([4, 4, 6], nights=200, seed=8) != first
+
+
+def test_empty_floor_turns_no_one_away():
+    report = pytock_simulator.simulate([8] * 12, nights=300, reservations=0, walkins=2, seed=1)
+    assert report["reservations"]["mean"] == 0 and report["reservations_refused"]["mean"] == 0
+    assert report["walkins"]["mean"] > 0
+    assert report["walkins_turned_away"]["mean"] == 0
+    assert report["walkin_wait_minutes"] == {"mean": 0.0, "p50": 0.0, "p90": 0.0}
+
+
+def test_crowded_floor():
+    report = pytock_simulator.simulate([2], nights=300, reservations=40, walkins=20, seed=1)
+    assert report["tables"] == 1 and report["seats"] == 2
+    assert report["reservations_refused"]["mean"] > 0 and report["walkins_turned_away"]["mean"] > 0
+    assert 0 < report["seat_utilization"]["mean"] <= 1
+
+
+def test_period_on_slot_grid():
+    report = pytock_simulator.simulate([4], nights=10, period=datetime.timedelta(minutes=50), seed=1)
+    assert report["period_minutes"] == 60
+
+
+@pytest.mark.parametrize("seats, period", [
+    ([ ], pytock_simulator.DEFAULT_PERIOD),
+    ([4], datetime.timedelta(0)),
+    ([4], datetime.timedelta(minutes=-15)),
+    ([4], datetime.timedelta(hours=24)),
+])
+def test_bad_input(seats, period):
+    with pytest.raises(ValueError):
+        pytock_simulator.simulate(seats, nights=10, period=period)
@@ -0,0 +1,75 @@
+#
+# test_snapshot.py
+#
+# Stored data is immutable and shared: a script run reads one snapshot of all
+# keys, sees its own changes but not those made elsewhere after it began, and
+# bookings keep the id they were given for lookup and deletion.
+#
+
+import datetime
+import types
+
+import pytest
+
+import pytock_data
+import restaurant
+
+
+def booking(tablename: str = "Table 1", start: datetime.time = datetime.time(19)) -> restaurant.Booking:
+    return restaurant.Booking(tablename, "Ann Lee", "+7 999 123 45 67", start, datetime.time(1, 0))
+
+
+@pytest.fixture
+def run():
+    pytock_data.begin_run()
+    yield
+    pytock_data.end_run()
+
+
+def test_stored_data_is_read_only():
+    restaurant.Bookings().add(booking())
+    stored = pytock_data.latest("restaurant_bookings")
+    assert isinstance(stored, types.MappingProxyType)
+    with pytest.raises(TypeError):
+        stored[0] = None
+    assert isinstance(pytock_data.latest("restaurant_tables"), tuple)
+
+
+def test_set_bumps_version_only_on_change():
+    pytock_data.set("key", [1, 2])
+    assert pytock_data.get("key") == (1, 2)
+    assert pytock_data.version("key") == 1
+    pytock_data.set("key", [1, 2])
+    assert pytock_data.version("key") == 1
+    pytock_data.set("key", [3])
+    assert pytock_data.version("key") == 2
+
+
+def test_readers_share_the_stored_mapping():
+    restaurant.Bookings().add(booking())
+    assert restaurant.Bookings().byId is restaurant.Bookings().byId
+
+
+def test_run_sees_own_changes_not_later_ones(run):
+    bookings = restaurant.Bookings()
+    bookings.add(booking())
+    assert len(restaurant.Bookings().byId) == 1             # our own change
+    state = pytock_data.venue()
+    state.data["restaurant_bookings"] = types.MappingProxyType({ })     # another session's change
+    assert len(restaurant.Bookings().byId) == 1
+    pytock_data.end_run()
+    assert len(restaurant.Bookings().byId) == 0
+
+
+def test_booking_ids_stable():
+    first, second = booking(), booking("Table 2", datetime.time(21))
+    bookings = restaurant.Bookings()
+    bookings.add(first)
+    bookings.add(second)
+    assert first.id != second.id
+    assert bookings.find(first.id) is first
+    bookings.deleteId(first.id)
+    assert bookings.find(first.id) is None
+    assert bookings.find(second.id) is second
+    bookings.deleteId(first.id)                             # already gone
+    assert [bk.id for bk in bookings.bookings] == [second.id]
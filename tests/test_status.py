@@ -0,0 +1,69 @@
+#
+# test_status.py
+#
+# The table status views: a StatusFilter selects tables by name, free/busy
+# state and customer within a time range, and statusPage() pages through the
+# tables it matches.
+#
+
+import datetime
+
+import pytest
+
+import exceptions
+import restaurant
+
+
+@pytest.fixture
+def floor():
+    tables = restaurant.Tables()
+    tables.createTable("Table 4", 2)
+    tables.createTable("Table 5", 2)
+    bookings = restaurant.Bookings()
+    bookings.add(restaurant.Booking("Table 1", "Ann Lee", "555-0101", datetime.time(13), datetime.time(1)))
+    bookings.add(restaurant.Booking("Table 3", "Bob Ray", "555-0202", datetime.time(18), datetime.time(1)))
+    bookings.add(restaurant.Booking("Table 2", "Cat Day", "555-0303", datetime.time(23, 30), datetime.time(1)))
+    return restaurant.Tables(), restaurant.Bookings()
+
+
+def shown(floor, statusFilter: restaurant.StatusFilter, page: int = 0, pageSize: int = 10) -> tuple[list, int]:
+    tables, bookings = floor
+    rows, total = bookings.statusPage(tables, statusFilter, page, pageSize)
+    return [(table.name, [bk.name for bk, markdown in listed]) for table, markdown, listed in rows], total
+
+
+def test_free_and_busy(floor):
+    busy, total = shown(floor, restaurant.StatusFilter(state="Busy"))
+    assert [name for name, listed in busy] == ["Table 1", "Table 2", "Table 3"] and total == 3
+    free, total = shown(floor, restaurant.StatusFilter(state="Free"))
+    assert [name for name, listed in free] == ["Table 4", "Table 5"] and total == 2
+
+
+def test_time_range(floor):
+    evening = restaurant.StatusFilter(start=datetime.time(17), end=datetime.time(20), state="Busy")
+    assert shown(floor, evening) == ([("Table 3", ["Bob Ray"])], 1)
+    late = restaurant.StatusFilter(start=datetime.time(23), end=datetime.time(1))   # wraps past midnight
+    rows, total = shown(floor, late)
+    assert total == 5 and dict(rows) == {"Table 1": [ ], "Table 2": ["Cat Day"], "Table 3": [ ],
+                                          "Table 4": [ ], "Table 5": [ ]}
+
+
+def test_table_and_customer_search(floor):
+    assert shown(floor, restaurant.StatusFilter(tablename=" table 3 ")) == ([("Table 3", ["Bob Ray"])], 1)
+    assert shown(floor, restaurant.StatusFilter(customer="ANN")) == ([("Table 1", ["Ann Lee"])], 1)
+    assert shown(floor, restaurant.StatusFilter(customer="0202")) == ([("Table 3", ["Bob Ray"])], 1)
+    assert shown(floor, restaurant.StatusFilter(customer="nobody")) == ([ ], 0)
+
+
+def test_pages_clamped(floor):
+    names = lambda page: [name for name, listed in shown(floor, restaurant.StatusFilter(), page, 2)[0]]
+    assert names(0) == ["Table 1", "Table 2"]
+    assert names(1) == ["Table 3", "Table 4"]
+    assert names(2) == names(9) == ["Table 5"]
+    assert names(-1) == names(0)
+    assert shown(floor, restaurant.StatusFilter(customer="nobody"), 3, 2) == ([ ], 0)
+
+
+def test_invalid_state():
+    with pytest.raises(exceptions.InvalidInputError):
+        restaurant.StatusFilter(state="Closed")
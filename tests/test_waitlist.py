@@ -0,0 +1,106 @@
+#
+# test_waitlist.py
+#
+# Waitlist seating order: the highest priority first, then the fewest empty
+# seats, then the longest wait, and a freed table taking the best fit.
+#
+
+import datetime
+
+import pytest
+
+import exceptions
+import pytock_clock
+import pytock_data
+import restaurant
+
+
+def party(name: str, size: int, priority: int = 0, minutes: int = 0) -> restaurant.Party:
+    return restaurant.Party(name, size, priority, pytock_clock.now() + datetime.timedelta(minutes=minutes))
+
+
+def test_best_fit_by_priority_seats_and_wait():
+    first, snug = party("First", 2), party("Snug", 4, minutes=5)
+    vip, late = party("Vip", 1, priority=1, minutes=9), party("Late", 4, minutes=7)
+    waitlist = restaurant.Waitlist([first, snug, vip, late])
+    assert waitlist.best(4) is vip
+    assert waitlist.pop(4) is vip
+    assert waitlist.pop(4) is snug                          # no empty seats, before the longer wait
+    assert waitlist.pop(4) is late
+    assert waitlist.pop(4) is first
+    assert waitlist.pop(4) is None
+
+
+def test_party_too_large_for_table_waits():
+    waitlist = restaurant.Waitlist([party("Six", 6)])
+    assert waitlist.best(4) is None
+    assert waitlist.best(6).name == "Six"
+
+
+def test_left_party_not_seated():
+    gone, stays = party("Gone", 2), party("Stays", 2, minutes=1)
+    waitlist = restaurant.Waitlist([gone, stays])
+    waitlist.discard(gone.id)
+    assert waitlist.pop(2) is stays
+    assert len(waitlist) == 0
+
+
+@pytest.fixture
+def full():
+    bookings = restaurant.Bookings()
+    for tablename in ("Table 1", "Table 2", "Table 3"):
+        bookings.walkIn(tablename)
+
+
+def test_join_seats_at_once_when_free():
+    seated = restaurant.Bookings().joinWaitlist(party("Now", 3))
+    assert seated.tablename == "Table 1"                    # smallest table that fits
+    assert restaurant.Bookings().waiting == [ ]
+
+
+def test_freed_table_seats_best_fit(full, clock):
+    parties = [party("Pair", 2), party("Five", 5, minutes=1), party("Four", 4, minutes=2)]
+    for each in parties:
+        assert restaurant.Bookings().joinWaitlist(each) is None
+    assert [each.name for each in restaurant.Bookings().waiting] == ["Pair", "Five", "Four"]
+    clock.advance(datetime.timedelta(minutes=10))
+    restaurant.Bookings().walkOut("Table 3")                # 6 seats: Five fits best
+    restaurant.Bookings().walkOut("Table 1")                # 4 seats: Four fits best
+    seated = {each.name: each.tablename for each in restaurant.Bookings().seatedParties}
+    assert seated == {"Five": "Table 3", "Four": "Table 1"}
+    assert [each.name for each in restaurant.Bookings().waiting] == ["Pair"]
+
+
+def test_priority_seated_first(full):
+    restaurant.Bookings().joinWaitlist(party("Early", 4))
+    restaurant.Bookings().joinWaitlist(party("Vip", 2, priority=1, minutes=5))
+    restaurant.Bookings().walkOut("Table 2")
+    assert restaurant.Bookings().seatedParties[0].name == "Vip"
+
+
+def test_reserved_table_not_given_to_waiting_party(full):
+    restaurant.Bookings().add(restaurant.Booking("Table 2", "Ann", "123", datetime.time(13), datetime.time(1)))
+    restaurant.Bookings().joinWaitlist(party("Pair", 2))
+    restaurant.Bookings().walkOut("Table 2")                # booked within the seating period
+    assert [each.name for each in restaurant.Bookings().waiting] == ["Pair"]
+
+
+def test_party_larger_than_every_table_refused():
+    with pytest.raises(exceptions.InvalidInputError):
+        restaurant.Bookings().joinWaitlist(party("Crowd", 8))
+
+
+def test_parties_seated_together_stored_once():
+    restaurant.Tables().setJoinable("Table 1", ["Table 2"])
+    bookings = restaurant.Bookings()
+    bookings.walkIn("Table 3")
+    joined = bookings.addJoined("Ann", "123", datetime.time(12), datetime.time(1), 8)
+    restaurant.Bookings().joinWaitlist(party("Pair", 2))
+    restaurant.Bookings().joinWaitlist(party("Trio", 3, minutes=1))
+    feed = pytock_data.subscribe({"walk_in"})
+    before = pytock_data.version("restaurant_bookings")
+    restaurant.Bookings().deleteId(joined.id)               # frees both tables at once
+    assert len(restaurant.Bookings().seatedParties) == 2
+    assert pytock_data.version("restaurant_bookings") == before + 2     # the delete, then the seating
+    assert {event.version for event in feed.drain()} == {before + 2}
+    pytock_data.unsubscribe(feed)